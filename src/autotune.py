@@ -0,0 +1,206 @@
+'''
+Startup auto-tuning of the model precision and the CPU plugin configuration.
+
+For every model, each precision variant found next to the given IR (the
+<model>/<precision>/<model>.xml layout of the model downloader) is loaded with
+a set of CPU configurations (streams, threads, thread binding) and timed
+briefly on synthetic input. The fastest precision and configuration are written
+to a JSON profile keyed by CPU model, so later runs on the same machine reuse
+them without measuring again.
+
+Sample usage:
+    tuner = AutoTuner('~/.cache/pointer_controller/tuning.json')
+    tuner.tune(models, num_requests)    # sets model_name and config of each model
+    load_models(models, num_requests, model_cache)
+'''
+import os
+import glob
+import json
+import time
+import platform
+import tempfile
+import itertools
+import logging as log
+
+import numpy as np
+
+# CPU configurations tried for every precision variant
+CPU_STREAMS = ["1", "2", "CPU_THROUGHPUT_AUTO"]
+CPU_BIND_THREAD = ["YES", "NO"]
+
+TUNE_WARMUP = 3
+TUNE_ITERATIONS = 20
+
+
+def cpu_model():
+    '''
+    Return the CPU model name, the profile key of the machine
+    '''
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+
+    return platform.processor() or platform.machine()
+
+
+def precision_variants(model_xml):
+    '''
+    Return {precision: model xml} of every variant of the model that has weights
+    '''
+    model_file = os.path.basename(model_xml)
+    model_dir = os.path.dirname(os.path.dirname(os.path.abspath(model_xml)))
+
+    variants = {}
+    for variant_xml in sorted(glob.glob(os.path.join(model_dir, "*", model_file))):
+        if os.path.exists(os.path.splitext(variant_xml)[0] + ".bin"):
+            variants[os.path.basename(os.path.dirname(variant_xml))] = variant_xml
+
+    if not variants:
+        variants[os.path.basename(os.path.dirname(model_xml))] = model_xml
+
+    return variants
+
+
+def candidate_configs(device):
+    '''
+    Return the plugin configurations to try on the device
+    '''
+    if device != "CPU":
+        return [None]
+
+    cores = os.cpu_count() or 1
+    threads = ["0"]
+    if cores > 2:
+        threads.append(str(cores // 2))
+
+    return [{"CPU_THROUGHPUT_STREAMS": streams, "CPU_THREADS_NUM": thread_count, "CPU_BIND_THREAD": bind}
+            for streams, thread_count, bind in itertools.product(CPU_STREAMS, threads, CPU_BIND_THREAD)]
+
+
+class AutoTuner:
+    '''
+    Picks the fastest precision and plugin configuration per model and keeps
+    the choices in a profile file
+    '''
+
+    def __init__(self, profile_path, iterations=TUNE_ITERATIONS, warmup=TUNE_WARMUP):
+        '''
+        profile_path: str, JSON profile shared by all machines using the file
+        iterations: int, timed inference rounds per candidate
+        warmup: int, untimed inference rounds per candidate
+        '''
+        self.profile_path = os.path.expanduser(profile_path)
+        self.iterations = iterations
+        self.warmup = warmup
+        self.cpu = cpu_model()
+
+        self.profile = {}
+        if os.path.exists(self.profile_path):
+            try:
+                with open(self.profile_path) as profile_file:
+                    self.profile = json.load(profile_file)
+            except (OSError, ValueError):
+                log.warning("[Warning]: Tuning profile is corrupted, tuning again")
+
+    def save_profile(self):
+        profile_dir = os.path.dirname(self.profile_path)
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        # Concurrent runs each write their own temporary file, so the profile
+        # is always replaced by a complete one
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.profile_path) + ".", suffix=".tmp",
+                                         dir=profile_dir or ".")
+        try:
+            with os.fdopen(fd, "w") as profile_file:
+                json.dump(self.profile, profile_file, indent=2)
+            os.replace(temp_path, self.profile_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def profile_key(self, model, num_requests):
+        '''
+        The best settings depend on the model, device, batch size and the
+        number of requests in flight
+        '''
+        model_file = os.path.splitext(os.path.basename(model.model_name))[0]
+        return "{}|{}|batch{}|requests{}".format(model_file, model.device, model.batch_size, num_requests)
+
+    def tune(self, models, num_requests=1):
+        '''
+        Set model_name and config of every model from the profile, measuring
+        the models that are not in it yet
+        '''
+        machine_profile = self.profile.setdefault(self.cpu, {})
+        changed = False
+
+        for model in models:
+            key = self.profile_key(model, num_requests)
+            entry = machine_profile.get(key)
+            if entry is None or not os.path.exists(entry["model_xml"]):
+                log.info("[Info]: Auto-tuning {} ...".format(key))
+                entry = self.measure(model, num_requests)
+                machine_profile[key] = entry
+                changed = True
+
+            model.model_name = entry["model_xml"]
+            model.config = entry["config"]
+            log.info("[Info]: {} uses {} {} ({:.3f} ms per round)".format(model.model_type, entry["precision"],
+                     entry["config"], entry["latency_ms"]))
+
+        if changed:
+            self.save_profile()
+
+    def measure(self, model, num_requests):
+        '''
+        Time every precision and configuration of the model and return the
+        fastest as a profile entry
+        '''
+        best = None
+        for precision, model_xml in precision_variants(model.model_name).items():
+            for config in candidate_configs(model.device):
+                trial = type(model)(model_xml, model.device, model.extensions)
+                trial.batch_size = model.batch_size
+                trial.config = config
+                try:
+                    trial.load_model(num_requests)
+                except RuntimeError as e:
+                    log.info("[Info]: Skipping {} {}: {}".format(precision, config, e))
+                    continue
+
+                latency = self.time_requests(trial)
+                log.debug("{} {} {}: {:.3f} ms".format(model.model_type, precision, config, latency))
+                if best is None or latency < best["latency_ms"]:
+                    best = {"precision": precision, "model_xml": model_xml, "config": config,
+                            "latency_ms": latency, "loading_time_ms": trial.loading_time}
+
+        if best is None:
+            raise RuntimeError("No precision of {} could be loaded on {}".format(model.model_name, model.device))
+
+        return best
+
+    def time_requests(self, model):
+        '''
+        Run all infer requests of a loaded model together on random input and
+        return the median time of a round in ms
+        '''
+        requests = model.net_plugin.requests
+        for buffers in model.input_buffers:
+            for buffer in buffers.values():
+                buffer[...] = np.random.randint(0, 256, size=buffer.shape)
+
+        latencies = []
+        for iteration in range(self.warmup + self.iterations):
+            start_time = time.perf_counter()
+            for request in requests:
+                request.async_infer()
+            for request in requests:
+                request.wait(-1)
+            if iteration >= self.warmup:
+                latencies.append((time.perf_counter() - start_time) * 1000)
+
+        return float(np.median(latencies))
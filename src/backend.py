@@ -0,0 +1,109 @@
+'''
+Inference backends used by the model classes.
+
+A backend provides the part of the OpenVINO IECore API the models use:
+read_network(), query_network(), load_network(), import_network() and
+set_config(). The networks, executable networks and infer requests it returns
+follow the OpenVINO API as well (input_info, outputs, requests, async_infer(),
+wait(), infer(), input_blobs).
+
+    OpenVINOBackend  the OpenVINO inference engine
+    MockBackend      correctly shaped synthetic outputs with configurable
+                     latency distributions, without IR files or OpenVINO
+                     (see mock_backend.py)
+
+One backend is shared by all the models of the process:
+    set_backend(create_backend('mock', latency='FACE=normal:13,1.3'))
+    model.load_model()      # uses get_backend()
+'''
+import threading
+
+BACKENDS = ["openvino", "mock"]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class InferenceBackend:
+    '''
+    Interface of an inference backend
+    '''
+
+    def read_network(self, model, weights):
+        raise NotImplementedError
+
+    def query_network(self, network, device_name):
+        '''
+        Return {layer name: device} of the layers the device supports
+        '''
+        raise NotImplementedError
+
+    def load_network(self, network, device_name, config=None, num_requests=1):
+        raise NotImplementedError
+
+    def import_network(self, model_file, device_name, config=None, num_requests=1):
+        raise NotImplementedError
+
+    def set_config(self, config, device_name):
+        raise NotImplementedError
+
+
+class OpenVINOBackend(InferenceBackend):
+    '''
+    Backend running the networks on the OpenVINO inference engine
+    '''
+
+    def __init__(self):
+        from openvino.inference_engine import IECore
+
+        self.core = IECore()
+
+    def read_network(self, model, weights):
+        return self.core.read_network(model=model, weights=weights)
+
+    def query_network(self, network, device_name):
+        return self.core.query_network(network=network, device_name=device_name)
+
+    def load_network(self, network, device_name, config=None, num_requests=1):
+        return self.core.load_network(network, device_name, config=config, num_requests=num_requests)
+
+    def import_network(self, model_file, device_name, config=None, num_requests=1):
+        return self.core.import_network(model_file=model_file, device_name=device_name, config=config,
+                                        num_requests=num_requests)
+
+    def set_config(self, config, device_name):
+        self.core.set_config(config, device_name)
+
+
+def create_backend(name, **options):
+    '''
+    Create a backend by name, options are passed to the mock backend
+    '''
+    if name == "openvino":
+        return OpenVINOBackend()
+    if name == "mock":
+        from mock_backend import MockBackend
+
+        return MockBackend(**options)
+
+    raise ValueError("Unknown inference backend: {}".format(name))
+
+
+def set_backend(backend):
+    '''
+    Use backend for all models loaded from now on
+    '''
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def get_backend():
+    '''
+    Return the process wide backend, creating the OpenVINO one on first use
+    '''
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = OpenVINOBackend()
+    return _backend
@@ -0,0 +1,117 @@
+"""Preprocessing microbenchmark
+
+Compares the original per-frame preprocessing (resize, transpose, reshape and a
+new input dict on every call) with the preallocated ImageInput path, and the eye
+crop and resize with the affine eye warp of eye_roi.py. It reports
+the time and the number of bytes allocated per call for each input size used by
+the four models. Runs without the inference engine.
+
+> python3 bench_preprocess.py -i ../bin/demo.mp4 -n 1000
+"""
+
+import time
+import tracemalloc
+import logging as log
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from preprocessing import ImageInput
+from eye_roi import eye_rois
+
+# (name, input width, input height, crop of the source frame or None for the full frame)
+CASES = [("face detection", 672, 384, None),
+         ("head pose", 60, 60, (200, 100, 420, 360)),
+         ("landmarks", 48, 48, (200, 100, 420, 360)),
+         ("gaze eye", 60, 60, (250, 180, 290, 220))]
+
+
+def build_argparser():
+    parser = ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, default=None,
+                        help="Video file to take a frame from. A random frame is used by default")
+    parser.add_argument("-n", "--iterations", type=int, default=1000,
+                        help="Number of calls measured per case (1000 by default)")
+    return parser
+
+
+def legacy_preprocess(frame, width, height, input_blob):
+    '''
+    Preprocessing as done before the preallocated buffers
+    '''
+    preprossed_frame = cv2.resize(frame, (width, height))
+    preprossed_frame = preprossed_frame.transpose((2,0,1))
+    preprossed_frame = preprossed_frame.reshape(1, 3, height, width)
+
+    return {input_blob: preprossed_frame}
+
+
+def measure(function, iterations):
+    '''
+    Return (average time in us, bytes allocated per call) of function()
+    '''
+    # Warm up outside of the measurement
+    for _ in range(10):
+        function()
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start_time
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    allocated = 0
+    for _ in range(iterations):
+        function()
+        current, peak = tracemalloc.get_traced_memory()
+        allocated = allocated + max(0, peak - before)
+        tracemalloc.reset_peak()
+    tracemalloc.stop()
+
+    return elapsed / iterations * 1e6, allocated / float(iterations)
+
+
+def main():
+    args = build_argparser().parse_args()
+    log.basicConfig(level=log.INFO, format="%(message)s")
+
+    frame = None
+    if args.input is not None:
+        cap = cv2.VideoCapture(args.input)
+        _, frame = cap.read()
+        cap.release()
+    if frame is None:
+        frame = np.random.randint(0, 256, (1080, 1920, 3), dtype=np.uint8)
+
+    for name, width, height, crop in CASES:
+        source = frame
+        if crop is not None:
+            source = frame[crop[1]:crop[3], crop[0]:crop[2]]
+
+        blob = np.zeros((1, 3, height, width), dtype=np.uint8)
+        image_input = ImageInput(blob)
+
+        legacy_time, legacy_bytes = measure(lambda: legacy_preprocess(source, width, height, "data"), args.iterations)
+        new_time, new_bytes = measure(lambda: image_input.fill(source), args.iterations)
+
+        log.info("[Info]: {:15s} {}x{}: legacy {:8.2f} us {:10.0f} B/call, preallocated {:8.2f} us {:10.0f} B/call".format(
+                 name, width, height, legacy_time, legacy_bytes, new_time, new_bytes))
+
+    # Eye crop and resize against one warp from the face image, eyes at the same place as the gaze eye case
+    face = frame[100:360, 200:420]
+    left_eye, _ = eye_rois(face, [70, 100, 140, 100])
+    blob = np.zeros((1, 3, 60, 60), dtype=np.uint8)
+    image_input = ImageInput(blob)
+
+    crop_time, crop_bytes = measure(lambda: image_input.fill(face[80:120, 50:90]), args.iterations)
+    warp_time, warp_bytes = measure(lambda: image_input.fill_affine(face, left_eye.matrix), args.iterations)
+
+    log.info("[Info]: {:15s} 60x60: crop    {:8.2f} us {:10.0f} B/call, warp         {:8.2f} us {:10.0f} B/call".format(
+             "gaze eye roi", crop_time, crop_bytes, warp_time, warp_bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Video reader benchmark
+
+Compares the frame ingest paths feeding face detection, without the inference
+engine:
+
+    opencv         cv2.VideoCapture full resolution decode, then the resize to
+                   the detector input that preprocessing does
+    ffmpeg         ffmpeg pipe with frame selection and scaling at decode time
+    ffmpeg-fullres ffmpeg pipe delivering the full resolution frames, scaled to
+                   the detector input in this process
+
+For each path it reports frames per second and the CPU time spent per frame by
+this process and by the ffmpeg subprocess.
+
+> python3 bench_reader.py -i ../bin/demo.mp4 -fs 10
+"""
+
+import time
+import resource
+import logging as log
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from input_feeder import InputFeeder
+
+
+def build_argparser():
+    parser = ArgumentParser()
+    parser.add_argument("-i", "--input", required=True, type=str,
+                        help="Video file to read")
+    parser.add_argument("-fs", "--frame_stride", type=int, default=10,
+                        help="Read every n-th frame (10 by default)")
+    parser.add_argument("-W", "--width", type=int, default=672,
+                        help="Detector input width (672 by default)")
+    parser.add_argument("-H", "--height", type=int, default=384,
+                        help="Detector input height (384 by default)")
+    parser.add_argument("-n", "--max_frames", type=int, default=0,
+                        help="Stop after n frames (0 reads the whole video)")
+    return parser
+
+
+def cpu_time():
+    '''
+    Return the CPU seconds used by this process and by its finished children
+    '''
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def measure(feeder, size, max_frames):
+    '''
+    Read the feeder to the end, resizing frames that are not at the detector size
+    '''
+    detector_input = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    own_start, children_start = cpu_time()
+    start_time = time.perf_counter()
+
+    feeder.load_data()
+    frames = 0
+    for frame in feeder.next_batch():
+        if frame.shape[:2] != detector_input.shape[:2]:
+            cv2.resize(frame, size, dst=detector_input)
+        frames = frames + 1
+        if max_frames and frames >= max_frames:
+            break
+    feeder.close()
+
+    elapsed = time.perf_counter() - start_time
+    own_end, children_end = cpu_time()
+
+    return {"frames": frames,
+            "fps": frames / elapsed if elapsed > 0 else 0.0,
+            "cpu_ms_per_frame": (own_end - own_start) * 1000 / max(1, frames),
+            "decoder_cpu_ms_per_frame": (children_end - children_start) * 1000 / max(1, frames)}
+
+
+def main():
+    args = build_argparser().parse_args()
+    log.basicConfig(level=log.INFO, format="%(message)s")
+    size = (args.width, args.height)
+
+    readers = [("opencv", lambda: InputFeeder('video', args.input, stride=args.frame_stride)),
+               ("ffmpeg", lambda: InputFeeder('ffmpeg', args.input, stride=args.frame_stride, decode_size=size)),
+               ("ffmpeg-fullres", lambda: InputFeeder('ffmpeg', args.input, stride=args.frame_stride,
+                                                      decode_size=size, keep_full_res=True))]
+
+    log.info("{:16} {:>8} {:>10} {:>14} {:>14}".format("reader", "frames", "fps", "cpu ms/frame", "ffmpeg ms/frame"))
+    for name, create_feeder in readers:
+        try:
+            stats = measure(create_feeder(), size, args.max_frames)
+        except (RuntimeError, OSError) as e:
+            log.info("{:16} skipped: {}".format(name, e))
+            continue
+        log.info("{:16} {:8d} {:10.1f} {:14.3f} {:14.3f}".format(name, stats["frames"], stats["fps"],
+                 stats["cpu_ms_per_frame"], stats["decoder_cpu_ms_per_frame"]))
+
+
+if __name__ == '__main__':
+    main()
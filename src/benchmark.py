@@ -0,0 +1,292 @@
+"""Benchmark suite
+
+Finds every precision variant (FP32, FP16, FP16-INT8, ...) of the four models
+under the models directory and measures, each in a fresh worker process:
+
+    - every stage in isolation: preprocessing + inference on a fixed input,
+    - the whole pipeline end to end on frames of a video, once per precision.
+
+Every run does warm-up iterations first, then a fixed number of timed iterations
+with time.perf_counter(). Latency percentiles (p50/p95/p99), throughput, model
+loading time and peak RSS of the worker are written as JSON so that runs can be
+diffed against each other.
+
+With the mock backend (-be mock) the same runs time the orchestration alone:
+preprocessing, scheduling and postprocessing around synthetic inferences.
+
+> python3 benchmark.py -m ../models/intel -i ../bin/demo.mp4 -n 200 -o bench.json
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import resource
+import multiprocessing
+import logging as log
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backend import BACKENDS, create_backend, set_backend
+
+# Model directory name prefix -> stage
+STAGES = {"face-detection": "FACE",
+          "head-pose-estimation": "HEAD",
+          "landmarks-regression": "LANDMARKS",
+          "gaze-estimation": "GAZE"}
+
+PERCENTILES = [50, 95, 99]
+
+# Video frames kept in memory for the end to end runs, they are cycled through
+MAX_E2E_FRAMES = 50
+
+
+def build_argparser():
+    parser = ArgumentParser()
+    parser.add_argument("-m", "--models_dir", type=str, default="../models/intel",
+                        help="Directory containing the <model>/<precision>/<model>.xml files")
+    parser.add_argument("-i", "--input", type=str, default="../bin/demo.mp4",
+                        help="Video used for the end to end runs and the stage inputs")
+    parser.add_argument("-d", "--device", type=str, default="CPU",
+                        help="Target device (CPU by default)")
+    parser.add_argument("-n", "--iterations", type=int, default=200,
+                        help="Timed iterations per run (200 by default)")
+    parser.add_argument("-w", "--warmup", type=int, default=20,
+                        help="Warm-up iterations per run (20 by default)")
+    parser.add_argument("-fs", "--frame_stride", type=int, default=10,
+                        help="Frame stride of the end to end runs (10 by default)")
+    parser.add_argument("-pt", "--prob_threshold", type=float, default=0.5,
+                        help="Face detection threshold of the end to end runs")
+    parser.add_argument("-s", "--skip", type=str, default="",
+                        help="Comma separated parts to skip: stages, e2e")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="JSON report file, printed to stdout by default")
+    parser.add_argument("-be", "--backend", type=str, default="openvino", choices=BACKENDS,
+                        help="Inference backend. 'mock' returns synthetic outputs "
+                             "after sampled latencies, without OpenVINO or IR weights "
+                             "(openvino by default)")
+    parser.add_argument("-ml", "--mock_latency", type=str, default=None,
+                        help="Latency distributions of the mock backend in ms, e.g. "
+                             "'FACE=normal:13,1.3;HEAD=const:1.6;GAZE=lognormal:1.7,0.2'")
+    parser.add_argument("-ms", "--mock_seed", type=int, default=0,
+                        help="Random seed of the mock backend (0 by default)")
+    parser.add_argument("-mt", "--mock_streams", type=int, default=1,
+                        help="Inferences the mock device runs at the same time, "
+                             "further requests queue behind them (1 by default)")
+    return parser
+
+
+def discover_models(models_dir, require_weights=True):
+    '''
+    Return {stage: {precision: model xml}} for every model found, only those
+    with their weights when require_weights
+    '''
+    variants = {}
+    for model_xml in sorted(glob.glob(os.path.join(models_dir, "*", "*", "*.xml"))):
+        model_name = os.path.basename(os.path.dirname(os.path.dirname(model_xml)))
+        precision = os.path.basename(os.path.dirname(model_xml))
+        for prefix, stage in STAGES.items():
+            if model_name.startswith(prefix):
+                # Skip variants whose weights are missing
+                if not require_weights or os.path.exists(os.path.splitext(model_xml)[0] + ".bin"):
+                    variants.setdefault(stage, {})[precision] = model_xml
+    return variants
+
+
+def latency_stats(latencies):
+    '''
+    Summarize latencies given in seconds
+    '''
+    latencies_ms = np.array(latencies) * 1000
+    stats = {"p{}_ms".format(p): float(np.percentile(latencies_ms, p)) for p in PERCENTILES}
+    stats["mean_ms"] = float(np.mean(latencies_ms))
+    stats["min_ms"] = float(np.min(latencies_ms))
+    stats["max_ms"] = float(np.max(latencies_ms))
+    stats["throughput_fps"] = float(len(latencies) / np.sum(latencies))
+    return stats
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
+
+
+def read_frames(input_file, count, stride):
+    '''
+    Read up to count frames of the video, every stride-th frame
+    '''
+    from input_feeder import InputFeeder
+
+    feeder = InputFeeder(input_type='video', input_file=input_file, stride=stride)
+    feeder.load_data()
+    frames = []
+    for frame in feeder.next_batch():
+        frames.append(frame.copy())
+        if len(frames) >= count:
+            break
+    feeder.close()
+    return frames
+
+
+def create_model(stage, model_xml, device):
+    from face_detection import FaceDetectionModel
+    from head_pose import HeadPoseModel
+    from landmarks import LandmarksModel
+    from gaze_estimation import GazeEstimationModel
+
+    model_classes = {"FACE": FaceDetectionModel, "HEAD": HeadPoseModel,
+                     "LANDMARKS": LandmarksModel, "GAZE": GazeEstimationModel}
+    return model_classes[stage](model_xml, device)
+
+
+def run_stage(stage, model_xml, device, frame, iterations, warmup):
+    '''
+    Worker: time preprocessing + inference of one model variant
+    '''
+    model = create_model(stage, model_xml, device)
+    model.load_model()
+
+    request = model.net_plugin.requests[0]
+    if stage == "FACE":
+        image = frame
+    else:
+        # A face sized crop from the middle of the frame
+        height, width = frame.shape[:2]
+        image = frame[height // 4:height * 3 // 4, width // 3:width * 2 // 3]
+    eye = image[:image.shape[0] // 4, :image.shape[1] // 4]
+
+    def run_once():
+        if stage == "GAZE":
+            model.preprocess_network_input(eye, eye, [0.0, 0.0, 0.0])
+        else:
+            model.preprocess_input(image)
+        request.infer()
+
+    for _ in range(warmup):
+        run_once()
+
+    latencies = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        run_once()
+        latencies.append(time.perf_counter() - start_time)
+
+    result = latency_stats(latencies)
+    result["load_time_ms"] = model.loading_time
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_end_to_end(model_xmls, device, input_file, stride, threshold, iterations, warmup):
+    '''
+    Worker: time the whole synchronous pipeline on video frames
+    '''
+    from pipeline import Pipeline
+
+    models = [create_model(stage, model_xmls[stage], device) for stage in ["FACE", "HEAD", "LANDMARKS", "GAZE"]]
+    start_time = time.perf_counter()
+    for model in models:
+        model.load_model()
+    load_time = (time.perf_counter() - start_time) * 1000
+
+    frames = read_frames(input_file, min(iterations + warmup, MAX_E2E_FRAMES), stride)
+    # Face detection runs on every frame, also without a face, so that the end
+    # to end latency adds up from the per stage numbers
+    pipeline = Pipeline(*models, threshold=threshold, absence_interval=1)
+
+    stage_times = {}
+    latencies = []
+    for index in range(iterations + warmup):
+        frame = frames[index % len(frames)]
+        start_time = time.perf_counter()
+        result = pipeline.process(frame)
+        latency = time.perf_counter() - start_time
+        if index >= warmup:
+            latencies.append(latency)
+            for stage, inference_time in result.inference_times.items():
+                stage_times.setdefault(stage, []).append(inference_time / 1000.0)
+
+    result = latency_stats(latencies)
+    result["stage_infer_p50_ms"] = {stage: float(np.percentile(times, 50) * 1000) for stage, times in stage_times.items()}
+    result["load_time_ms"] = load_time
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def init_backend(name, mock_latency, mock_seed, mock_streams):
+    '''
+    Worker initializer: load the models of the worker on the named backend
+    '''
+    if name != "openvino":
+        set_backend(create_backend(name, latency=mock_latency, seed=mock_seed, streams=mock_streams))
+
+
+def in_worker(args, function, *function_args):
+    '''
+    Run function in a fresh process so that load time and peak RSS are not
+    influenced by earlier runs
+    '''
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=init_backend,
+                             initargs=(args.backend, args.mock_latency, args.mock_seed, args.mock_streams)) as executor:
+        return executor.submit(function, *function_args).result()
+
+
+def main():
+    args = build_argparser().parse_args()
+    log.basicConfig(level=log.INFO, format="%(message)s")
+    skip = args.skip.split(",")
+
+    # Mock networks are recognized by their IR file name, they have no weights
+    variants = discover_models(args.models_dir, require_weights=args.backend == "openvino")
+    frame = read_frames(args.input, 1, 1)[0]
+
+    report = {"host": {"platform": platform.platform(), "processor": platform.processor(),
+                       "cpu_count": os.cpu_count(), "python": platform.python_version()},
+              "config": {"device": args.device, "backend": args.backend, "iterations": args.iterations,
+                         "warmup": args.warmup, "input": args.input, "frame_stride": args.frame_stride},
+              "stages": [],
+              "end_to_end": []}
+
+    if "stages" not in skip:
+        for stage, precisions in variants.items():
+            for precision, model_xml in precisions.items():
+                log.info("[Info]: Benchmarking {} {}".format(stage, precision))
+                result = in_worker(args, run_stage, stage, model_xml, args.device, frame, args.iterations, args.warmup)
+                result.update({"stage": stage, "precision": precision, "model": model_xml})
+                report["stages"].append(result)
+
+    if "e2e" not in skip:
+        # One run per precision shared by several models, the models without
+        # that precision use their first variant
+        all_precisions = [precision for precisions in variants.values() for precision in precisions]
+        shared_precisions = sorted(set(precision for precision in all_precisions if all_precisions.count(precision) > 1))
+        for precision in shared_precisions:
+            model_xmls = {}
+            for stage, precisions in variants.items():
+                model_xmls[stage] = precisions.get(precision, next(iter(precisions.values())))
+            if len(model_xmls) != len(STAGES):
+                continue
+            log.info("[Info]: Benchmarking end to end {}".format(precision))
+            result = in_worker(args, run_end_to_end, model_xmls, args.device, args.input, args.frame_stride,
+                               args.prob_threshold, args.iterations, args.warmup)
+            result.update({"precision": precision, "models": model_xmls})
+            report["end_to_end"].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+        log.info("[Info]: Report written to " + args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+'''
+Change detection gate in front of the inference pipeline.
+
+On a static scene consecutive frames are nearly identical, and running the four
+networks on them only burns CPU. Each frame is downsampled to a small grayscale
+thumbnail and compared with the thumbnail of the last frame that went through
+inference. While the mean absolute difference stays below the threshold, the
+cached face box, head pose, landmarks and gaze are re-emitted instead. The
+comparison can be limited to the last face box, so that movement elsewhere in
+the scene does not trigger inference. Inference is forced at least every
+max_stale frames so slow changes are never missed for long.
+
+Sample usage:
+    detector = ChangeDetector(threshold=3.0, max_stale=30)
+    if detector.changed(frame, face_coords):
+        ... run the pipeline on the frame ...
+    else:
+        ... re-emit the last results ...
+'''
+import cv2
+import numpy as np
+
+# Size of the grayscale thumbnail the frames are compared on
+THUMBNAIL_SIZE = (80, 45)
+
+
+class ChangeDetector:
+    '''
+    Decides whether a frame differs enough from the last processed one
+    '''
+
+    def __init__(self, threshold=3.0, max_stale=30, use_roi=False, size=THUMBNAIL_SIZE):
+        '''
+        threshold: float, mean absolute thumbnail difference (0-255) above which
+                   the frame counts as changed
+        max_stale: int, maximum number of consecutive frames served from the cache
+        use_roi: bool, compare only the region of the last face box
+        size: (width, height) of the comparison thumbnail
+        '''
+        self.threshold = threshold
+        self.max_stale = max_stale
+        self.use_roi = use_roi
+        self.size = size
+
+        # Preallocated thumbnails, nothing is allocated per frame
+        width, height = size
+        self.small = np.empty((height, width, 3), dtype=np.uint8)
+        self.thumbnail = np.empty((height, width), dtype=np.uint8)
+        self.reference = np.empty((height, width), dtype=np.uint8)
+        self.difference = np.empty((height, width), dtype=np.uint8)
+        self.has_reference = False
+
+        self.frames_since_refresh = 0
+        self.last_difference = 0.0
+
+        # Statistics
+        self.checked_frames = 0
+        self.skipped_frames = 0
+        self.changed_frames = 0
+        self.stale_refreshes = 0
+
+    def changed(self, frame, roi=None):
+        '''
+        Return True when the frame has to go through inference. The frame then
+        becomes the new reference.
+
+        frame: BGR frame
+        roi: optional [xmin, ymin, xmax, ymax] in frame coordinates, only used
+             when use_roi is set
+        '''
+        self.checked_frames = self.checked_frames + 1
+
+        cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.thumbnail)
+
+        if not self.has_reference:
+            return self.refresh()
+
+        if self.frames_since_refresh >= self.max_stale:
+            self.stale_refreshes = self.stale_refreshes + 1
+            return self.refresh()
+
+        cv2.absdiff(self.thumbnail, self.reference, dst=self.difference)
+        region = self.difference
+        if self.use_roi and roi is not None:
+            region = self.roi_region(frame, roi)
+        self.last_difference = float(np.mean(region))
+
+        if self.last_difference > self.threshold:
+            self.changed_frames = self.changed_frames + 1
+            return self.refresh()
+
+        self.frames_since_refresh = self.frames_since_refresh + 1
+        self.skipped_frames = self.skipped_frames + 1
+        return False
+
+    def roi_region(self, frame, roi):
+        '''
+        Return the part of the difference thumbnail covering roi, clamped to
+        the thumbnail and at least one pixel large
+        '''
+        width, height = self.size
+        scale_x = width / frame.shape[1]
+        scale_y = height / frame.shape[0]
+
+        xmin = min(max(int(roi[0] * scale_x), 0), width - 1)
+        ymin = min(max(int(roi[1] * scale_y), 0), height - 1)
+        xmax = min(max(int(np.ceil(roi[2] * scale_x)), xmin + 1), width)
+        ymax = min(max(int(np.ceil(roi[3] * scale_y)), ymin + 1), height)
+
+        return self.difference[ymin:ymax, xmin:xmax]
+
+    def refresh(self):
+        np.copyto(self.reference, self.thumbnail)
+        self.has_reference = True
+        self.frames_since_refresh = 0
+        return True
+
+    def stats(self):
+        '''
+        Return the gate statistics
+        '''
+        skip_rate = 0.0
+        if self.checked_frames > 0:
+            skip_rate = self.skipped_frames / self.checked_frames
+
+        return {"frames": self.checked_frames,
+                "skipped_frames": self.skipped_frames,
+                "changed_frames": self.changed_frames,
+                "stale_refreshes": self.stale_refreshes,
+                "skip_rate": skip_rate
+               }
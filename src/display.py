@@ -0,0 +1,123 @@
+'''
+Display worker rendering the inference results on its own thread.
+
+The inference loop copies the latest frame and its results into a single slot
+mailbox and continues immediately. The worker swaps the mailbox frame with its
+own buffer, draws the overlays on it, resizes it and shows it. When the display
+falls behind, frames waiting in the mailbox are replaced by newer ones (dropped).
+
+Sample usage:
+    display = DisplayWorker('FHLG')
+    display.start()
+    display.post(frame, result)
+    if display.exit_requested:
+        ...
+    display.stop()
+'''
+import time
+import threading
+
+import cv2
+import numpy as np
+
+from overlay import draw_results
+from metrics import REGISTRY, STAGE_LATENCY
+
+ESC_KEY = 27
+
+
+class DisplayWorker:
+    '''
+    Shows frames with their result overlays on a separate thread
+    '''
+
+    def __init__(self, visualize_flag=None, window_name='frame', display_size=(640, 360)):
+        '''
+        visualize_flag: str, any of 'F', 'H', 'L', 'G' selecting the overlays to draw
+        window_name: str, name of the display window
+        display_size: (width, height) of the displayed frame
+        '''
+        self.visualize_flag = visualize_flag or ""
+        self.window_name = window_name
+        self.display_size = display_size
+
+        self.lock = threading.Lock()
+        self.new_frame = threading.Event()
+        self.thread = None
+        self.running = False
+
+        # Single slot mailbox and the worker's own frame, swapped on pick up
+        self.mailbox_frame = None
+        self.mailbox_result = None
+        self.mailbox_full = False
+        self.drawing_frame = None
+        self.resized_frame = np.empty((display_size[1], display_size[0], 3), dtype=np.uint8)
+
+        self.exit_requested = False
+
+        # Statistics
+        self.posted_frames = 0
+        self.shown_frames = 0
+        self.dropped_frames = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='display', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.new_frame.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def post(self, frame, result):
+        '''
+        Put the latest frame and its results in the mailbox, replacing a
+        frame the worker has not picked up yet
+        '''
+        with self.lock:
+            if self.mailbox_frame is None or self.mailbox_frame.shape != frame.shape:
+                self.mailbox_frame = np.empty_like(frame)
+            np.copyto(self.mailbox_frame, frame)
+            self.mailbox_result = result
+
+            if self.mailbox_full:
+                self.dropped_frames = self.dropped_frames + 1
+            self.mailbox_full = True
+            self.posted_frames = self.posted_frames + 1
+        self.new_frame.set()
+
+    def run(self):
+        '''
+        Display thread: draw and show the latest posted frame
+        '''
+        while self.running:
+            # Keep the window responsive while waiting for frames
+            if not self.new_frame.wait(0.01):
+                self.check_key(cv2.waitKey(1))
+                continue
+            self.new_frame.clear()
+
+            with self.lock:
+                if not self.mailbox_full:
+                    continue
+                self.mailbox_frame, self.drawing_frame = self.drawing_frame, self.mailbox_frame
+                result = self.mailbox_result
+                self.mailbox_result = None
+                self.mailbox_full = False
+
+            start_time = time.perf_counter()
+            draw_results(self.drawing_frame, result, self.visualize_flag)
+            cv2.resize(self.drawing_frame, self.display_size, dst=self.resized_frame)
+            cv2.imshow(self.window_name, self.resized_frame)
+            self.shown_frames = self.shown_frames + 1
+
+            self.check_key(cv2.waitKey(1))
+            REGISTRY.observe(STAGE_LATENCY, (time.perf_counter() - start_time) * 1000, stage="render")
+
+        cv2.destroyAllWindows()
+
+    def check_key(self, key):
+        if key == ESC_KEY:
+            self.exit_requested = True
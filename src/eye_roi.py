@@ -0,0 +1,85 @@
+'''
+Scale aware eye regions for gaze estimation.
+
+The eye regions are squares centered on the eye landmarks whose side is a
+fixed fraction of the inter-ocular distance, so they cover the same part of the
+face whatever its size in the image. Instead of cropping and resizing, an eye
+is sampled with a single affine warp from the face image into the gaze network
+input size. Parts of the square outside the face image are filled by
+replicating the border pixels, so an eye at the frame edge still gives a full
+image instead of an empty crop.
+
+Sample usage:
+    left_eye, right_eye = eye_rois(face_image, landmarks)
+    left_eye.warp(buffer)               # 60x60x3 preallocated image
+    image_input.fill_affine(left_eye.image, left_eye.matrix)
+'''
+import math
+
+import cv2
+import numpy as np
+
+# Side of the eye square relative to the inter-ocular distance
+EYE_SCALE = 0.6
+
+# Smallest eye square in pixels, for tiny or degenerate landmarks
+MIN_EYE_SIZE = 8
+
+# Input size of the gaze estimation network
+EYE_INPUT_SIZE = 60
+
+
+class EyeRoi:
+    '''
+    Square eye region of an image and the affine transform sampling it
+    '''
+
+    def __init__(self, image, center, side, size=EYE_INPUT_SIZE):
+        '''
+        image: face image the landmarks belong to
+        center: (x, y) of the eye in image pixels
+        side: float, side of the square in image pixels
+        size: int, side of the sampled eye image
+        '''
+        self.image = image
+        self.size = size
+
+        # Square corners, not limited to the image
+        self.xmin = center[0] - side / 2
+        self.ymin = center[1] - side / 2
+        self.xmax = self.xmin + side
+        self.ymax = self.ymin + side
+
+        # Maps the square onto size x size pixels, pixel centers to pixel centers
+        scale = size / side
+        self.matrix = np.array([[scale, 0, scale * (0.5 - self.xmin) - 0.5],
+                                [0, scale, scale * (0.5 - self.ymin) - 0.5]], dtype=np.float32)
+
+    def warp(self, dst=None):
+        '''
+        Sample the eye into dst (size x size x 3), allocated when None
+        '''
+        return cv2.warpAffine(self.image, self.matrix, (self.size, self.size), dst=dst,
+                              flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    def box(self):
+        '''
+        Return the square as [(xmin, ymin), (xmax, ymax)] clamped to the image, for drawing
+        '''
+        height, width = self.image.shape[:2]
+        return [(max(0, int(self.xmin)), max(0, int(self.ymin))),
+                (min(width, int(math.ceil(self.xmax))), min(height, int(math.ceil(self.ymax))))]
+
+
+def eye_rois(image, landmarks, scale=EYE_SCALE, size=EYE_INPUT_SIZE):
+    '''
+    Return the left and right EyeRoi of the face image
+
+    image: face image
+    landmarks: [left x, left y, right x, right y, ...] in image pixels
+    '''
+    left_x, left_y, right_x, right_y = landmarks[:4]
+    distance = math.hypot(right_x - left_x, right_y - left_y)
+    side = max(MIN_EYE_SIZE, scale * distance)
+
+    return EyeRoi(image, (left_x, left_y), side, size), EyeRoi(image, (right_x, right_y), side, size)
@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 from model import Models
 
 
@@ -12,6 +13,9 @@ class FaceDetectionModel(Models):
         Models.__init__(self, model_name, device, extensions)
         self.model_type = "FACE"
 
+        # Highest confidence of the last processed frame, also below the threshold
+        self.best_confidence = 0.0
+
     def preprocess_output(self, frame, output, threshold, inference_time):
         '''
         Create output for face detection
@@ -20,28 +24,25 @@ class FaceDetectionModel(Models):
                output - inference output
                threshold - confidence threshold
 
-        output: cropped image, detected face coordinates
+        output: cropped faces, detected face coordinates, highest confidence first.
+                Both are empty when no face is above the threshold.
         '''
 
-        # Acquire face coordinates
-        face_coords = []
+        # Keep valid detections above the threshold, highest confidence first
         output_boxes = output[self.output_blob][0][0]
-        for box in output_boxes:
-            if box[2] > threshold:
-                xmin = int(box[3] * self.image_width)
-                ymin = int(box[4] * self.image_height)
-                xmax = int(box[5] * self.image_width)
-                ymax = int(box[6] * self.image_height)
-                face_coords.append([xmin, ymin, xmax, ymax])
+        valid = output_boxes[:, 0] >= 0
+        self.best_confidence = float(output_boxes[valid, 2].max()) if valid.any() else 0.0
+        mask = valid & (output_boxes[:, 2] > threshold)
+        detections = output_boxes[mask]
+        detections = detections[np.argsort(-detections[:, 2])]
+
+        # Scale to frame coordinates and clip to the frame
+        scale = np.array([self.image_width, self.image_height, self.image_width, self.image_height])
+        boxes = np.clip(detections[:, 3:7] * scale, 0, scale).astype(np.int32)
+        boxes = boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+        face_coords = boxes.tolist()
 
         # Crop the image based on the detected coordinates
-        if len(face_coords) == 0: 
-            print("{ERROR]: No face detected in frame!")
-            exit()
-
-        cropped_frame = frame[ymin:ymax, xmin:xmax] 
-
-        return cropped_frame, face_coords, inference_time 
+        cropped_faces = [frame[ymin:ymax, xmin:xmax] for xmin, ymin, xmax, ymax in face_coords]
 
- 
-   
+        return cropped_faces, face_coords, inference_time 
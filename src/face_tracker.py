@@ -0,0 +1,181 @@
+'''
+Detect-then-track support for the face detection stage.
+
+Face detection only runs every detection_interval frames. In between, the face
+box is propagated from the facial landmarks of the last processed frame: the
+box keeps its position and size relative to the eye midpoint, scaled by the
+inter-ocular distance. Detection is forced again when
+
+    - the landmarks drift too far inside the tracked crop or the inter-ocular
+      distance changes too much (tracking confidence dropped),
+    - the tracked box leaves the frame,
+    - a scene cut is detected on a small grayscale thumbnail of the frame.
+
+Sample usage:
+    tracker = FaceTracker(detection_interval=10)
+    if tracker.needs_detection(frame):
+        ... run face detection, crop face_coords ...
+        tracker.detected()
+    else:
+        face_coords = tracker.clip(frame)
+    ... run landmarks on the crop ...
+    tracker.update(face_coords, landmarks, detected)
+'''
+import cv2
+import numpy as np
+
+# Size of the grayscale thumbnail compared for scene cuts
+THUMBNAIL_SIZE = (32, 18)
+
+
+class FaceTracker:
+    '''
+    Propagates the face box between face detections
+    '''
+
+    def __init__(self, detection_interval=10, max_drift=0.25, scene_cut_threshold=40):
+        '''
+        detection_interval: int, run face detection at least every n frames
+        max_drift: float, relative change of the eye position inside the crop or of
+                   the inter-ocular distance that forces a new detection
+        scene_cut_threshold: float, mean absolute thumbnail difference (0-255)
+                   that counts as a scene cut
+        '''
+        self.detection_interval = detection_interval
+        self.max_drift = max_drift
+        self.scene_cut_threshold = scene_cut_threshold
+
+        # Box being tracked in frame coordinates [xmin, ymin, xmax, ymax]
+        self.face_coords = None
+
+        # Box relative to the eye midpoint in inter-ocular distances, and the
+        # eye midpoint relative to the crop, both taken from the last detection
+        self.reference_box = None
+        self.reference_eyes = None
+        self.reference_distance = None
+
+        self.last_thumbnail = None
+        self.frames_since_detection = 0
+        self.force_detection = True
+
+        # Statistics
+        self.frame_count = 0
+        self.detection_count = 0
+        self.drift_detections = 0
+        self.scene_cut_detections = 0
+
+    def needs_detection(self, frame):
+        '''
+        Decide whether face detection has to run on this frame
+        '''
+        self.frame_count = self.frame_count + 1
+
+        thumbnail = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_NEAREST)
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY).astype(np.int16)
+        scene_cut = False
+        if self.last_thumbnail is not None:
+            difference = np.mean(np.abs(thumbnail - self.last_thumbnail))
+            scene_cut = difference > self.scene_cut_threshold
+        self.last_thumbnail = thumbnail
+
+        if scene_cut:
+            self.scene_cut_detections = self.scene_cut_detections + 1
+
+        if (self.force_detection or scene_cut or self.reference_box is None
+                or self.frames_since_detection >= self.detection_interval):
+            return True
+
+        self.frames_since_detection = self.frames_since_detection + 1
+        return False
+
+    def detected(self):
+        '''
+        Face detection ran on the current frame
+        '''
+        self.detection_count = self.detection_count + 1
+        self.frames_since_detection = 1
+        self.force_detection = False
+
+    def lost(self):
+        '''
+        Face detection found no face, stop tracking until the next detection
+        '''
+        self.face_coords = None
+        self.reference_box = None
+        self.force_detection = True
+
+    def update(self, face_coords, landmarks, detected):
+        '''
+        Propagate the box with the landmarks found in the crop of face_coords
+
+        input: face_coords - [xmin, ymin, xmax, ymax] of the crop in frame coordinates
+               landmarks - converted landmarks output, pixel coordinates in the crop
+               detected - whether face_coords came from face detection
+        '''
+        crop_width = max(1, face_coords[2] - face_coords[0])
+        crop_height = max(1, face_coords[3] - face_coords[1])
+
+        # Eye midpoint in frame coordinates and inter-ocular distance
+        eyes_x = face_coords[0] + (landmarks[0] + landmarks[2]) / 2.0
+        eyes_y = face_coords[1] + (landmarks[1] + landmarks[3]) / 2.0
+        distance = max(1.0, float(np.hypot(landmarks[2] - landmarks[0], landmarks[3] - landmarks[1])))
+
+        # Eye midpoint relative to the crop
+        relative_eyes = ((eyes_x - face_coords[0]) / crop_width, (eyes_y - face_coords[1]) / crop_height)
+
+        if detected:
+            # Landmarks on a detected box become the reference
+            self.reference_box = [(face_coords[0] - eyes_x) / distance, (face_coords[1] - eyes_y) / distance,
+                                  (face_coords[2] - eyes_x) / distance, (face_coords[3] - eyes_y) / distance]
+            self.reference_eyes = relative_eyes
+            self.reference_distance = distance
+        elif self.reference_box is not None:
+            drift = max(abs(relative_eyes[0] - self.reference_eyes[0]),
+                        abs(relative_eyes[1] - self.reference_eyes[1]),
+                        abs(distance / self.reference_distance - 1.0))
+            if drift > self.max_drift:
+                self.force_detection = True
+                self.drift_detections = self.drift_detections + 1
+
+        if self.reference_box is None:
+            return
+
+        self.face_coords = [int(eyes_x + self.reference_box[0] * distance),
+                            int(eyes_y + self.reference_box[1] * distance),
+                            int(eyes_x + self.reference_box[2] * distance),
+                            int(eyes_y + self.reference_box[3] * distance)]
+
+    def clip(self, frame):
+        '''
+        Clip the tracked box to the frame. Returns None and forces a detection
+        if the box no longer overlaps the frame enough to be useful.
+        '''
+        height, width = frame.shape[:2]
+        xmin = max(0, self.face_coords[0])
+        ymin = max(0, self.face_coords[1])
+        xmax = min(width, self.face_coords[2])
+        ymax = min(height, self.face_coords[3])
+
+        box_area = max(1, (self.face_coords[2] - self.face_coords[0]) * (self.face_coords[3] - self.face_coords[1]))
+        if xmax <= xmin or ymax <= ymin or (xmax - xmin) * (ymax - ymin) < (1.0 - self.max_drift) * box_area:
+            self.force_detection = True
+            self.drift_detections = self.drift_detections + 1
+            return None
+
+        return [xmin, ymin, xmax, ymax]
+
+    def stats(self):
+        '''
+        Return the tracking statistics
+        '''
+        detection_rate = 0.0
+        if self.frame_count > 0:
+            detection_rate = float(self.detection_count) / self.frame_count
+
+        return {"frames": self.frame_count,
+                "detections": self.detection_count,
+                "tracked_frames": self.frame_count - self.detection_count,
+                "detection_rate": detection_rate,
+                "drift_detections": self.drift_detections,
+                "scene_cut_detections": self.scene_cut_detections
+               }
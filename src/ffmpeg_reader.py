@@ -0,0 +1,193 @@
+'''
+Video reader decoding through an ffmpeg subprocess rawvideo pipe.
+
+Frames are selected (every stride-th frame, from a start frame) and scaled to
+the requested size inside ffmpeg, so only the pixels the face detector uses
+cross the pipe. They are read with readinto() straight into preallocated
+buffers. With keep_full_res, ffmpeg writes the full resolution frames instead
+and read() scales them with cv2.resize(); it returns the scaled frame with the
+full resolution one attached as frame.full_frame, for cropping the faces. A
+single pipe cannot stall the way two pipes read one after the other can, when
+ffmpeg blocks on the pipe that is not being read.
+
+The frame selection is part of the ffmpeg command, so the stride is fixed
+while the pipe runs. InputFeeder changes the stride of an ffmpeg input by
+skipping whole selected frames with grab(), i.e. in multiples of the stride
+the pipe was started with.
+
+FFmpegCapture mimics the parts of cv2.VideoCapture used by InputFeeder:
+    cap = FFmpegCapture('video.mp4', size=(672, 384), stride=10)
+    ret, frame = cap.read(image=buffer)
+    cap.release()
+'''
+import json
+import shutil
+import subprocess
+import logging as log
+
+import cv2
+import numpy as np
+
+# Whether the installed ffmpeg has -fps_mode, which replaced -vsync
+_fps_mode = None
+
+
+def passthrough_options():
+    '''
+    Return the options passing every selected frame through unchanged
+    '''
+    global _fps_mode
+    if _fps_mode is None:
+        usage = subprocess.run(["ffmpeg", "-hide_banner", "-h", "full"], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL).stdout
+        _fps_mode = b"-fps_mode" in usage
+    if _fps_mode:
+        return ["-fps_mode", "passthrough"]
+    # Releases before 5.1
+    return ["-vsync", "0"]
+
+
+class DecodedFrame(np.ndarray):
+    '''
+    Scaled frame carrying the full resolution frame it was scaled from
+    '''
+    full_frame = None
+
+
+def probe(path):
+    '''
+    Return (width, height, fps, frame count) of the first video stream
+    '''
+    output = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
+                             "-show_entries", "stream=width,height,avg_frame_rate,nb_frames",
+                             "-of", "json", path], check=True, stdout=subprocess.PIPE).stdout
+    stream = json.loads(output)["streams"][0]
+
+    numerator, _, denominator = stream.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(numerator) / float(denominator) if float(denominator or 0) else 0.0
+    frame_count = int(stream.get("nb_frames", 0) or 0)
+
+    return int(stream["width"]), int(stream["height"]), fps, frame_count
+
+
+class FFmpegCapture:
+    '''
+    cv2.VideoCapture replacement reading scaled frames from ffmpeg
+    '''
+
+    def __init__(self, path, size=None, stride=1, keep_full_res=False):
+        '''
+        path: str, video file or any input ffmpeg can open
+        size: (width, height) of the decoded frames, None keeps the source size
+        stride: int, decode only every stride-th frame
+        keep_full_res: bool, also deliver the full resolution frame
+        '''
+        if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+            raise RuntimeError("ffmpeg and ffprobe are needed for the ffmpeg input")
+
+        self.path = path
+        self.stride = max(1, stride)
+        self.start_frame = 0
+
+        self.full_width, self.full_height, self.fps, self.frame_count = probe(path)
+        self.width, self.height = size if size is not None else (self.full_width, self.full_height)
+        self.keep_full_res = keep_full_res
+
+        self.process = None
+        self.skip_buffer = None
+
+    def command(self):
+        # Frames n = start + stride - 1, start + 2 * stride - 1, ... like the
+        # grab()/read() stride of InputFeeder
+        select = "select='gte(n\\,{0})*not(mod(n+1-{0}\\,{1}))'".format(self.start_frame, self.stride)
+        video_filter = select
+        if not self.keep_full_res:
+            video_filter = select + ",scale={}:{}:flags=area".format(self.width, self.height)
+
+        return (["ffmpeg", "-v", "error", "-nostdin", "-i", self.path, "-an", "-sn"] + passthrough_options() +
+                ["-vf", video_filter, "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"])
+
+    def open(self):
+        self.process = subprocess.Popen(self.command(), stdout=subprocess.PIPE, bufsize=0)
+
+    def read_into(self, pipe, buffer):
+        '''
+        Fill buffer from the pipe, return False at the end of the stream
+        '''
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view):
+            count = pipe.readinto(view[filled:])
+            if not count:
+                return False
+            filled = filled + count
+        return True
+
+    def read(self, image=None, full_image=None):
+        '''
+        Decode the next selected frame into image (allocated when None or of
+        the wrong size) and, with keep_full_res, the full frame into full_image
+        '''
+        if self.process is None:
+            self.open()
+
+        if image is None or image.shape != (self.height, self.width, 3):
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+        if not self.keep_full_res:
+            if not self.read_into(self.process.stdout, image):
+                return False, None
+            return True, image
+
+        if full_image is None or full_image.shape != (self.full_height, self.full_width, 3):
+            full_image = np.empty((self.full_height, self.full_width, 3), dtype=np.uint8)
+        if not self.read_into(self.process.stdout, full_image):
+            return False, None
+        cv2.resize(full_image, (self.width, self.height), dst=image, interpolation=cv2.INTER_AREA)
+
+        frame = image.view(DecodedFrame)
+        frame.full_frame = full_image
+        return True, frame
+
+    def grab(self):
+        '''
+        Skip one selected frame without scaling it
+        '''
+        if self.process is None:
+            self.open()
+
+        shape = (self.full_height, self.full_width, 3) if self.keep_full_res else (self.height, self.width, 3)
+        if self.skip_buffer is None:
+            self.skip_buffer = np.empty(shape, dtype=np.uint8)
+        return self.read_into(self.process.stdout, self.skip_buffer)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        return 0
+
+    def set(self, prop, value):
+        '''
+        Only the start frame can be set, before the first read
+        '''
+        if prop == cv2.CAP_PROP_POS_FRAMES and self.process is None:
+            self.start_frame = int(value)
+            return True
+        return False
+
+    def release(self):
+        if self.process is not None:
+            self.process.stdout.close()
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                log.warning("[Warning]: ffmpeg did not exit, killing it")
+                self.process.kill()
+            self.process = None
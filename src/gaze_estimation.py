@@ -2,6 +2,8 @@ import cv2
 import os
 import time
 from model import Models
+from eye_roi import EyeRoi
+from metrics import REGISTRY, STAGE_LATENCY
 
 
 class GazeEstimationModel(Models):
@@ -14,22 +16,16 @@ class GazeEstimationModel(Models):
         Models.__init__(self, model_name, device, extensions)
         self.model_type = "GAZE"
 
-    def preprocess_input(self, frame):
+    def preprocess_input(self, frame, input_name, request_id=0, index=0):
         '''
-        Preprocess the raw input frame to prepare for inferencing
+        Preprocess an eye into slot index of the preallocated 60x60 input blob of the request.
+        An EyeRoi is warped straight from the face image, an eye image is resized.
         '''
 
-        fixed_width  = 60
-        fixed_height = 60
-        preprossed_frame = cv2.resize(frame, (fixed_width, fixed_height))
-        preprossed_frame = preprossed_frame.transpose((2,0,1))
-        b  = 1
-        c  = preprossed_frame.shape[0]
-        h  = fixed_height 
-        w  = fixed_width 
-        preprossed_frame   = preprossed_frame.reshape(b, c, h, w)
-
-        return preprossed_frame
+        if isinstance(frame, EyeRoi):
+            self.image_inputs[request_id][input_name].fill_affine(frame.image, frame.matrix, index)
+        else:
+            self.image_inputs[request_id][input_name].fill(frame, index)
 
     def preprocess_output(self, output, inference_time):
         '''
@@ -49,25 +45,89 @@ class GazeEstimationModel(Models):
         return [x, y, z], inference_time
 
 
+    def preprocess_network_input(self, left_eye, right_eye, head_pose_angles, request_id=0, index=0):
+        '''
+        Write both eye images and the head pose angles into slot index of the input blobs of the request
+        '''
+
+        self.preprocess_input(left_eye, "left_eye_image", request_id, index)
+        self.preprocess_input(right_eye, "right_eye_image", request_id, index)
+
+        angles = self.input_buffers[request_id]["head_pose_angles"]
+        for angle in range(3):
+            angles[index, angle] = head_pose_angles[angle]
+
+        return self.input_buffers[request_id]
+
     def predict(self, left_eye, right_eye, head_pose_angles):
        '''
        Gaze estimation function
        '''
        
-       left_eye_preprocessed = self.preprocess_input(left_eye)
-       right_eye_preprocessed = self.preprocess_input(right_eye)
+       with REGISTRY.span(STAGE_LATENCY, stage="preprocess", model=self.model_type):
+           self.preprocess_network_input(left_eye, right_eye, head_pose_angles)
+       request = self.net_plugin.requests[0]
+
+       start_time = time.perf_counter()
+
+       request.infer()
+
+       inference_time = (time.perf_counter() - start_time) * 1000
+       REGISTRY.observe(STAGE_LATENCY, inference_time, stage="infer", model=self.model_type)
+
+       with REGISTRY.span(STAGE_LATENCY, stage="postprocess", model=self.model_type):
+           return self.preprocess_output(request.outputs, inference_time)
+
+    def predict_async(self, left_eye, right_eye, head_pose_angles, request_id=0):
+        '''
+        Start an asynchronous gaze estimation.
+        The results are collected with get_async_output() using the same request_id.
+        '''
 
-       input_network = {"left_eye_image":left_eye_preprocessed,
-                        "right_eye_image": right_eye_preprocessed,
-                        "head_pose_angles": head_pose_angles
-                       }
+        self.predict_batch_async([left_eye], [right_eye], [head_pose_angles], request_id)
+
+    def get_async_output(self, request_id=0):
+        '''
+        Wait for an asynchronous gaze estimation and post-process its results
+        '''
+
+        gaze_vectors, inference_time = self.get_batch_output(request_id)
+
+        return gaze_vectors[0], inference_time
+
+    def predict_batch_async(self, left_eyes, right_eyes, head_pose_angles, request_id=0):
+        '''
+        Start one asynchronous gaze estimation on up to batch_size eye pairs.
+        The results are collected with get_batch_output() using the same request_id.
+        '''
+
+        with REGISTRY.span(STAGE_LATENCY, stage="preprocess", model=self.model_type):
+            for index in range(len(left_eyes)):
+                self.preprocess_network_input(left_eyes[index], right_eyes[index], head_pose_angles[index], request_id, index)
+
+        self.pending_requests[request_id] = (len(left_eyes), time.perf_counter())
+        self.net_plugin.requests[request_id].async_infer()
+
+    def get_batch_output(self, request_id=0):
+        '''
+        Wait for an asynchronous gaze estimation started by predict_batch_async()
+
+        output: list of gaze vectors, inference time
+        '''
 
-       start_time = time.time()
+        count, start_time = self.pending_requests.pop(request_id)
 
-       outputs = self.net_plugin.infer(input_network) 
+        request = self.net_plugin.requests[request_id]
+        request.wait(-1)
 
-       inference_time = (time.time() - start_time) * 1000
+        inference_time = (time.perf_counter() - start_time) * 1000
+        REGISTRY.observe(STAGE_LATENCY, inference_time, stage="infer", model=self.model_type)
 
-       return self.preprocess_output(outputs, inference_time) 
+        outputs = request.outputs
+        gaze_vectors = []
+        with REGISTRY.span(STAGE_LATENCY, stage="postprocess", model=self.model_type):
+            for index in range(count):
+                gaze_vector, _ = self.preprocess_output({self.output_blob: outputs[self.output_blob][index:index + 1]}, inference_time)
+                gaze_vectors.append(gaze_vector)
 
- 
+        return gaze_vectors, inference_time
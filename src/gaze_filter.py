@@ -0,0 +1,236 @@
+'''
+Gaze and head pose smoothing with extrapolation to the actuation time.
+
+The raw gaze vectors carry the noise of every frame and reach the pointer one
+pipeline latency after the frame was captured. GazeFilter smooths the gaze
+vector and the head pose angles of the tracked face and estimates their
+velocity, so that the mouse actuator can extrapolate the gaze from the capture
+time of the frame to the moment it moves the pointer. The pointer follows the
+gaze vector, which already includes the head rotation, so only the gaze is
+extrapolated; the smoothed head pose goes to the result sinks and overlays.
+
+
+Two filters are available:
+
+    one_euro  1 Euro filter (Casiez et al., CHI 2012): a low pass filter whose
+              cutoff frequency rises with the speed of the signal, smooth at
+              rest and with little lag on fast movements
+    kalman    constant velocity Kalman filter per component
+
+Head pose angles are in degrees while the gaze vector is normalized, so the
+head pose filter uses the same settings scaled by HEAD_POSE_SCALE.
+
+Sample usage:
+    gaze_filter = GazeFilter('one_euro')
+    face, velocity = gaze_filter.filter_face(result.capture_time, result.faces[0])
+    mouse_actuator.update(face.gaze_vector[0], face.gaze_vector[1], velocity=velocity[:2],
+                          timestamp=result.capture_time)
+'''
+import copy
+import math
+
+import numpy as np
+
+FILTERS = ["none", "one_euro", "kalman"]
+
+# Degrees of head pose roughly corresponding to one unit of the gaze vector
+HEAD_POSE_SCALE = 30.0
+
+
+class OneEuroFilter:
+    '''
+    1 Euro filter of a vector signal
+    '''
+
+    def __init__(self, min_cutoff=1.0, beta=0.5, derivative_cutoff=1.0):
+        '''
+        min_cutoff: float, cutoff frequency in Hz at rest, lower is smoother
+        beta: float, increase of the cutoff with the speed, higher lags less
+        derivative_cutoff: float, cutoff frequency in Hz of the velocity estimate
+        '''
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.velocity = None
+        self.last_time = None
+
+    def alpha(self, cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def update(self, timestamp, value):
+        '''
+        Filter a new sample taken at timestamp (s), return (value, velocity per s)
+        '''
+        value = np.asarray(value, dtype=np.float64)
+        if self.value is None:
+            self.value = value.copy()
+            self.velocity = np.zeros_like(value)
+            self.last_time = timestamp
+            return self.value, self.velocity
+        if timestamp <= self.last_time:
+            return self.value, self.velocity
+
+        dt = timestamp - self.last_time
+        raw_velocity = (value - self.value) / dt
+        self.velocity = self.velocity + self.alpha(self.derivative_cutoff, dt) * (raw_velocity - self.velocity)
+
+        cutoff = self.min_cutoff + self.beta * np.abs(self.velocity)
+        self.value = self.value + self.alpha(cutoff, dt) * (value - self.value)
+        self.last_time = timestamp
+
+        return self.value, self.velocity
+
+
+class KalmanFilter:
+    '''
+    Constant velocity Kalman filter, independent for every component
+    '''
+
+    def __init__(self, process_noise=0.5, measurement_noise=0.003):
+        '''
+        process_noise: float, variance of the acceleration per second
+        measurement_noise: float, variance of a measurement
+        '''
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.velocity = None
+        self.last_time = None
+        # All components share the timing and the noise, so they share the covariance
+        self.covariance = None
+
+    def update(self, timestamp, value):
+        '''
+        Filter a new sample taken at timestamp (s), return (value, velocity per s)
+        '''
+        value = np.asarray(value, dtype=np.float64)
+        if self.value is None:
+            self.value = value.copy()
+            self.velocity = np.zeros_like(value)
+            self.covariance = np.array([[self.measurement_noise, 0.0], [0.0, 1.0]])
+            self.last_time = timestamp
+            return self.value, self.velocity
+
+        # Predict
+        dt = max(0.0, timestamp - self.last_time)
+        transition = np.array([[1.0, dt], [0.0, 1.0]])
+        noise = self.process_noise * np.array([[dt ** 3 / 3, dt ** 2 / 2], [dt ** 2 / 2, dt]])
+        self.value = self.value + self.velocity * dt
+        self.covariance = transition @ self.covariance @ transition.T + noise
+
+        # Correct with the measured position
+        innovation = value - self.value
+        gain = self.covariance[:, 0] / (self.covariance[0, 0] + self.measurement_noise)
+        self.value = self.value + gain[0] * innovation
+        self.velocity = self.velocity + gain[1] * innovation
+        self.covariance = self.covariance - np.outer(gain, self.covariance[0, :])
+        self.last_time = timestamp
+
+        return self.value, self.velocity
+
+
+def create_filter(kind, scale=1.0, **options):
+    '''
+    Create a filter by name for a signal of the given scale
+    '''
+    if kind == "one_euro":
+        filter_options = {"min_cutoff": 1.0, "beta": 0.5, "derivative_cutoff": 1.0}
+        filter_options.update(options)
+        filter_options["beta"] = filter_options["beta"] / scale
+        return OneEuroFilter(**filter_options)
+    if kind == "kalman":
+        filter_options = {"process_noise": 0.5, "measurement_noise": 0.003}
+        filter_options.update(options)
+        filter_options["process_noise"] = filter_options["process_noise"] * scale ** 2
+        filter_options["measurement_noise"] = filter_options["measurement_noise"] * scale ** 2
+        return KalmanFilter(**filter_options)
+
+    raise ValueError("Unknown gaze filter: {}".format(kind))
+
+
+class GazeFilter:
+    '''
+    Smooths the gaze vector and head pose of one face over time
+    '''
+
+    def __init__(self, kind="one_euro", max_gap=0.5, **options):
+        '''
+        kind: str, 'one_euro' or 'kalman'
+        max_gap: float, seconds without a face after which the filters start over
+        options: settings of the filter, for the gaze vector scale
+        '''
+        self.gaze_filter = create_filter(kind, **options)
+        self.head_pose_filter = create_filter(kind, scale=HEAD_POSE_SCALE, **options)
+        self.max_gap = max_gap
+        self.last_time = None
+
+        self.head_pose = None
+        self.head_pose_velocity = None
+
+        # Statistics
+        self.updates = 0
+        self.resets = 0
+        self.raw_change = 0.0
+        self.filtered_change = 0.0
+        self.last_raw = None
+        self.last_filtered = None
+
+    def update(self, timestamp, gaze_vector, head_pose=None):
+        '''
+        Filter the gaze vector (and head pose) of a frame captured at timestamp
+        (perf_counter seconds), return the smoothed gaze vector and its velocity
+        '''
+        if self.last_time is not None and timestamp - self.last_time > self.max_gap:
+            self.reset()
+        self.last_time = timestamp
+
+        raw = np.asarray(gaze_vector, dtype=np.float64).reshape(-1)
+        gaze, velocity = self.gaze_filter.update(timestamp, raw)
+        if head_pose is not None:
+            self.head_pose, self.head_pose_velocity = self.head_pose_filter.update(
+                timestamp, np.asarray(head_pose, dtype=np.float64).reshape(-1))
+
+        # Frame to frame movement before and after filtering, i.e. the jitter removed
+        if self.last_raw is not None:
+            self.raw_change = self.raw_change + np.linalg.norm(raw - self.last_raw)
+            self.filtered_change = self.filtered_change + np.linalg.norm(gaze - self.last_filtered)
+        self.last_raw = raw
+        self.last_filtered = gaze.copy()
+        self.updates = self.updates + 1
+
+        return gaze, velocity
+
+    def filter_face(self, timestamp, face):
+        '''
+        Return a copy of a FaceResult carrying the smoothed gaze vector and
+        head pose, and the gaze velocity. The face itself is left unchanged,
+        results re-emitted by the change gate share it.
+        '''
+        gaze, velocity = self.update(timestamp, face.gaze_vector, face.head_pose)
+        smoothed = copy.copy(face)
+        smoothed.gaze_vector = gaze
+        smoothed.head_pose = self.head_pose
+        return smoothed, velocity
+
+    def reset(self):
+        self.gaze_filter.reset()
+        self.head_pose_filter.reset()
+        self.last_raw = None
+        self.last_filtered = None
+        self.resets = self.resets + 1
+
+    def stats(self):
+        '''
+        Return the filter statistics
+        '''
+        return {"updates": self.updates,
+                "resets": self.resets,
+                "jitter_reduction": 1.0 - self.filtered_change / self.raw_change if self.raw_change > 0 else 0.0}
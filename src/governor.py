@@ -0,0 +1,181 @@
+'''
+Adaptive latency governor.
+
+Tracks the age of the results, from the capture of a frame to its result,
+against a target budget and trades quality for speed when the host cannot keep
+up. The age includes the time a frame waits in the capture ring for the
+pipeline, which is what makes a live camera lag behind. The knobs are turned
+one step at a time, cheapest first:
+
+    1. display interval    show only every n-th result, freeing the CPU the
+                           display thread renders with
+    2. detection interval  run face detection less often (needs a FaceTracker)
+    3. capture stride      process fewer input frames
+
+and relaxed in the opposite order once the age is well below the budget. A
+bigger stride only shortens the time frames wait for the pipeline, not the
+processing itself, so it is only raised while frames wait at least
+WAIT_RATIO of the budget. When processing alone exceeds the budget the stride
+stays where it is instead of growing to its maximum.
+
+Age and wait are smoothed with an exponential moving average, degrading and
+recovering use separate thresholds (hysteresis), and after every change the
+governor waits for a number of frames so that the effect of the change shows
+before the next one. The knobs never go below the values configured at start.
+
+Sample usage:
+    governor = LatencyGovernor(33, feeder=input_channel, tracker=face_tracker)
+    for result in pipeline.run(input_channel.next_batch()):
+        governor.update(result.age, result.latency)
+        if frame_counter % governor.display_interval == 0:
+            display_worker.post(result.frame, result)
+'''
+import logging as log
+
+# Upper limits of the knobs
+MAX_DISPLAY_INTERVAL = 4
+MAX_DETECTION_INTERVAL = 30
+MAX_STRIDE = 60
+
+# Part of the budget frames must wait for the pipeline before the stride grows
+WAIT_RATIO = 0.25
+
+
+class LatencyGovernor:
+    '''
+    Adjusts stride, detection interval and display rate to a latency budget
+    '''
+
+    def __init__(self, target_ms, feeder=None, tracker=None, smoothing=0.1, degrade_ratio=1.1, recover_ratio=0.7,
+                 hold_frames=15):
+        '''
+        target_ms: float, budget of the age of a result, from capture to result
+        feeder: InputFeeder whose stride is adjusted
+        tracker: optional FaceTracker whose detection interval is adjusted
+        smoothing: float, weight of a new frame in the moving averages
+        degrade_ratio: float, degrade when the average exceeds target_ms * degrade_ratio
+        recover_ratio: float, recover when the average falls below target_ms * recover_ratio
+        hold_frames: int, frames to wait after a change before the next one
+        '''
+        self.target_ms = target_ms
+        self.feeder = feeder
+        self.tracker = tracker
+        self.smoothing = smoothing
+        self.degrade_ratio = degrade_ratio
+        self.recover_ratio = recover_ratio
+        self.hold_frames = hold_frames
+
+        self.display_interval = 1
+        self.base_stride = feeder.stride if feeder is not None else 1
+        self.base_detection_interval = tracker.detection_interval if tracker is not None else 0
+
+        self.average_age = None
+        self.average_wait = 0.0
+        self.frames_since_change = 0
+
+        # Statistics
+        self.degrade_steps = 0
+        self.recover_steps = 0
+
+    def update(self, age_ms, latency_ms):
+        '''
+        Account for a processed frame and adjust the knobs
+
+        age_ms: float, time from the capture of the frame to its result
+        latency_ms: float, time from its submission to the pipeline to its
+                    result, the rest of the age was spent waiting for the pipeline
+        '''
+        wait_ms = max(0.0, age_ms - latency_ms)
+        if self.average_age is None:
+            self.average_age = age_ms
+            self.average_wait = wait_ms
+        else:
+            self.average_age = self.average_age + self.smoothing * (age_ms - self.average_age)
+            self.average_wait = self.average_wait + self.smoothing * (wait_ms - self.average_wait)
+
+        self.frames_since_change = self.frames_since_change + 1
+        if self.frames_since_change < self.hold_frames:
+            return
+
+        if self.average_age > self.target_ms * self.degrade_ratio:
+            if self.degrade():
+                self.degrade_steps = self.degrade_steps + 1
+                self.changed("degrade")
+        elif self.average_age < self.target_ms * self.recover_ratio:
+            if self.recover():
+                self.recover_steps = self.recover_steps + 1
+                self.changed("recover")
+
+    def degrade(self):
+        '''
+        Turn the cheapest knob that still has room one step down in quality
+        '''
+        if self.display_interval < MAX_DISPLAY_INTERVAL:
+            self.display_interval = self.display_interval + 1
+            return True
+
+        if self.tracker is not None and self.tracker.detection_interval < MAX_DETECTION_INTERVAL:
+            self.tracker.detection_interval = min(MAX_DETECTION_INTERVAL, self.tracker.detection_interval + 2)
+            return True
+
+        # Frames hardly wait for the pipeline, fewer of them would not make it faster
+        if self.average_wait < self.target_ms * WAIT_RATIO:
+            return False
+
+        if self.feeder is not None and self.feeder.stride < MAX_STRIDE:
+            # Proportional steps so that the change is gradual at any stride
+            step = self.stride_step(self.feeder.stride // 4)
+            self.feeder.stride = min(MAX_STRIDE, self.feeder.stride + step)
+            return True
+
+        return False
+
+    def recover(self):
+        '''
+        Undo the most expensive degradation first
+        '''
+        if self.feeder is not None and self.feeder.stride > self.base_stride:
+            self.feeder.stride = max(self.base_stride, self.feeder.stride - self.stride_step(self.feeder.stride // 5))
+            return True
+
+        if self.tracker is not None and self.tracker.detection_interval > self.base_detection_interval:
+            self.tracker.detection_interval = max(self.base_detection_interval, self.tracker.detection_interval - 2)
+            return True
+
+        if self.display_interval > 1:
+            self.display_interval = self.display_interval - 1
+            return True
+
+        return False
+
+    def stride_step(self, step):
+        '''
+        Round a stride change to what the input can do: an ffmpeg input only
+        changes its stride in multiples of the stride it was started with
+        '''
+        capture_stride = getattr(self.feeder, "capture_stride", 1)
+        return max(1, step // capture_stride) * capture_stride
+
+    def changed(self, direction):
+        self.frames_since_change = 0
+        log.info("[Info]: Governor {}: average age {:.1f} ms (waiting {:.1f} ms), stride {}, detection interval {}, display every {} frames".format(
+                 direction, self.average_age, self.average_wait, self.stride(), self.detection_interval(), self.display_interval))
+
+    def stride(self):
+        return self.feeder.stride if self.feeder is not None else 1
+
+    def detection_interval(self):
+        return self.tracker.detection_interval if self.tracker is not None else 0
+
+    def register_metrics(self, registry):
+        '''
+        Export the governor decisions through a MetricsRegistry
+        '''
+        registry.register_callback("pointer_governor_average_age_ms", lambda: self.average_age or 0.0)
+        registry.register_callback("pointer_governor_average_wait_ms", lambda: self.average_wait)
+        registry.register_callback("pointer_governor_target_age_ms", lambda: self.target_ms)
+        registry.register_callback("pointer_governor_stride", self.stride)
+        registry.register_callback("pointer_governor_detection_interval", self.detection_interval)
+        registry.register_callback("pointer_governor_display_interval", lambda: self.display_interval)
+        registry.register_callback("pointer_governor_degrade_steps_total", lambda: self.degrade_steps, "counter")
+        registry.register_callback("pointer_governor_recover_steps_total", lambda: self.recover_steps, "counter")
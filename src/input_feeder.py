@@ -6,44 +6,290 @@ Sample usage:
     for batch in feed.next_batch():
         do_something(batch)
     feed.close()
+
+Video and webcam frames are captured on a background thread into a bounded ring
+of preallocated frame buffers. Only every stride-th frame is decoded, the frames
+in between are skipped with grab(). next_batch() returns when the input ends.
+
+The 'ffmpeg' input type decodes the video file through an ffmpeg pipe (see
+ffmpeg_reader.py), which selects every stride-th frame and scales it to
+decode_size at decode time. With keep_full_res the full resolution frame is
+attached to each scaled frame as frame.full_frame. The ffmpeg selection is
+fixed when the pipe starts, so a stride changed later (e.g. by the latency
+governor) takes effect in multiples of the initial stride, by skipping whole
+selected frames.
+
+Every frame returned carries the perf_counter time it was captured as
+frame.capture_time, so that the age of its results can be measured from the
+capture rather than from the moment the consumer took the frame.
+
+An error in the capture thread ends the input, and read() raises it once the
+frames captured before it have been read.
 '''
+import time
+import threading
+from collections import deque
+
 import cv2
-from numpy import ndarray
+import numpy as np
+
+from metrics import REGISTRY, STAGE_LATENCY
+from ffmpeg_reader import FFmpegCapture
+
+# Policies applied when the ring is full because the consumer is too slow
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop'
+
+
+class CapturedFrame(np.ndarray):
+    '''
+    Frame view carrying its capture time and, for scaled ffmpeg frames, the
+    full resolution frame
+    '''
+    capture_time = None
+    full_frame = None
+
 
 class InputFeeder:
-    def __init__(self, input_type, input_file=None):
+    def __init__(self, input_type, input_file=None, stride=10, queue_size=2, policy=POLICY_BLOCK, retain=1,
+                 start_frame=0, end_frame=None, decode_size=None, keep_full_res=False, seek_point=None):
         '''
         input_type: str, The type of input. Can be 'video' for video file, 'image' for image file,
-                    or 'cam' to use webcam feed.
+                    'ffmpeg' for video file decoded by ffmpeg, or 'cam' to use webcam feed.
         input_file: str, The file that contains the input image or video file. Leave empty for cam input_type.
+        stride: int, Yield every stride-th frame of the input.
+        queue_size: int, Number of captured frames that can wait for the consumer.
+        policy: str, POLICY_BLOCK stops capturing while the queue is full,
+                POLICY_DROP_OLDEST replaces the oldest waiting frame (for live input).
+        retain: int, Number of most recently yielded frames the consumer keeps using.
+                Their buffers are not overwritten until newer frames are requested.
+        start_frame: int, Video frame to start at. Keep it a multiple of stride so
+                the same frames are yielded as when reading from the start.
+                A seek may land a frame early when the frame durations vary.
+        end_frame: int, Video frame to stop before, None reads to the end.
+        decode_size: (width, height) the 'ffmpeg' input scales the frames to, None keeps the source size.
+        keep_full_res: bool, The 'ffmpeg' input also delivers the full resolution frames.
+        seek_point: (seek frame, landed frame), The video input seeks to the seek frame, which is
+                known to land on the landed frame, and grabs forward to start_frame from there.
+                None seeks to start_frame directly.
         '''
         self.input_type=input_type
-        if input_type=='video' or input_type=='image':
+        if input_type=='video' or input_type=='image' or input_type=='ffmpeg':
             self.input_file=input_file
-    
+
+        self.stride = max(1, stride)
+        self.queue_size = max(1, queue_size)
+        self.policy = policy
+        self.retain = max(1, retain)
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.decode_size = decode_size
+        self.keep_full_res = keep_full_res
+        self.seek_point = seek_point
+
+        # Frames the capture itself advances per read, ffmpeg already skips
+        # the frames in between. The stride can only change in multiples of it.
+        self.capture_stride = 1
+
+        # Index of the next frame the capture will grab
+        self.position = start_frame
+
+        self.buffers = []
+        self.full_buffers = []
+        self.capture_times = []
+        self.free_buffers = deque()
+        self.ready_buffers = deque()
+        self.retained_buffers = deque()
+        self.condition = threading.Condition()
+        self.capture_thread = None
+        self.end_of_stream = False
+        self.stopped = False
+        # Exception that ended the capture thread, raised by read()
+        self.error = None
+
+        # Optional threading.Event set whenever a frame is ready, so that a
+        # consumer reading several feeders can wait for any of them
+        self.ready_event = None
+
+        self.captured_frames = 0
+        self.dropped_frames = 0
+
     def load_data(self):
         if self.input_type=='video':
             self.cap=cv2.VideoCapture(self.input_file)
+        elif self.input_type=='ffmpeg':
+            self.cap=FFmpegCapture(self.input_file, size=self.decode_size, stride=self.stride,
+                                   keep_full_res=self.keep_full_res)
+            self.capture_stride = self.stride
         elif self.input_type=='cam':
             self.cap=cv2.VideoCapture(0)
         else:
             self.cap=cv2.imread(self.input_file)
+            return
+
+        if self.seek_point is not None:
+            seek_frame, self.position = self.seek_point
+            if seek_frame > 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, seek_frame)
+            while self.position < self.start_frame and self.cap.grab():
+                self.position = self.position + 1
+        elif self.start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+
+        # Ring of frame buffers: frames waiting in the queue, frames retained
+        # by the consumer and the one being captured into
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        ring_size = self.queue_size + self.retain + 1
+        for index in range(ring_size):
+            if width > 0 and height > 0:
+                self.buffers.append(np.empty((height, width, 3), dtype=np.uint8))
+            else:
+                self.buffers.append(None)
+            self.full_buffers.append(None)
+            self.capture_times.append(0.0)
+            self.free_buffers.append(index)
+
+        self.capture_thread = threading.Thread(target=self.capture, name='capture', daemon=True)
+        self.capture_thread.start()
 
-    def next_batch(self):
+    def capture(self):
+        '''
+        Capture thread: capture frames until the input ends, fails or is closed
+        '''
+        try:
+            self.capture_frames()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.end_of_stream = True
+                self.condition.notify_all()
+            if self.ready_event is not None:
+                self.ready_event.set()
+
+    def capture_frames(self):
+        '''
+        Decode every stride-th frame into a free ring buffer
+        '''
+        while not self.stopped:
+            # The frame decoded in this iteration must lie before end_frame
+            if self.end_frame is not None and self.position + self.stride - 1 >= self.end_frame:
+                break
+
+            # Skip the frames in between without decoding them
+            start_time = time.perf_counter()
+            grabbed = True
+            for _ in range(max(1, self.stride // self.capture_stride) - 1):
+                grabbed = self.cap.grab()
+                if not grabbed:
+                    break
+                self.position = self.position + self.capture_stride
+            if not grabbed:
+                break
+
+            with self.condition:
+                while not self.free_buffers and not self.stopped:
+                    if self.policy == POLICY_DROP_OLDEST and self.ready_buffers:
+                        self.free_buffers.append(self.ready_buffers.popleft())
+                        self.dropped_frames = self.dropped_frames + 1
+                    else:
+                        self.condition.wait()
+                if self.stopped:
+                    break
+                index = self.free_buffers.popleft()
+
+            # Capture time excludes the wait for a free buffer
+            grab_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+
+            # read() decodes into the buffer when its size matches the frame
+            if self.input_type=='ffmpeg' and self.keep_full_res:
+                ret, frame = self.cap.read(image=self.buffers[index], full_image=self.full_buffers[index])
+            else:
+                ret, frame = self.cap.read(image=self.buffers[index])
+            REGISTRY.observe(STAGE_LATENCY, (grab_time + time.perf_counter() - start_time) * 1000, stage="capture")
+            self.position = self.position + self.capture_stride
+            if not ret:
+                with self.condition:
+                    self.free_buffers.append(index)
+                break
+            self.buffers[index] = frame
+            self.full_buffers[index] = getattr(frame, "full_frame", None)
+            self.capture_times[index] = time.perf_counter()
+
+            with self.condition:
+                self.ready_buffers.append(index)
+                self.captured_frames = self.captured_frames + 1
+                self.condition.notify_all()
+            if self.ready_event is not None:
+                self.ready_event.set()
+
+    def next_batch(self, poll_interval=None):
         '''
         Returns the next image from either a video file or webcam.
-        If input_type is 'image', then it returns the same image.
+        If input_type is 'image', then it returns the image once.
+        Stops when the video file ends or the webcam can no longer be read.
+        With poll_interval, None is returned whenever no frame arrived within
+        poll_interval seconds, so the consumer can do other work meanwhile.
         '''
         while True:
-            for _ in range(10):
-                _, frame=self.cap.read()
+            frame = self.read(timeout=poll_interval)
+            if frame is None and (poll_interval is None or self.finished()):
+                return
             yield frame
 
+    def read(self, block=True, timeout=None):
+        '''
+        Return the next captured frame. Returns None at the end of the input,
+        or when no frame is ready within timeout seconds, or right away when
+        block is False (see finished()). Raises the error that ended the
+        capture thread, if any, once no captured frame is left.
+        '''
+        if self.input_type=='image':
+            if self.end_of_stream:
+                return None
+            self.end_of_stream = True
+            frame = self.cap.view(CapturedFrame)
+            frame.capture_time = time.perf_counter()
+            return frame
+
+        with self.condition:
+            if block:
+                self.condition.wait_for(lambda: self.ready_buffers or self.end_of_stream, timeout)
+            if not self.ready_buffers:
+                if self.error is not None:
+                    raise self.error
+                return None
+            index = self.ready_buffers.popleft()
+
+            # The consumer took a new frame, so the oldest retained frame is
+            # no longer in use
+            while len(self.retained_buffers) >= self.retain:
+                self.free_buffers.append(self.retained_buffers.popleft())
+            self.retained_buffers.append(index)
+            self.condition.notify_all()
+
+        frame = self.buffers[index].view(CapturedFrame)
+        frame.capture_time = self.capture_times[index]
+        frame.full_frame = self.full_buffers[index]
+        return frame
+
+    def finished(self):
+        '''
+        True once the input ended and every captured frame has been read
+        '''
+        with self.condition:
+            return self.end_of_stream and not self.ready_buffers
 
     def close(self):
         '''
         Closes the VideoCapture.
         '''
         if not self.input_type=='image':
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+            if self.capture_thread is not None:
+                self.capture_thread.join()
             self.cap.release()
-
@@ -1,8 +1,7 @@
 import cv2
 
 from model import Models
-
-EYEOPENING = 20
+from eye_roi import eye_rois
 
 class LandmarksModel(Models):
     '''
@@ -39,18 +38,20 @@ class LandmarksModel(Models):
 
         converted_output = [left_eye_coords_x, left_eye_coords_y, right_eye_coords_x, right_eye_coords_y, nose_coords_x, nose_coords_y, mouth_left_x, mouth_left_y, mouth_right_x, mouth_right_y]        
 
-        left_eye_coord_x_bounded = max(0, (left_eye_coords_x - EYEOPENING))
-        left_eye_coord_y_bounded = max(0, (left_eye_coords_y - EYEOPENING))
+        cropped_left_eye, cropped_right_eye, eyes_coords = self.crop_eyes(frame, converted_output)
+
+        return cropped_left_eye, cropped_right_eye, eyes_coords, converted_output, inference_time  
 
-        # Crop left and righr eye images
-        cropped_left_eye  = frame[(left_eye_coord_y_bounded):(left_eye_coords_y + EYEOPENING), (left_eye_coord_x_bounded):(left_eye_coords_x + EYEOPENING)]
-        cropped_right_eye = frame[(right_eye_coords_y - EYEOPENING):(right_eye_coords_y + EYEOPENING), (right_eye_coords_x - EYEOPENING):(right_eye_coords_x + EYEOPENING)] 
+    def crop_eyes(self, frame, converted_output):
+        '''
+        Locate the eye regions around the landmarks
 
-        eyes_coords = [
-                       [(left_eye_coord_x_bounded, left_eye_coord_y_bounded), (left_eye_coords_x + EYEOPENING, left_eye_coords_y + EYEOPENING)],  
-                       [(right_eye_coords_x - EYEOPENING, right_eye_coords_y - EYEOPENING), (right_eye_coords_x + EYEOPENING, right_eye_coords_y + EYEOPENING)]
-                      ] 
+        input: frame - face image the landmarks belong to
+               converted_output - landmarks in pixels of the face image
 
+        output: left eye EyeRoi, right eye EyeRoi, eye boxes
+        '''
+        left_eye, right_eye = eye_rois(frame, converted_output)
+        eyes_coords = [left_eye.box(), right_eye.box()]
 
-        return cropped_left_eye, cropped_right_eye, eyes_coords, converted_output, inference_time  
-   
+        return left_eye, right_eye, eyes_coords
@@ -1,23 +1,43 @@
 """Computer Pointer Controller"""
 
 
+import time
+
+# Start of the process, for the time to first result
+STARTUP_TIME = time.perf_counter()
+
 import os
 import sys
-import time
 import socket
 import json
 import cv2
 import traceback
 import logging as log
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 
 # Local class imports
 from input_feeder import InputFeeder
-from mouse_controller import MouseController
+from mouse_controller import MouseController, MouseActuator
 from face_detection import FaceDetectionModel
 from head_pose import HeadPoseModel
 from landmarks import LandmarksModel
 from gaze_estimation import GazeEstimationModel
+from model import load_models
+from model_cache import ModelCache
+from backend import BACKENDS, create_backend, set_backend
+from face_tracker import FaceTracker
+from change_detector import ChangeDetector
+from roi_cache import RoiCache
+from governor import LatencyGovernor
+from gaze_filter import FILTERS, GazeFilter
+from result_sink import open_result_sink
+from stage_recorder import StageRecorder
+from display import DisplayWorker
+from video_writer import VideoWriterSink, POLICY_DROP, POLICY_BLOCK
+from pipeline import Pipeline, ASYNC_NUM_REQUESTS, ASYNC_FRAMES_RETAINED, POLL_INTERVAL, STATUS_FACE, \
+    STATUS_NO_FACE, STATUS_LOW_CONFIDENCE, STATUS_END_OF_STREAM
+from metrics import REGISTRY, STAGE_LATENCY, RESULT_INTERVAL, MetricsServer, SummaryLogger
 
 
 LOGLEVEL = log.INFO 
@@ -41,7 +61,9 @@ def build_argparser():
     parser.add_argument("-v", "--visualize", required=False, type=str,
                         help="Use FHLG to select which inference results to visualize")
     parser.add_argument("-i", "--input", required=True, type=str,
-                        help="Path to video file. Use CAM for camera input")
+                        help="Path to video file. Use CAM for camera input, "
+                             "ffmpeg:<path> to decode the video through ffmpeg "
+                             "scaled to the face detector input size")
     parser.add_argument("-l", "--cpu_extension", required=False, type=str,
                         default=None,
                         help="MKLDNN (CPU)-targeted custom layers."
@@ -55,9 +77,135 @@ def build_argparser():
     parser.add_argument("-pt", "--prob_threshold", type=float, default=0.5,
                         help="Probability threshold for detections filtering"
                         "(0.5 by default)")
+    parser.add_argument("-mc", "--model_cache", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".cache", "pointer_controller"),
+                        help="Directory caching compiled networks between runs. "
+                             "Use NONE to disable the cache")
+    parser.add_argument("-fs", "--frame_stride", type=int, default=10,
+                        help="Process every n-th frame of the input "
+                             "(10 by default)")
+    parser.add_argument("-fr", "--full_res", action="store_true",
+                        help="With an ffmpeg: input, also decode the full resolution "
+                             "frames and crop the faces from them")
+    parser.add_argument("-cp", "--cam_policy", type=str, default="drop",
+                        choices=["drop", "block"],
+                        help="What to do with camera frames when processing "
+                             "falls behind: drop the oldest waiting frame or "
+                             "block the capture (drop by default)")
+    parser.add_argument("-mf", "--max_faces", type=int, default=1,
+                        help="Maximum number of faces processed per frame. "
+                             "All faces are batched into one inference per "
+                             "model (1 by default)")
+    parser.add_argument("-ti", "--track_interval", type=int, default=0,
+                        help="Run face detection only every n frames and track "
+                             "the face from the landmarks in between "
+                             "(0 runs face detection on every frame)")
+    parser.add_argument("-ct", "--change_threshold", type=float, default=0,
+                        help="Skip inference on frames whose mean grayscale "
+                             "difference to the last processed frame is below "
+                             "this value (0-255) and re-emit its results "
+                             "(0 disables the gate)")
+    parser.add_argument("-cs", "--change_max_stale", type=int, default=30,
+                        help="Run inference at least every n frames while "
+                             "the change gate skips frames (30 by default)")
+    parser.add_argument("-cr", "--change_roi", action="store_true",
+                        help="Compare only the last face box in the change gate")
+    parser.add_argument("-rt", "--roi_tolerance", type=float, default=0,
+                        help="Reuse the head pose and landmarks of a face whose box "
+                             "and crop signature (mean grayscale difference, 0-255) "
+                             "are within this tolerance of a cached face "
+                             "(0 disables the cache)")
+    parser.add_argument("-rf", "--roi_refresh", type=int, default=10,
+                        help="Run head pose and landmarks again after a cached face "
+                             "was reused n times (10 by default)")
+    parser.add_argument("-ai", "--absence_interval", type=int, default=5,
+                        help="After n frames without a face, run face detection "
+                             "only every n frames until a face is back "
+                             "(5 by default, 1 keeps detecting on every frame)")
+    parser.add_argument("-hl", "--headless", action="store_true",
+                        help="Run without display, overlays and mouse control "
+                             "at full inference speed")
+    parser.add_argument("-o", "--output_results", type=str, default=None,
+                        help="Stream per frame results to a file: binary "
+                             "records for .bin files, JSON lines otherwise")
+    parser.add_argument("-ov", "--output_video", type=str, default=None,
+                        help="Write the frames with the -v overlays (all of them "
+                             "when -v is not given) to this video file, encoded "
+                             "in a separate process")
+    parser.add_argument("-vs", "--video_size", type=str, default=None,
+                        help="Size of the output video as WIDTHxHEIGHT "
+                             "(the frame size by default)")
+    parser.add_argument("-vr", "--video_rate", type=float, default=10,
+                        help="Frame rate of the output video, results arriving "
+                             "faster are not written (10 by default)")
+    parser.add_argument("-vp", "--video_policy", type=str, default=POLICY_DROP, choices=[POLICY_DROP, POLICY_BLOCK],
+                        help="When the encoder falls behind, drop frames or block "
+                             "the pipeline until it catches up (drop by default)")
+    parser.add_argument("-rc", "--record", type=str, default=None,
+                        help="Record face boxes, head pose, landmarks, gaze and "
+                             "eye crops of every frame to this directory for "
+                             "replay.py")
+    parser.add_argument("-am", "--async_mode", action="store_true",
+                        help="Pipeline the four models with asynchronous "
+                             "inference across consecutive frames")
+    parser.add_argument("-at", "--auto_tune", type=str, default=None,
+                        help="Tuning profile file. Picks the fastest precision "
+                             "and CPU streams/threads per model, measured once "
+                             "per CPU model and reused from the profile later")
+    parser.add_argument("-be", "--backend", type=str, default="openvino", choices=BACKENDS,
+                        help="Inference backend. 'mock' returns synthetic outputs "
+                             "after sampled latencies, without OpenVINO or IR files "
+                             "(openvino by default)")
+    parser.add_argument("-ml", "--mock_latency", type=str, default=None,
+                        help="Latency distributions of the mock backend in ms, e.g. "
+                             "'FACE=normal:13,1.3;HEAD=const:1.6;GAZE=lognormal:1.7,0.2'")
+    parser.add_argument("-ms", "--mock_seed", type=int, default=0,
+                        help="Random seed of the mock backend (0 by default)")
+    parser.add_argument("-mt", "--mock_streams", type=int, default=1,
+                        help="Inferences the mock device runs at the same time, "
+                             "further requests queue behind them (1 by default)")
+    parser.add_argument("-mp", "--metrics_port", type=int, default=0,
+                        help="Serve latency histograms and counters in Prometheus "
+                             "text format on http://127.0.0.1:<port>/metrics "
+                             "(0 disables the endpoint)")
+    parser.add_argument("-mi", "--metrics_interval", type=float, default=0,
+                        help="Log a latency summary every n seconds "
+                             "(0 disables the periodic summary)")
+    parser.add_argument("-lb", "--latency_budget", type=float, default=0,
+                        help="Budget in ms of the age of a result, from frame capture "
+                             "to result. When it is exceeded, fewer results are shown, "
+                             "face detection runs less often and, while frames wait for "
+                             "the pipeline, the frame stride grows. They are restored "
+                             "when the age drops (0 disables the governor)")
+    parser.add_argument("-gf", "--gaze_filter", type=str, default="none", choices=FILTERS,
+                        help="Smooth gaze and head pose with a 1 Euro or constant "
+                             "velocity Kalman filter before moving the pointer "
+                             "(none by default)")
+    parser.add_argument("-ge", "--gaze_extrapolation", type=float, default=100,
+                        help="With a gaze filter, extrapolate the gaze from the frame "
+                             "time to the pointer movement by at most n ms "
+                             "(100 by default, 0 disables extrapolation)")
     return parser
 
 
+def prepare_models(models, num_requests, model_cache, auto_tune=None):
+    """
+    Tune, load and warm up the models, return the loading time in ms.
+    Runs in the background while the input is opened.
+    """
+    # Precision and plugin configuration from the tuning profile
+    if auto_tune is not None:
+        from autotune import AutoTuner
+
+        AutoTuner(auto_tune).tune(models, num_requests)
+
+    # Load all models concurrently on the shared inference core, then run one
+    # inference each so the first frame does not pay for it
+    start_time = time.perf_counter()
+    load_models(models, num_requests, model_cache, warm_up=True)
+    return (time.perf_counter() - start_time) * 1000
+
+
 def main():
     """
     """
@@ -88,45 +236,53 @@ def main():
     head_pose_obj         = HeadPoseModel(head_pose_model, device, extension)
     landmarks_obj         = LandmarksModel(landmarks_model, device, extension)
     gaze_estimation_obj   = GazeEstimationModel(gaze_estimation_model, device, extension)
+    models = [face_detection_obj, head_pose_obj, landmarks_obj, gaze_estimation_obj]
+
+    # Faces of a frame are batched through the per face models
+    head_pose_obj.batch_size       = args.max_faces
+    landmarks_obj.batch_size       = args.max_faces
+    gaze_estimation_obj.batch_size = args.max_faces
+
+    # Check the input before anything is loaded
+    input_file = input_src
+    if input_src.lower().startswith('ffmpeg:'):
+        input_file = input_src[len('ffmpeg:'):]
+    if input_src.lower() != 'cam' and not os.path.exists(input_file):
+        log.error("Video file not found! Exiting....")
+        exit(1)
 
-    # Create mouse controller object
-    mouse_controller = MouseController('medium', 'fast')
-    # Place mouse at the center of the screen
-    mouse_controller.init_position()
-    log_obj.info("[Info]: Place mouse at the center of the screen")
-
-    # Place holder for total inferencing time
-    total_inference_time = 0
+    # Async mode keeps more than one frame in flight per model
+    num_requests = ASYNC_NUM_REQUESTS if args.async_mode else 1
 
-    # Load models and get the model loading times
-    start_time = time.time()
-    face_detection_obj.load_model()
-    end_time = time.time()
-    face_detection_loading_time = end_time - start_time
+    if args.backend != 'openvino':
+        set_backend(create_backend(args.backend, latency=args.mock_latency, seed=args.mock_seed,
+                                   streams=args.mock_streams))
+        log_obj.info("[Info]: Using the {} inference backend".format(args.backend))
 
-    start_time = time.time()
-    head_pose_obj.load_model()
-    end_time = time.time()
-    head_pose_loading_time = end_time - start_time
+    # Compiled network cache, 'NONE' disables it, mock networks are not compiled
+    model_cache = None
+    if args.model_cache.upper() != 'NONE' and args.backend == 'openvino':
+        model_cache = ModelCache(args.model_cache)
 
-    start_time = time.time()
-    landmarks_obj.load_model()
-    end_time = time.time()
-    landmarks_detection_loading_time = end_time - start_time
+    # The models load in the background while the input is opened
+    loader = ThreadPoolExecutor(max_workers=1)
+    loading = loader.submit(prepare_models, models, num_requests, model_cache, args.auto_tune)
 
-    start_time = time.time()
-    gaze_estimation_obj.load_model()
-    end_time = time.time()
-    gaze_estimation_loading_time = end_time - start_time
+    # Frames stay referenced while they are in flight in the pipeline
+    retain = ASYNC_FRAMES_RETAINED if args.async_mode else 1
 
     # Configure input video source
     if input_src.lower() == 'cam':
-        input_channel = InputFeeder(input_type='cam')
-    elif not os.path.exists(input_src):
-        log.error("Video file not found! Exiting....")
-        exit(1)
+        input_channel = InputFeeder(input_type='cam', stride=args.frame_stride, policy=args.cam_policy, retain=retain)
+    elif input_src.lower().startswith('ffmpeg:'):
+        # Decode straight to the face detection input size, known once it is loaded
+        loading.result()
+        detection_shape = face_detection_obj.input_shape[face_detection_obj.input_blob]
+        input_channel = InputFeeder(input_type='ffmpeg', input_file=input_file, stride=args.frame_stride, retain=retain,
+                                    decode_size=(detection_shape[3], detection_shape[2]), keep_full_res=args.full_res)
+        log_obj.info("[Info]: Opening video file through ffmpeg ...")
     else:
-        input_channel = InputFeeder(input_type='video', input_file=input_src)
+        input_channel = InputFeeder(input_type='video', input_file=input_src, stride=args.frame_stride, retain=retain)
         log_obj.info("[Info]: Opening video file ...")
 
 
@@ -134,106 +290,271 @@ def main():
     video_width = int(input_channel.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     video_height = int(input_channel.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(input_channel.cap.get(cv2.CAP_PROP_FPS))
+
+    # No display and no mouse control in headless mode. pyautogui is only
+    # imported here, by the MouseController.
+    mouse_actuator = None
+    if not args.headless:
+        # Create mouse controller object
+        mouse_controller = MouseController('medium', 'fast')
+
+        # Mouse movements run on their own thread so they never stall inference
+        mouse_actuator = MouseActuator(mouse_controller, max_extrapolation=args.gaze_extrapolation / 1000)
+
+    # Rendering and display run on their own thread
+    display_worker = None
+    if not args.headless:
+        display_worker = DisplayWorker(args.visualize)
+        display_worker.start()
+
+    result_sink = None
+    if args.output_results is not None:
+        result_sink = open_result_sink(args.output_results)
+
+    stage_recorder = None
+    if args.record is not None:
+        stage_recorder = StageRecorder(args.record)
+
+    video_writer = None
+    if args.output_video is not None:
+        video_size = None
+        if args.video_size is not None:
+            video_size = tuple(int(value) for value in args.video_size.lower().split("x"))
+        video_writer = VideoWriterSink(args.output_video, args.visualize or "FHLG", size=video_size,
+                                       fps=args.video_rate, policy=args.video_policy)
+
+    total_loading_time = loading.result()
+    loader.shutdown()
+    log_obj.info("[Info]: Models ready {:.3f} ms after start".format((time.perf_counter() - STARTUP_TIME) * 1000))
     
     frame_counter = 0
-    total_face_inf_time     = 0
-    total_head_inf_time     = 0
-    total_lanmarks_inf_time = 0
-    total_gaze_inf_time     = 0
-    frame_processing_time   = 0
+    time_to_first_result = 0.0
+    status_counts = {STATUS_NO_FACE: 0, STATUS_LOW_CONFIDENCE: 0}
+
+    face_tracker = None
+    if args.track_interval > 0:
+        face_tracker = FaceTracker(detection_interval=args.track_interval)
+    elif args.latency_budget > 0:
+        # Detection on every frame until the governor needs to skip some
+        face_tracker = FaceTracker(detection_interval=1)
+
+    change_detector = None
+    if args.change_threshold > 0:
+        change_detector = ChangeDetector(threshold=args.change_threshold, max_stale=args.change_max_stale,
+                                         use_roi=args.change_roi)
+
+    gaze_filter = None
+    if args.gaze_filter != "none":
+        gaze_filter = GazeFilter(args.gaze_filter)
+
+    governor = None
+    if args.latency_budget > 0:
+        governor = LatencyGovernor(args.latency_budget, feeder=input_channel, tracker=face_tracker)
+
+    roi_cache = None
+    if args.roi_tolerance > 0:
+        roi_cache = RoiCache(tolerance=args.roi_tolerance, refresh_interval=args.roi_refresh)
+
+    # Counters of the other components are read when metrics are collected
+    REGISTRY.register_callback("pointer_frames_total", lambda: frame_counter, "counter")
+    REGISTRY.register_callback("pointer_time_to_first_result_ms", lambda: time_to_first_result)
+    REGISTRY.register_callback("pointer_no_face_frames_total", lambda: status_counts[STATUS_NO_FACE], "counter")
+    REGISTRY.register_callback("pointer_low_confidence_frames_total", lambda: status_counts[STATUS_LOW_CONFIDENCE], "counter")
+    REGISTRY.register_callback("pointer_capture_frames_total", lambda: input_channel.captured_frames, "counter")
+    REGISTRY.register_callback("pointer_capture_dropped_frames_total", lambda: input_channel.dropped_frames, "counter")
+    if video_writer is not None:
+        REGISTRY.register_callback("pointer_video_written_frames_total", lambda: video_writer.written_frames, "counter")
+        REGISTRY.register_callback("pointer_video_dropped_frames_total", lambda: video_writer.dropped_frames, "counter")
+    if display_worker is not None:
+        REGISTRY.register_callback("pointer_display_shown_frames_total", lambda: display_worker.shown_frames, "counter")
+        REGISTRY.register_callback("pointer_display_dropped_frames_total", lambda: display_worker.dropped_frames, "counter")
+    if mouse_actuator is not None:
+        REGISTRY.register_callback("pointer_mouse_applied_updates_total", lambda: mouse_actuator.applied_updates, "counter")
+        REGISTRY.register_callback("pointer_mouse_dropped_updates_total", lambda: mouse_actuator.dropped_updates, "counter")
+        REGISTRY.register_callback("pointer_mouse_max_queue_age_ms", lambda: mouse_actuator.stats()["max_queue_age_ms"])
+    if face_tracker is not None:
+        REGISTRY.register_callback("pointer_face_detections_total", lambda: face_tracker.stats()["detections"], "counter")
+        REGISTRY.register_callback("pointer_face_detection_rate", lambda: face_tracker.stats()["detection_rate"])
+    if change_detector is not None:
+        REGISTRY.register_callback("pointer_change_skipped_frames_total", lambda: change_detector.skipped_frames, "counter")
+        REGISTRY.register_callback("pointer_change_stale_refreshes_total", lambda: change_detector.stale_refreshes, "counter")
+        REGISTRY.register_callback("pointer_change_difference", lambda: change_detector.last_difference)
+    if roi_cache is not None:
+        REGISTRY.register_callback("pointer_roi_cache_hits_total", lambda: roi_cache.hits, "counter")
+        REGISTRY.register_callback("pointer_roi_cache_misses_total", lambda: roi_cache.misses, "counter")
+        REGISTRY.register_callback("pointer_roi_cache_refreshes_total", lambda: roi_cache.refreshes, "counter")
+        REGISTRY.register_callback("pointer_roi_cache_evictions_total", lambda: roi_cache.evictions, "counter")
+    if governor is not None:
+        governor.register_metrics(REGISTRY)
+    if gaze_filter is not None:
+        REGISTRY.register_callback("pointer_gaze_filter_jitter_reduction", lambda: gaze_filter.stats()["jitter_reduction"])
+
+    metrics_server = None
+    if args.metrics_port > 0:
+        metrics_server = MetricsServer(REGISTRY, args.metrics_port)
+        metrics_server.start()
+        log_obj.info("[Info]: Serving metrics on http://127.0.0.1:{}/metrics".format(args.metrics_port))
+
+    summary_logger = None
+    if args.metrics_interval > 0:
+        summary_logger = SummaryLogger(REGISTRY, args.metrics_interval)
+        summary_logger.start()
+
+    pipeline = Pipeline(face_detection_obj, head_pose_obj, landmarks_obj, gaze_estimation_obj,
+                        prob_threshold, async_mode=args.async_mode, tracker=face_tracker,
+                        change_detector=change_detector, roi_cache=roi_cache,
+                        absence_interval=args.absence_interval)
+    REGISTRY.register_callback("pointer_absent_skipped_detections_total", lambda: pipeline.backoff_skipped_frames, "counter")
+    if args.async_mode:
+        log_obj.info("[Info]: Running asynchronous inference pipeline")
+
+    # Place mouse at the center of the screen
+    if mouse_actuator is not None:
+        mouse_controller.init_position()
+        log_obj.info("[Info]: Place mouse at the center of the screen")
+        mouse_actuator.start()
 
     # Process each frame
     try:
-        for frame in input_channel.next_batch():
-            frame_processing_start_time = time.time()
+        frame_processing_start_time = time.perf_counter()
+        # In async mode the frames in flight keep advancing while no new frame is ready
+        poll_interval = POLL_INTERVAL if args.async_mode else None
+        for result in pipeline.run(input_channel.next_batch(poll_interval), end_of_stream=True):
+            if result.status == STATUS_END_OF_STREAM:
+                log_obj.info("[Info]: Video feed finished")
+                break
 
             frame_counter = frame_counter + 1
-            key = cv2.waitKey(60)
-
-            # Use face detection to find cropped face and provide face coordinates
-            cropped_face, face_coords, face_inference_time = face_detection_obj.predict(frame, prob_threshold )
-            total_face_inf_time = total_face_inf_time + face_inference_time
-
-            #  Now use cropped face for head pose detection
-            head_pose_estimate, head_inference_time = head_pose_obj.predict(cropped_face, prob_threshold ) 
-            total_head_inf_time = total_head_inf_time + head_inference_time
- 
-            #  Now use cropped face for landmarks detection
-            cropped_left_eye, cropped_right_eye, eyes_coords, converted_landmarks, landmarks_inference_time = landmarks_obj.predict(cropped_face, prob_threshold )
-            total_lanmarks_inf_time = total_lanmarks_inf_time + landmarks_inference_time
- 
-            #  Finally gaze estimation
-            gaze_vector, gaze_estimate_time = gaze_estimation_obj.predict(cropped_left_eye, cropped_right_eye, head_pose_estimate) 
-            total_gaze_inf_time = total_gaze_inf_time + gaze_estimate_time
-
-            # Move the mouse
-            #mouse_controller.move(gaze_vector[0], gaze_vector[1])
- 
-            # Show size-reduced frame for visual comparison
-
-            # Check potential visualize flags: 'F', 'H', 'L', 'G' 
-            # If flag exist, process image to show inference results
-            if args.visualize is not None:
-
-                visualize_flag = str(args.visualize)
-
-                # Draw bounding box around detected face
-                if 'F' in visualize_flag:
-                    cv2.rectangle(frame, (face_coords[0][0], face_coords[0][1]), (face_coords[0][2], face_coords[0][3]), (0,255,0), 2)
-                
-                # Show head pose parameters
-                if 'H' in visualize_flag:
-                    cv2.putText(frame, "Head pose: yaw: {:.3f}, pitch: {:.3f}, roll: {:.3f}".format(head_pose_estimate[0], head_pose_estimate[1], head_pose_estimate[2]), (10, 20), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 255, 0), 5) 
-
-                # Draw dots on detected facial landmarks
-                if 'L' in visualize_flag:
-                    cv2.circle(frame, (converted_landmarks[0] + face_coords[0][0], converted_landmarks[1] + face_coords[0][1]), 10, (0,255,0), 5) 
-                    cv2.circle(frame, (converted_landmarks[2] + face_coords[0][0], converted_landmarks[3] + face_coords[0][1]), 10, (0,255,0), 5)
-                    cv2.circle(frame, (converted_landmarks[4] + face_coords[0][0], converted_landmarks[5] + face_coords[0][1]), 10, (0,255,0), 5)
-                    cv2.circle(frame, (converted_landmarks[6] + face_coords[0][0], converted_landmarks[7] + face_coords[0][1]), 10, (0,255,0), 5)
-                    cv2.circle(frame, (converted_landmarks[8] + face_coords[0][0], converted_landmarks[9] + face_coords[0][1]), 10, (0,255,0), 5)
-
-                # Display gaze parameters
-                if 'G' in visualize_flag:
-                    cv2.putText(frame, "Gaze estimate: x: {:.3f}, y: {:.3f}, z: {:.3f}".format(gaze_vector[0], gaze_vector[1], gaze_vector[2]), (10, 100), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 255, 0), 5) 
-
-            resized_frame = cv2.resize(frame, (640, 360))
-            cv2.imshow('frame', resized_frame)
-
-            if frame_counter % 4 == 0:
-                mouse_controller.move(gaze_vector[0], gaze_vector[1])
-
-            frame_processing_time = frame_processing_time + (time.time() - frame_processing_start_time) * 1000
-
-            if key == 27:
+            frame = result.frame
+            if frame_counter == 1:
+                time_to_first_result = (time.perf_counter() - STARTUP_TIME) * 1000
+                log_obj.info("[Info]: Time to first result: {:.3f} ms".format(time_to_first_result))
+            if result.status != STATUS_FACE:
+                status_counts[result.status] = status_counts[result.status] + 1
+
+            # The recording keeps the raw model outputs
+            if stage_recorder is not None:
+                stage_recorder.write(result)
+
+            # Every frame goes through the filter, also those not moving the pointer.
+            # The smoothed face replaces the raw one in the sinks, the overlays and the pointer.
+            gaze_velocity = None
+            if gaze_filter is not None and result.status == STATUS_FACE:
+                smoothed_face, gaze_velocity = gaze_filter.filter_face(result.capture_time, result.faces[0])
+                result.faces = [smoothed_face] + result.faces[1:]
+
+            if result_sink is not None:
+                result_sink.write(result, result.latency)
+            if video_writer is not None:
+                video_writer.write(result)
+
+            if governor is not None:
+                governor.update(result.age, result.latency)
+
+            # Overlays are drawn and shown by the display worker
+            if display_worker is not None and (governor is None or frame_counter % governor.display_interval == 0):
+                display_worker.post(frame, result)
+
+            # Nothing to point with when nobody is present
+            if mouse_actuator is not None and result.status == STATUS_FACE and frame_counter % 4 == 0:
+                gaze_vector = result.faces[0].gaze_vector
+                if gaze_velocity is not None:
+                    mouse_actuator.update(gaze_vector[0], gaze_vector[1], velocity=gaze_velocity[:2],
+                                          timestamp=result.capture_time)
+                else:
+                    mouse_actuator.update(gaze_vector[0], gaze_vector[1])
+
+            # In async mode frames overlap, so measure the time between consecutive results
+            frame_processing_end_time = time.perf_counter()
+            REGISTRY.observe(RESULT_INTERVAL, (frame_processing_end_time - frame_processing_start_time) * 1000)
+            frame_processing_start_time = frame_processing_end_time
+
+            if display_worker is not None and display_worker.exit_requested:
                 break
 
     except Exception as e:
         #traceback.print_exc()
-        if 'shape' in str(e):
-            log_obj.info("Video feed finished")
-        else:
-            log_obj.error("[ERROR]: " + str(e)) 
-        pass
+        log_obj.error("[ERROR]: " + str(e)) 
 
     # All done, cleaning up
-    cv2.destroyAllWindows()
+    if summary_logger is not None:
+        summary_logger.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if mouse_actuator is not None:
+        mouse_actuator.stop()
+    if result_sink is not None:
+        result_sink.close()
+    if stage_recorder is not None:
+        stage_recorder.close()
+    if video_writer is not None:
+        video_writer.close()
+    if display_worker is not None:
+        display_worker.stop()
     input_channel.close()
 
     # Print out statistics
     log_obj.info("[Info]: Video source FPS: " + str(fps))
     log_obj.info("[Info]: Total frame count: " + str(frame_counter))
+    log_obj.info("[Info]: Dropped capture frames: " + str(input_channel.dropped_frames))
+    log_obj.info("[Info]: Frames without a face: {} low confidence: {}, face detection skipped on {} of them".format(
+                 status_counts[STATUS_NO_FACE], status_counts[STATUS_LOW_CONFIDENCE], pipeline.backoff_skipped_frames))
+    if video_writer is not None:
+        log_obj.info("[Info]: Output video frames written: {} skipped: {} dropped: {}".format(
+                     video_writer.written_frames, video_writer.skipped_frames, video_writer.dropped_frames))
+    if display_worker is not None:
+        log_obj.info("[Info]: Displayed frames: {} dropped: {}".format(display_worker.shown_frames, display_worker.dropped_frames))
+    log_obj.info("")
+    log_obj.info("[Info]: Face detection model loading time: {:.3f} ms".format(face_detection_obj.loading_time))
+    log_obj.info("[Info]: Head pose model loading time: {:.3f} ms".format(head_pose_obj.loading_time))
+    log_obj.info("[Info]: Facial landmarks detection model loading time: {:.3f} ms".format(landmarks_obj.loading_time))
+    log_obj.info("[Info]: Gaze estimation model loading time: {:.3f} ms".format(gaze_estimation_obj.loading_time))
+    log_obj.info("[Info]: Total model loading time: {:.3f} ms ({} of {} from cache)".format(total_loading_time,
+                 sum([model.loaded_from_cache for model in models]), len(models)))
+    log_obj.info("[Info]: Model warm up time: {}".format(", ".join(["{} {:.3f} ms".format(model.model_type, model.warm_up_time)
+                                                                  for model in models])))
+    log_obj.info("[Info]: Time to first result: {:.3f} ms".format(time_to_first_result))
     log_obj.info("")
-    log_obj.info("[Info]: Face detection model loading time: {:.3f} ms".format(face_detection_loading_time*1000))
-    log_obj.info("[Info]: Head pose model loading time: {:.3f} ms".format(head_pose_loading_time*1000))
-    log_obj.info("[Info]: Facial landmarks detection model loading time: {:.3f} ms".format(landmarks_detection_loading_time*1000))
-    log_obj.info("[Info]: Gaze estimation model loading time: {:.3f} ms".format(gaze_estimation_loading_time*1000))
+    log_obj.info("[Info]: Average  per frame total processing time : {:.3f} ms".format(REGISTRY.histogram(RESULT_INTERVAL).mean()))
+    log_obj.info("[Info]: Average face inferencing  time: {:.3f} ms".format(
+                 REGISTRY.histogram(STAGE_LATENCY, stage="infer", model=face_detection_obj.model_type).mean()))
+    log_obj.info("[Info]: Average head pose  inferencing  time: {:.3f} ms".format(
+                 REGISTRY.histogram(STAGE_LATENCY, stage="infer", model=head_pose_obj.model_type).mean()))
+    log_obj.info("[Info]: Average facial landmarks inferencing  time: {:.3f} ms".format(
+                 REGISTRY.histogram(STAGE_LATENCY, stage="infer", model=landmarks_obj.model_type).mean()))
+    log_obj.info("[Info]: Average gaze estimate  time: {:.3f} ms".format(
+                 REGISTRY.histogram(STAGE_LATENCY, stage="infer", model=gaze_estimation_obj.model_type).mean()))
     log_obj.info("")
-    log_obj.info("[Info]: Average  per frame total processing time : {:.3f} ms".format(frame_processing_time/frame_counter))
-    log_obj.info("[Info]: Average face inferencing  time: {:.3f} ms".format(total_face_inf_time/frame_counter)) 
-    log_obj.info("[Info]: Average head pose  inferencing  time: {:.3f} ms".format(total_head_inf_time/frame_counter))
-    log_obj.info("[Info]: Average facial landmarks inferencing  time: {:.3f} ms".format(total_lanmarks_inf_time/frame_counter))
-    log_obj.info("[Info]: Average gaze estimate  time: {:.3f} ms".format(total_gaze_inf_time/frame_counter))
+    for line in REGISTRY.summary():
+        log_obj.info("[Info]: " + line)
+    if face_tracker is not None:
+        tracker_stats = face_tracker.stats()
+        log_obj.info("[Info]: Face detection ran on {} of {} frames ({:.1f}%), drift re-detections: {}, scene cuts: {}".format(
+                     tracker_stats["detections"], tracker_stats["frames"], tracker_stats["detection_rate"] * 100,
+                     tracker_stats["drift_detections"], tracker_stats["scene_cut_detections"]))
+    if change_detector is not None:
+        change_stats = change_detector.stats()
+        log_obj.info("[Info]: Change gate skipped {} of {} frames ({:.1f}%), stale refreshes: {}".format(
+                     change_stats["skipped_frames"], change_stats["frames"], change_stats["skip_rate"] * 100,
+                     change_stats["stale_refreshes"]))
+    if roi_cache is not None:
+        cache_stats = roi_cache.stats()
+        log_obj.info("[Info]: ROI cache served {} of {} faces ({:.1f}%), forced refreshes: {}, evictions: {}".format(
+                     cache_stats["hits"], cache_stats["hits"] + cache_stats["misses"], cache_stats["hit_rate"] * 100,
+                     cache_stats["refreshes"], cache_stats["evictions"]))
+    if governor is not None:
+        log_obj.info("[Info]: Latency governor: {} degrade and {} recover steps, final stride {}, detection interval {}, display every {} frames".format(
+                     governor.degrade_steps, governor.recover_steps, governor.stride(), governor.detection_interval(),
+                     governor.display_interval))
+    if mouse_actuator is not None:
+        log_obj.info("")
+        mouse_stats = mouse_actuator.stats()
+        log_obj.info("[Info]: Mouse updates applied: {} dropped: {}".format(mouse_stats["applied_updates"], mouse_stats["dropped_updates"]))
+        log_obj.info("[Info]: Mouse update queue age average: {:.3f} ms max: {:.3f} ms".format(mouse_stats["average_queue_age_ms"], mouse_stats["max_queue_age_ms"]))
+        if gaze_filter is not None:
+            filter_stats = gaze_filter.stats()
+            log_obj.info("[Info]: Gaze filter removed {:.1f}% of the frame to frame gaze movement, average extrapolation: {:.3f} ms".format(
+                         filter_stats["jitter_reduction"] * 100, mouse_stats["average_extrapolation_ms"]))
 
 
 if __name__ == '__main__':
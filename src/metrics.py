@@ -0,0 +1,245 @@
+'''
+Instrumentation: fixed memory latency histograms, a Prometheus text endpoint
+and a periodic log summary.
+
+Latencies are measured with the monotonic time.perf_counter() clock and stored
+in histograms with fixed bucket bounds, so memory does not grow with the run
+time. Every histogram is identified by its name and labels.
+
+Sample usage:
+    with REGISTRY.span(STAGE_LATENCY, stage="infer", model="FACE"):
+        request.infer()
+    REGISTRY.observe(FRAME_LATENCY, 21.4)
+    REGISTRY.register_callback("capture_dropped_frames_total", lambda: feeder.dropped_frames, "counter")
+
+    MetricsServer(REGISTRY, 9090).start()      # http://localhost:9090/metrics
+    SummaryLogger(REGISTRY, 10).start()        # log p50/p95/p99 every 10 s
+'''
+import time
+import bisect
+import threading
+import logging as log
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency of one stage (capture, preprocess, infer, postprocess, render, actuate)
+STAGE_LATENCY = "pointer_stage_latency_ms"
+# Latency of a whole frame, from its submission to the pipeline to its result
+FRAME_LATENCY = "pointer_frame_latency_ms"
+# Age of a result, from the capture of its frame to the result
+FRAME_AGE = "pointer_frame_age_ms"
+# Time between consecutive results handed to the application
+RESULT_INTERVAL = "pointer_result_interval_ms"
+
+# Upper bounds of the histogram buckets in ms, the last bucket is +Inf
+BUCKET_BOUNDS = [0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150, 250, 500, 1000, 2500]
+
+
+class Histogram:
+    '''
+    Latency histogram with fixed buckets
+    '''
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] = self.counts[index] + 1
+            self.count = self.count + 1
+            self.sum = self.sum + value
+            self.max = max(self.max, value)
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.sum / self.count
+
+    def quantile(self, q):
+        '''
+        Estimate a quantile by linear interpolation inside its bucket
+        '''
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+            maximum = self.max
+        if total == 0:
+            return 0.0
+
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else maximum
+                upper = min(upper, maximum)
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative = cumulative + count
+        return maximum
+
+
+class MetricsRegistry:
+    '''
+    Holds the histograms and the callback metrics of the process
+    '''
+
+    def __init__(self):
+        self.histograms = {}
+        self.callbacks = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        '''
+        Observe the time spent in the with block, in ms
+        '''
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start_time) * 1000, **labels)
+
+    def register_callback(self, name, function, metric_type="gauge"):
+        '''
+        Export the value returned by function() when metrics are collected
+        '''
+        with self.lock:
+            self.callbacks[name] = (function, metric_type)
+
+    def render_prometheus(self):
+        '''
+        Return all metrics in the Prometheus text exposition format
+        '''
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            callbacks = sorted(self.callbacks.items())
+
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append("# TYPE {} histogram".format(name))
+                typed.add(name)
+            with histogram.lock:
+                counts = list(histogram.counts)
+                total = histogram.count
+                total_sum = histogram.sum
+
+            label_text = ",".join('{}="{}"'.format(key, value) for key, value in labels)
+            separator = "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ["+Inf"], counts):
+                cumulative = cumulative + count
+                lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, label_text, separator, bound, cumulative))
+            label_block = "{" + label_text + "}" if label_text else ""
+            lines.append("{}_sum{} {}".format(name, label_block, total_sum))
+            lines.append("{}_count{} {}".format(name, label_block, total))
+
+        for name, (function, metric_type) in callbacks:
+            try:
+                value = float(function())
+            except Exception as e:
+                log.debug("Metric {} failed: {}".format(name, e))
+                continue
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            lines.append("{} {}".format(name, value))
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        '''
+        Return one line per histogram with count, mean and tail latencies
+        '''
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+
+        lines = []
+        for (name, labels), histogram in histograms:
+            if histogram.count == 0:
+                continue
+            label_text = "".join(" {}={}".format(key, value) for key, value in labels)
+            lines.append("{}{}: n={} mean={:.3f} p50={:.3f} p95={:.3f} p99={:.3f} max={:.3f} ms".format(
+                         name, label_text, histogram.count, histogram.mean(), histogram.quantile(0.5),
+                         histogram.quantile(0.95), histogram.quantile(0.99), histogram.max))
+        return lines
+
+
+# Registry shared by the whole process
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    '''
+    Serves the registry on http://<host>:<port>/metrics from a daemon thread
+    '''
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry_ref.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SummaryLogger:
+    '''
+    Logs the registry summary periodically from a daemon thread
+    '''
+
+    def __init__(self, registry, interval):
+        self.registry = registry
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='metrics-log', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for line in self.registry.summary():
+                log.info("[Metrics]: " + line)
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,288 @@
+'''
+Mock inference backend for load testing the pipeline without OpenVINO.
+
+The four models are recognized by their IR file name. Each executable network
+returns outputs of the real shapes and value ranges: one or two faces from face
+detection, small head pose angles, landmarks placed on a face and a gaze
+vector, with a little deterministic jitter. Inference latency is drawn from a
+per model distribution, and an infer request only completes once its latency
+has passed, so asynchronous scheduling behaves like on a real device while no
+CPU is used for inference.
+
+Requests of all networks loaded on a device share its timeline: a device runs
+as many inferences at a time as it has streams (1 by default) and the others
+queue behind them, so N parallel requests take N times as long as one, as on
+a real device, instead of completing together.
+
+Latency distributions are given per model type, in ms:
+    "FACE=normal:13,1.3;HEAD=const:1.6;LANDMARKS=uniform:0.5,0.8;GAZE=lognormal:1.7,0.2"
+
+    const:<ms>                    fixed latency
+    normal:<mean>,<std>           normal distribution, clipped at 0
+    lognormal:<median>,<sigma>    heavy tailed
+    uniform:<low>,<high>
+
+Sample usage:
+    set_backend(MockBackend(latency="FACE=lognormal:13,0.3", seed=1))
+'''
+import os
+import time
+import zlib
+import threading
+
+import numpy as np
+
+from backend import InferenceBackend
+
+# IR file name prefix -> model type, inputs and outputs with their shapes
+MODEL_SPECS = [("face-detection", "FACE",
+                {"data": [1, 3, 384, 672]},
+                {"detection_out": [1, 1, 200, 7]}),
+               ("head-pose-estimation", "HEAD",
+                {"data": [1, 3, 60, 60]},
+                {"angle_y_fc": [1, 1], "angle_p_fc": [1, 1], "angle_r_fc": [1, 1]}),
+               ("landmarks-regression", "LANDMARKS",
+                {"0": [1, 3, 48, 48]},
+                {"95": [1, 10, 1, 1]}),
+               ("gaze-estimation", "GAZE",
+                {"left_eye_image": [1, 3, 60, 60], "right_eye_image": [1, 3, 60, 60], "head_pose_angles": [1, 3]},
+                {"gaze_vector": [1, 3]})]
+
+# Per model latency in ms when none is given, close to the CPU FP16 numbers in the README
+DEFAULT_LATENCY = {"FACE": "normal:13.4,1.3", "HEAD": "normal:1.6,0.2",
+                   "LANDMARKS": "normal:0.66,0.07", "GAZE": "normal:1.7,0.2"}
+
+# Face boxes (normalized xmin, ymin, xmax, ymax) and confidences reported by face detection
+MOCK_FACES = [([0.40, 0.25, 0.60, 0.65], 0.99),
+              ([0.08, 0.30, 0.22, 0.58], 0.80)]
+
+# Normalized landmarks inside the face crop: eyes, nose, mouth corners
+MOCK_LANDMARKS = [0.30, 0.35, 0.70, 0.35, 0.50, 0.55, 0.35, 0.75, 0.65, 0.75]
+
+
+def parse_latency(spec):
+    '''
+    Parse "TYPE=dist:params;..." into {model type: (dist, [params])}
+    '''
+    latencies = {}
+    entries = dict(DEFAULT_LATENCY)
+    if spec:
+        for entry in spec.split(";"):
+            if entry.strip():
+                model_type, _, distribution = entry.partition("=")
+                entries[model_type.strip().upper()] = distribution.strip()
+
+    for model_type, distribution in entries.items():
+        name, _, params = distribution.partition(":")
+        latencies[model_type] = (name, [float(value) for value in params.split(",") if value])
+        if name not in ("const", "normal", "lognormal", "uniform"):
+            raise ValueError("Unknown latency distribution: {}".format(distribution))
+
+    return latencies
+
+
+def sample_latency(rng, distribution):
+    '''
+    Draw one latency in ms
+    '''
+    name, params = distribution
+    if name == "const":
+        return params[0]
+    if name == "normal":
+        return max(0.0, rng.normal(params[0], params[1]))
+    if name == "lognormal":
+        return params[0] * np.exp(rng.normal(0.0, params[1]))
+    return rng.uniform(params[0], params[1])
+
+
+class MockData:
+    def __init__(self, shape):
+        self.shape = list(shape)
+        self.precision = "FP32"
+
+
+class MockInputInfo:
+    def __init__(self, shape):
+        self.input_data = MockData(shape)
+
+    @property
+    def precision(self):
+        return self.input_data.precision
+
+    @precision.setter
+    def precision(self, precision):
+        self.input_data.precision = precision
+
+
+class MockBlob:
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+
+class MockNetwork:
+    '''
+    Network read from an IR file name, holding the shapes of its spec
+    '''
+
+    def __init__(self, model_xml):
+        name = os.path.basename(model_xml)
+        for prefix, model_type, inputs, outputs in MODEL_SPECS:
+            if name.startswith(prefix):
+                break
+        else:
+            raise RuntimeError("Mock backend does not know the model {}".format(name))
+
+        self.name = name
+        self.model_type = model_type
+        self.input_info = {input_name: MockInputInfo(shape) for input_name, shape in inputs.items()}
+        self.outputs = {output_name: MockData(shape) for output_name, shape in outputs.items()}
+        self.layers = {layer: None for layer in list(inputs) + list(outputs)}
+        self._batch_size = 1
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, batch_size):
+        self._batch_size = batch_size
+        for info in self.input_info.values():
+            info.input_data.shape[0] = batch_size
+        # Face detection reports all detections of the batch in one output
+        if self.model_type != "FACE":
+            for data in self.outputs.values():
+                data.shape[0] = batch_size
+
+
+class MockDevice:
+    '''
+    Timeline of a device running a fixed number of inferences at a time
+    '''
+
+    def __init__(self, streams=1):
+        # Time at which each stream finishes the inferences queued on it
+        self.busy_until = [0.0] * max(1, streams)
+        self.lock = threading.Lock()
+
+    def schedule(self, latency):
+        '''
+        Queue an inference of latency seconds on the stream free first,
+        return the time it completes
+        '''
+        with self.lock:
+            stream = min(range(len(self.busy_until)), key=self.busy_until.__getitem__)
+            done_time = max(time.perf_counter(), self.busy_until[stream]) + latency
+            self.busy_until[stream] = done_time
+        return done_time
+
+
+class MockInferRequest:
+    '''
+    Infer request completing after a sampled latency, queued on its device
+    '''
+
+    def __init__(self, network, rng, latency, device):
+        self.network = network
+        self.rng = rng
+        self.latency = latency
+        self.device = device
+
+        self.input_blobs = {}
+        for input_name, info in network.input_info.items():
+            dtype = np.uint8 if info.precision == "U8" else np.float32
+            self.input_blobs[input_name] = MockBlob(np.zeros(info.input_data.shape, dtype=dtype))
+        self.outputs = {output_name: np.zeros(data.shape, dtype=np.float32) for output_name, data in network.outputs.items()}
+        self.done_time = None
+
+    def async_infer(self):
+        self.done_time = self.device.schedule(sample_latency(self.rng, self.latency) / 1000)
+        self.fill_outputs()
+
+    def wait(self, timeout=-1):
+        if self.done_time is not None:
+            remaining = self.done_time - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            self.done_time = None
+        return 0
+
+    def infer(self):
+        self.async_infer()
+        self.wait()
+
+    def fill_outputs(self):
+        jitter = lambda shape, scale: self.rng.normal(0.0, scale, shape)
+        model_type = self.network.model_type
+
+        if model_type == "FACE":
+            detections = self.outputs["detection_out"]
+            detections[...] = 0
+            detections[0, 0, :, 0] = -1
+            for index, (box, confidence) in enumerate(MOCK_FACES):
+                detections[0, 0, index, :3] = [0, 1, confidence]
+                detections[0, 0, index, 3:7] = np.clip(np.array(box) + jitter(4, 0.005), 0, 1)
+
+        elif model_type == "HEAD":
+            for output_name in self.outputs:
+                self.outputs[output_name][...] = jitter(self.outputs[output_name].shape, 10.0)
+
+        elif model_type == "LANDMARKS":
+            landmarks = self.outputs["95"]
+            landmarks[...] = np.array(MOCK_LANDMARKS).reshape(1, 10, 1, 1) + jitter(landmarks.shape, 0.01)
+
+        elif model_type == "GAZE":
+            gaze = self.outputs["gaze_vector"]
+            gaze[...] = jitter(gaze.shape, 0.2)
+            gaze[:, 2] = gaze[:, 2] - 0.9
+
+
+class MockExecutableNetwork:
+    def __init__(self, network, num_requests, rng, latency, device):
+        self.input_info = network.input_info
+        self.outputs = network.outputs
+        self.requests = [MockInferRequest(network, rng, latency, device) for _ in range(num_requests)]
+
+    def export(self, model_file):
+        raise RuntimeError("Mock networks cannot be exported")
+
+
+class MockBackend(InferenceBackend):
+    '''
+    Backend returning synthetic outputs after a sampled latency
+    '''
+
+    def __init__(self, latency=None, seed=0, streams=1):
+        '''
+        latency: str, per model latency distributions, see parse_latency()
+        seed: int, makes the outputs and latencies of a run reproducible
+        streams: int, inferences a device runs at the same time
+        '''
+        self.latencies = parse_latency(latency)
+        self.seed = seed
+        self.streams = streams
+        self.devices = {}
+        self.devices_lock = threading.Lock()
+
+    def device(self, device_name):
+        with self.devices_lock:
+            if device_name not in self.devices:
+                self.devices[device_name] = MockDevice(self.streams)
+            return self.devices[device_name]
+
+    def read_network(self, model, weights):
+        return MockNetwork(model)
+
+    def query_network(self, network, device_name):
+        return {layer: device_name for layer in network.layers}
+
+    def load_network(self, network, device_name, config=None, num_requests=1):
+        # Every network gets its own generator so that loading order does not matter
+        rng = np.random.default_rng([self.seed, zlib.crc32(network.name.encode())])
+        return MockExecutableNetwork(network, num_requests, rng, self.latencies[network.model_type],
+                                     self.device(device_name))
+
+    def import_network(self, model_file, device_name, config=None, num_requests=1):
+        raise RuntimeError("Mock backend cannot import compiled networks")
+
+    def set_config(self, config, device_name):
+        pass
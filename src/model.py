@@ -4,11 +4,32 @@ This has been provided just to give you an idea of how to structure your model c
 '''
 
 import os
-import sys
-import cv2
 import time
 import logging as log
-from openvino.inference_engine import IENetwork, IECore
+from concurrent.futures import ThreadPoolExecutor
+from backend import get_backend
+from preprocessing import ImageInput, get_input_buffers
+from metrics import REGISTRY, STAGE_LATENCY
+
+
+def load_models(models, num_requests=1, model_cache=None, warm_up=False):
+    '''
+    Load several models concurrently on the shared backend
+
+    input: models - model objects to load
+           num_requests - number of infer requests per model
+           model_cache - optional ModelCache of compiled networks
+           warm_up - run one inference per infer request after loading
+    '''
+    def load(model):
+        model.load_model(num_requests, model_cache)
+        if warm_up:
+            model.warm_up()
+
+    with ThreadPoolExecutor(max_workers=len(models)) as executor:
+        futures = [executor.submit(load, model) for model in models]
+        for future in futures:
+            future.result()
 
 
 class Models:
@@ -40,43 +61,152 @@ class Models:
         self.extensions = extensions
         self.prob_threshold = None
 
+        # Frames currently owned by in-flight asynchronous requests
+        self.num_requests = 1
+        self.pending_requests = {}
+
+        # Number of images processed by one inference, set before load_model()
+        self.batch_size = 1
 
-    def load_model(self):
+        # Plugin configuration passed to load_network(), e.g. CPU streams and
+        # threads chosen by the auto-tuner, set before load_model()
+        self.config = None
+
+        # Preallocated input blob memory and image writers, one per infer request
+        self.input_buffers = []
+        self.image_inputs = []
+
+        # Time spent in load_model() in ms and whether the compiled network came from the cache
+        self.loading_time = 0
+        self.loaded_from_cache = False
+
+        # Time spent in warm_up() in ms
+        self.warm_up_time = 0
+
+
+    def load_model(self, num_requests=1, model_cache=None):
         '''
         TODO: You will need to complete this method.
         This method is for loading the model to the device specified by the user.
         If your model requires any Plugins, this is where you can load them.
+
+        input: num_requests - number of infer requests to create, more than one
+                              is needed to keep several frames in flight
+               model_cache - optional ModelCache, a cached compiled network is
+                             imported instead of reading and compiling the IR
         '''
-        self.plugin = IECore()
-        model_bin = os.path.splitext(self.model_name)[0] + ".bin"
+        start_time = time.perf_counter()
+
+        self.num_requests = num_requests
+        self.plugin = get_backend()
+
+        # Try the compiled network cache first
+        self.loaded_from_cache = False
+        if model_cache is not None:
+            blob_path = model_cache.lookup(self.model_name, self.device, self.num_requests, self.batch_size, self.config)
+            if blob_path is not None:
+                try:
+                    self.net_plugin = self.plugin.import_network(blob_path, self.device, config=self.config,
+                                                                 num_requests=self.num_requests)
+                    self.loaded_from_cache = True
+                except RuntimeError as e:
+                    log.warning("[Warning]: Failed to import cached network for {}: {}".format(self.model_name, e))
+                    model_cache.invalidate(self.model_name, self.device)
+
+        if not self.loaded_from_cache:
+            model_bin = os.path.splitext(self.model_name)[0] + ".bin"
         
-        # Read network
-        self.network = self.plugin.read_network(model=self.model_name, weights=model_bin)
+            # Read network
+            self.network = self.plugin.read_network(self.model_name, model_bin)
+
+            ### Check for supported layers ###
+            self.check_model()
+
+            ### Add any necessary extensions ###
+            ### Not needed as my local openvino is 2020.R4
 
-        ### Check for supported layers ###
-        self.check_model()
+            # Reshape the batch dimension of all inputs
+            if self.batch_size != 1:
+                self.network.batch_size = self.batch_size
 
-        ### Add any necessary extensions ###
-        ### Not needed as my local openvino is 2020.R4
+            # Image inputs take U8 directly, the conversion to the network
+            # precision happens inside the inference engine
+            for network_input in self.network.input_info.values():
+                if len(network_input.input_data.shape) == 4:
+                    network_input.precision = "U8"
 
-        ### Return the loaded inference plugin ###
-        self.net_plugin = self.plugin.load_network(self.network, self.device)
+            # Devices that cannot export fall back to the runtime's own cache
+            # where the release supports it
+            if model_cache is not None and not model_cache.device_supported(self.device):
+                model_cache.enable_runtime_cache(self.plugin, self.device)
+
+            ### Return the loaded inference plugin ###
+            self.net_plugin = self.plugin.load_network(self.network, self.device, config=self.config,
+                                                       num_requests=self.num_requests)
+
+            if model_cache is not None and model_cache.device_supported(self.device):
+                model_cache.store(self.model_name, self.device, self.num_requests, self.net_plugin,
+                                  self.batch_size, self.config)
 
         # Get the input &output layer blob
-        self.input_blob = next(iter(self.network.input_info))
-        self.output_blob = next(iter(self.network.outputs))
+        input_info = self.get_input_info()
+        self.input_blob = next(iter(input_info))
+        self.output_blob = next(iter(self.net_plugin.outputs))
 
         # Get input shape
         self.get_input_shape()
 
+        self.allocate_inputs()
+
+        self.loading_time = (time.perf_counter() - start_time) * 1000
+
         return self.net_plugin
 
+    def warm_up(self):
+        '''
+        Run one inference on zeroed inputs with every infer request, so that the
+        first frame does not pay for the allocations of the first inference
+        '''
+        start_time = time.perf_counter()
+
+        for buffers, request in zip(self.input_buffers, self.net_plugin.requests):
+            for buffer in buffers.values():
+                buffer[...] = 0
+            request.infer()
+
+        self.warm_up_time = (time.perf_counter() - start_time) * 1000
+
+    def get_input_info(self):
+        '''
+        Return the input info of the compiled network. Imported networks only
+        provide it on the executable network, older releases call it inputs.
+        '''
+        input_info = getattr(self.net_plugin, "input_info", None)
+        if input_info is None:
+            input_info = self.net_plugin.inputs
+
+        return input_info
+
+    def allocate_inputs(self):
+        '''
+        Wrap the input blobs of every infer request so that preprocessing
+        writes straight into them
+        '''
+        self.input_buffers = []
+        self.image_inputs = []
+        for request in self.net_plugin.requests:
+            buffers = get_input_buffers(request)
+            self.input_buffers.append(buffers)
+            self.image_inputs.append({name: ImageInput(buffer) for name, buffer in buffers.items() if buffer.ndim == 4})
+
     def get_input_shape(self):
         ### Set the shape of the input layer ###
 
         input_shapes = {}
-        for network_input in self.network.input_info:
-            input_shapes[network_input] = (self.network.input_info[network_input].input_data.shape)
+        input_info = self.get_input_info()
+        for network_input in input_info:
+            input_data = getattr(input_info[network_input], "input_data", input_info[network_input])
+            input_shapes[network_input] = (input_data.shape)
 
         self.input_shape = input_shapes
 
@@ -84,48 +214,102 @@ class Models:
         '''
         This method is meant for running predictions on the input image.
         '''
-        prepropossed_frame = self.preprocess_input(frame)
+        with REGISTRY.span(STAGE_LATENCY, stage="preprocess", model=self.model_type):
+            self.preprocess_input(frame)
+        request = self.net_plugin.requests[0]
         
-        start_time = time.time()
+        start_time = time.perf_counter()
+
+        request.infer()
+
+        inference_time = (time.perf_counter() - start_time) * 1000
+        REGISTRY.observe(STAGE_LATENCY, inference_time, stage="infer", model=self.model_type)
+
+        with REGISTRY.span(STAGE_LATENCY, stage="postprocess", model=self.model_type):
+            return self.preprocess_output(frame, request.outputs, threshold, inference_time) 
+
+    def predict_async(self, frame, request_id=0):
+        '''
+        Start an asynchronous inference on the input image.
+        The results are collected with get_async_output() using the same request_id.
+        '''
+        self.predict_batch_async([frame], request_id)
+
+    def get_async_output(self, threshold, request_id=0):
+        '''
+        Wait for an asynchronous inference started by predict_async() and
+        post-process its results.
+        '''
+        outputs, inference_time = self.get_batch_output(threshold, request_id)
+
+        return outputs[0]
+
+    def predict_batch_async(self, frames, request_id=0):
+        '''
+        Start one asynchronous inference on up to batch_size input images.
+        The results are collected with get_batch_output() using the same request_id.
+        '''
+        with REGISTRY.span(STAGE_LATENCY, stage="preprocess", model=self.model_type):
+            for index, frame in enumerate(frames):
+                self.image_inputs[request_id][self.input_blob].fill(frame, index)
+
+        self.pending_requests[request_id] = (frames, time.perf_counter())
+        self.net_plugin.requests[request_id].async_infer()
+
+    def get_batch_output(self, threshold, request_id=0):
+        '''
+        Wait for an asynchronous inference started by predict_batch_async() and
+        post-process the results of every image of the batch.
+
+        output: list of preprocess_output() results, inference time
+        '''
+        frames, start_time = self.pending_requests.pop(request_id)
+
+        request = self.net_plugin.requests[request_id]
+        request.wait(-1)
 
-        inference_output = self.net_plugin.infer(prepropossed_frame)
+        # From submission to completion, including the time queued behind other requests
+        inference_time = (time.perf_counter() - start_time) * 1000
+        REGISTRY.observe(STAGE_LATENCY, inference_time, stage="infer", model=self.model_type)
 
-        inference_time = (time.time() - start_time) * 1000
+        outputs = request.outputs
+        results = []
+        with REGISTRY.span(STAGE_LATENCY, stage="postprocess", model=self.model_type):
+            for index, frame in enumerate(frames):
+                # Post-processing works on the size of the image it was given
+                self.image_height = frame.shape[0]
+                self.image_width  = frame.shape[1]
+
+                batch_outputs = {name: output[index:index + 1] for name, output in outputs.items()}
+                results.append(self.preprocess_output(frame, batch_outputs, threshold, inference_time))
+
+        return results, inference_time
 
-        return self.preprocess_output(frame, inference_output, threshold, inference_time) 
- 
     def check_model(self):
         '''
         Check for supported layers
         '''
 
         # Check supported layers
-        supported_layers = self.plugin.query_network(network=self.network, device_name=self.device)
+        supported_layers = self.plugin.query_network(self.network, self.device)
 
         unsupported_layers = [l for l in self.network.layers.keys() if l not in supported_layers]
         if len(unsupported_layers) != 0:
             print("Unsupported layers found: {}".format(unsupported_layers))
-            print("Check whether extensions are available to add to IECore.")
+            print("Check whether extensions are available to add to the inference engine.")
             exit(1)
    
-    def preprocess_input(self, frame):
+    def preprocess_input(self, frame, request_id=0):
         '''
-        Preprocess the raw input frame to prepare for inferencing
+        Preprocess the raw input frame to prepare for inferencing.
+        The frame is written into the preallocated input blob of the request.
         '''
 
         self.image_height = frame.shape[0]
         self.image_width  = frame.shape[1]
-        preprossed_frame = cv2.resize(frame, (self.input_shape[self.input_blob][3], self.input_shape[self.input_blob][2]))
-        preprossed_frame = preprossed_frame.transpose((2,0,1))
-        b  = 1
-        c  = preprossed_frame.shape[0]
-        h  = preprossed_frame.shape[1]
-        w  = preprossed_frame.shape[2]
-        preprossed_frame   = preprossed_frame.reshape(b, c, h, w)
-
-        preprossed_network = {self.input_blob:preprossed_frame}
+        self.image_inputs[request_id][self.input_blob].fill(frame)
 
-        return preprossed_network
+        return self.input_buffers[request_id]
 
 
     def preprocess_output(self, frame, outputs, threshold, inference_time):
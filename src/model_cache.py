@@ -0,0 +1,230 @@
+'''
+Disk cache of compiled networks.
+
+A network compiled for a device is exported to a blob file, which later runs
+import instead of reading and compiling the IR again. Blobs are keyed by the
+model path, a hash of the IR files, the device, the precision, the batch size,
+the number of infer requests and the plugin configuration, so a changed IR
+automatically misses the cache. The stale
+blob of a changed IR is deleted when its replacement is stored.
+
+Devices whose plugin cannot export are remembered, and the inference engine's
+built-in CACHE_DIR cache is used for them instead when the release has one.
+
+Several processes may share the cache directory (e.g. offline_batch workers).
+Every change to the index is applied to the index as it is on disk at that
+moment, read again under a file lock, so the processes do not drop each
+other's entries.
+
+Sample usage:
+    cache = ModelCache('~/.cache/pointer_controller')
+    blob_path = cache.lookup(model_xml, 'CPU', num_requests)
+    ...
+    cache.store(model_xml, 'CPU', num_requests, exec_net)
+'''
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging as log
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks on Windows, index changes are still merged but not serialized
+    fcntl = None
+
+INDEX_FILE = "index.json"
+
+# Part of every cache key, bump it when the way networks are prepared before
+# compiling changes (e.g. input precision) so older blobs are not reused
+CACHE_FORMAT = "2"
+
+
+class ModelCache:
+    '''
+    Compiled network cache stored in a directory
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.runtime_cache_devices = set()
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        self.lock_path = os.path.join(self.cache_dir, INDEX_FILE + ".lock")
+        self.index = self.read_index()
+
+    def read_index(self):
+        index = {"files": {}, "blobs": {}, "unsupported_devices": []}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as index_file:
+                    index.update(json.load(index_file))
+            except (OSError, ValueError):
+                log.warning("[Warning]: Model cache index is corrupted, starting a new one")
+        return index
+
+    def update_index(self, change):
+        '''
+        Apply change(index) to the index on disk and save it, holding the file
+        lock so that no other process saves its index in between
+        '''
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = self.read_index()
+                # The file hashes of this process stay valid, they are checked by size and mtime
+                index["files"].update(self.index["files"])
+                change(index)
+                self.index = index
+                self.save_index()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save_index(self):
+        # Processes sharing the cache directory each write their own temporary
+        # file, so the index is always replaced by a complete one
+        fd, temp_path = tempfile.mkstemp(prefix=INDEX_FILE + ".", suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "w") as index_file:
+                json.dump(self.index, index_file, indent=2)
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def file_hash(self, path):
+        '''
+        Return the sha256 of a file. Hashes are remembered by size and mtime
+        so unchanged files are not read again.
+        '''
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.index["files"].get(path)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["sha256"]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as model_file:
+            for chunk in iter(lambda: model_file.read(1 << 20), b""):
+                sha.update(chunk)
+
+        self.index["files"][path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha.hexdigest()}
+        return sha.hexdigest()
+
+    def cache_key(self, model_xml, device, num_requests, batch_size=1, config=None):
+        '''
+        Return (slot, key): the slot identifies the model path and device, the
+        key additionally identifies the IR content, precision, batch size,
+        request count and plugin configuration
+        '''
+        model_xml = os.path.abspath(model_xml)
+        model_bin = os.path.splitext(model_xml)[0] + ".bin"
+        precision = os.path.basename(os.path.dirname(model_xml))
+
+        slot = "{}|{}".format(model_xml, device)
+        key_source = "|".join([CACHE_FORMAT, model_xml, self.file_hash(model_xml), self.file_hash(model_bin),
+                               device, precision, str(batch_size), str(num_requests),
+                               json.dumps(config or {}, sort_keys=True)])
+
+        return slot, hashlib.sha256(key_source.encode()).hexdigest()
+
+    def device_supported(self, device):
+        return device not in self.index["unsupported_devices"]
+
+    def enable_runtime_cache(self, core, device):
+        '''
+        Point the inference engine's built-in cache (CACHE_DIR) at the cache
+        directory for devices that cannot export compiled networks
+        '''
+        with self.lock:
+            if device in self.runtime_cache_devices:
+                return
+            self.runtime_cache_devices.add(device)
+            try:
+                core.set_config({"CACHE_DIR": os.path.join(self.cache_dir, "runtime")}, device)
+            except RuntimeError as e:
+                log.info("[Info]: {} has no built-in model cache: {}".format(device, e))
+
+    def lookup(self, model_xml, device, num_requests, batch_size=1, config=None):
+        '''
+        Return the path of the compiled blob for the model or None on a miss
+        '''
+        if not self.device_supported(device):
+            return None
+
+        with self.lock:
+            slot, key = self.cache_key(model_xml, device, num_requests, batch_size, config)
+            entry = self.index["blobs"].get(slot)
+
+        if entry is None or entry["key"] != key:
+            return None
+
+        blob_path = os.path.join(self.cache_dir, entry["blob"])
+        if not os.path.exists(blob_path):
+            return None
+
+        return blob_path
+
+    def store(self, model_xml, device, num_requests, exec_net, batch_size=1, config=None):
+        '''
+        Export a compiled network to the cache and drop the blob it replaces
+        '''
+        with self.lock:
+            slot, key = self.cache_key(model_xml, device, num_requests, batch_size, config)
+        blob_name = key + ".blob"
+        blob_path = os.path.join(self.cache_dir, blob_name)
+
+        # Exported under a unique name first, another process may be storing the same blob
+        fd, temp_path = tempfile.mkstemp(prefix=blob_name + ".", suffix=".tmp", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            exec_net.export(temp_path)
+            os.replace(temp_path, blob_path)
+        except (RuntimeError, AttributeError) as e:
+            # Not every plugin can export compiled networks, don't try again
+            log.warning("[Warning]: {} cannot export compiled networks: {}".format(device, e))
+
+            def add_unsupported_device(index):
+                if device not in index["unsupported_devices"]:
+                    index["unsupported_devices"].append(device)
+
+            with self.lock:
+                self.update_index(add_unsupported_device)
+            return
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        def replace_entry(index):
+            old_entry = index["blobs"].get(slot)
+            if old_entry is not None and old_entry["blob"] != blob_name:
+                old_blob_path = os.path.join(self.cache_dir, old_entry["blob"])
+                if os.path.exists(old_blob_path):
+                    os.remove(old_blob_path)
+
+            index["blobs"][slot] = {"key": key, "blob": blob_name}
+
+        with self.lock:
+            self.update_index(replace_entry)
+
+    def invalidate(self, model_xml, device):
+        '''
+        Forget the blob of a model, e.g. after it failed to import
+        '''
+        slot = "{}|{}".format(os.path.abspath(model_xml), device)
+
+        def remove_entry(index):
+            entry = index["blobs"].pop(slot, None)
+            if entry is not None:
+                blob_path = os.path.join(self.cache_dir, entry["blob"])
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+
+        with self.lock:
+            self.update_index(remove_entry)
@@ -2,23 +2,200 @@
 This is a sample class that you can use to control the mouse pointer.
 It uses the pyautogui library. You can set the precision for mouse movement
 (how much the mouse moves) and the speed (how fast it moves) by changing 
-precision_dict and speed_dict.
+PRECISIONS and SPEEDS.
 Calling the move function with the x and y output of the gaze estimation model
 will move the pointer.
 This class is provided to help get you started; you can choose whether you want to use it or create your own from scratch.
+
+MouseActuator runs the movements on its own thread so that they never block
+the inference loop:
+    actuator=MouseActuator(MouseController('medium', 'fast'))
+    actuator.start()
+    actuator.update(gaze_x, gaze_y)
+    actuator.stop()
+
+With a gaze velocity and the time the frame was taken, the target is
+extrapolated to the moment the thread picks it up, which hides part of the
+pipeline latency:
+    actuator.update(gaze_x, gaze_y, velocity=(vx, vy), timestamp=result.capture_time)
 '''
-import pyautogui
+import time
+import threading
+import logging as log
+
+from metrics import REGISTRY, STAGE_LATENCY
+
+# Pixels moved per unit of gaze, and seconds a move takes
+PRECISIONS = {'high':100, 'low':1000, 'medium':500}
+SPEEDS = {'fast':1, 'slow':10, 'medium':5}
+
+# pyautogui connects to the display when imported, so it is only imported
+# once a MouseController is created
+pyautogui = None
+
+
+def load_pyautogui():
+    global pyautogui
+    if pyautogui is None:
+        import pyautogui as module
+        pyautogui = module
+    return pyautogui
+
 
 class MouseController:
     def __init__(self, precision, speed):
-        precision_dict={'high':100, 'low':1000, 'medium':500}
-        speed_dict={'fast':1, 'slow':10, 'medium':5}
+        load_pyautogui()
 
-        self.precision=precision_dict[precision]
-        self.speed=speed_dict[speed]
+        self.precision=PRECISIONS[precision]
+        self.speed=SPEEDS[speed]
 
     def move(self, x, y):
         pyautogui.moveRel(x*self.precision, -1*y*self.precision, duration=self.speed)
 
+    def step(self, dx, dy):
+        '''
+        Move the pointer by whole pixels immediately, without the pyautogui pause
+        '''
+        pyautogui.moveRel(dx, dy, duration=0, _pause=False)
+
     def init_position(self):
-        pyautogui.moveTo( pyautogui.size()[0]/4, pyautogui.size()[1]/4)   
+        pyautogui.moveTo( pyautogui.size()[0]/4, pyautogui.size()[1]/4)
+
+
+class MouseActuator:
+    '''
+    Moves the mouse pointer towards the latest gaze target on a separate thread.
+
+    Only the most recent target is kept: a target that is replaced before the
+    thread picked it up is dropped. The movement to a target is spread over the
+    controller speed in small steps issued at a fixed rate. Movement left over
+    from the previous target is added to the new one, so every target picked
+    up moves the pointer as far as a blocking move() would.
+    '''
+
+    def __init__(self, mouse_controller, rate=100, max_extrapolation=0.1):
+        '''
+        mouse_controller: MouseController used to move the pointer
+        rate: int, number of movement steps per second
+        max_extrapolation: float, longest time in seconds a target is extrapolated
+        '''
+        self.mouse_controller = mouse_controller
+        self.interval = 1.0 / rate
+        self.max_extrapolation = max_extrapolation
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.running = False
+
+        # Latest target not yet picked up by the thread:
+        # (x, y, update time, velocity, frame time)
+        self.pending_target = None
+
+        # Movement still to be done for the current target, in pixels
+        self.remaining_x = 0.0
+        self.remaining_y = 0.0
+        self.remaining_steps = 0
+
+        # Metrics
+        self.received_updates = 0
+        self.dropped_updates = 0
+        self.applied_updates = 0
+        self.total_queue_age = 0.0
+        self.max_queue_age = 0.0
+        self.total_extrapolation = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='mouse', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def update(self, x, y, velocity=None, timestamp=None):
+        '''
+        Set a new gaze target. Never blocks.
+        velocity: optional (vx, vy) of the gaze per second
+        timestamp: perf_counter capture time of the frame the target was estimated from
+        '''
+        with self.lock:
+            if self.pending_target is not None:
+                self.dropped_updates = self.dropped_updates + 1
+            self.pending_target = (x, y, time.perf_counter(), velocity, timestamp)
+            self.received_updates = self.received_updates + 1
+        self.wakeup.set()
+
+    def run(self):
+        '''
+        Actuation thread: pick up the latest target and step towards it
+        '''
+        while self.running:
+            with self.lock:
+                target = self.pending_target
+                self.pending_target = None
+
+            if target is not None:
+                x, y, update_time, velocity, timestamp = target
+                now = time.perf_counter()
+                queue_age = now - update_time
+
+                # Move to where the gaze is expected to be now, not where it was in the frame
+                if velocity is not None and timestamp is not None:
+                    horizon = min(max(0.0, now - timestamp), self.max_extrapolation)
+                    x = x + velocity[0] * horizon
+                    y = y + velocity[1] * horizon
+                    self.total_extrapolation = self.total_extrapolation + horizon
+                self.total_queue_age = self.total_queue_age + queue_age
+                self.max_queue_age = max(self.max_queue_age, queue_age)
+                self.applied_updates = self.applied_updates + 1
+
+                # The movement not yet done for the previous target is carried over
+                self.remaining_x = self.remaining_x + x * self.mouse_controller.precision
+                self.remaining_y = self.remaining_y - y * self.mouse_controller.precision
+                self.remaining_steps = max(1, int(self.mouse_controller.speed / self.interval))
+
+            if self.remaining_steps == 0:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            # Move by the whole pixels of this step, the fraction is carried over
+            dx = int(self.remaining_x / self.remaining_steps)
+            dy = int(self.remaining_y / self.remaining_steps)
+            self.remaining_x = self.remaining_x - dx
+            self.remaining_y = self.remaining_y - dy
+            self.remaining_steps = self.remaining_steps - 1
+
+            if dx != 0 or dy != 0:
+                try:
+                    with REGISTRY.span(STAGE_LATENCY, stage="actuate"):
+                        self.mouse_controller.step(dx, dy)
+                except pyautogui.FailSafeException as e:
+                    log.warning("[Warning]: Mouse movement stopped: " + str(e))
+                    self.remaining_x = 0.0
+                    self.remaining_y = 0.0
+                    self.remaining_steps = 0
+
+            time.sleep(self.interval)
+
+    def stats(self):
+        '''
+        Return the actuation metrics
+        '''
+        average_queue_age = 0.0
+        average_extrapolation = 0.0
+        if self.applied_updates > 0:
+            average_queue_age = self.total_queue_age / self.applied_updates
+            average_extrapolation = self.total_extrapolation / self.applied_updates
+
+        return {"received_updates": self.received_updates,
+                "dropped_updates": self.dropped_updates,
+                "applied_updates": self.applied_updates,
+                "average_queue_age_ms": average_queue_age * 1000,
+                "max_queue_age_ms": self.max_queue_age * 1000,
+                "average_extrapolation_ms": average_extrapolation * 1000
+               }
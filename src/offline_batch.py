@@ -0,0 +1,339 @@
+"""Offline batch processing by segment sharding
+
+Splits a recorded video into contiguous segments and processes every segment in
+a pool of worker processes, so throughput scales with the number of cores
+instead of being bound to one in-order pipeline. Each worker seeks to its
+segment, writes the per-frame results of the segment to a temporary part file,
+and the parts are concatenated in segment order into one timeline file with
+global frame ids.
+
+A seek lands on the frame whose timestamp matches the requested frame at the
+average frame rate, which is a frame early when the frame durations vary. So
+the workers first count the frames between the points their seeks land on,
+which gives the exact index of every landing point, and each segment then
+grabs forward from its landing point to the next multiple of the frame
+stride. Exactly the frames a single pass would process are processed. Face
+tracking and change detection start fresh in each segment.
+
+The models are compiled once up front into the model cache, and every worker
+loads them once, from the cache, for all the segments it processes. The CPU
+threads are split between the workers to avoid oversubscription.
+
+> python3 offline_batch.py -i recording.mp4 -o results.jsonl -w 8 -fdm ... -hpm ... -flm ... -gem ...
+"""
+
+import os
+import time
+import shutil
+import multiprocessing
+import logging as log
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from backend import BACKENDS, create_backend, set_backend
+
+
+def build_argparser():
+    """
+    Parse command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument("-fdm", "--facedetectionmodel", required=True, type=str,
+                        help="Face detection model.")
+    parser.add_argument("-hpm", "--headposemodel", required=True, type=str,
+                        help="Head pose model.")
+    parser.add_argument("-flm", "--facelandmarksnmodel", required=True, type=str,
+                        help="Face landmarks model.")
+    parser.add_argument("-gem", "--gazeestimationmodel", required=True, type=str,
+                        help="Gaze estimation model.")
+    parser.add_argument("-i", "--input", required=True, type=str,
+                        help="Path to the video file")
+    parser.add_argument("-o", "--output_results", required=True, type=str,
+                        help="Timeline file: binary records for .bin files, "
+                             "JSON lines otherwise")
+    parser.add_argument("-d", "--device", type=str, default="CPU",
+                        help="Specify the target device to infer on (CPU by default)")
+    parser.add_argument("-pt", "--prob_threshold", type=float, default=0.5,
+                        help="Probability threshold for detections filtering"
+                        "(0.5 by default)")
+    parser.add_argument("-mc", "--model_cache", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".cache", "pointer_controller"),
+                        help="Directory caching compiled networks between runs. "
+                             "Use NONE to disable the cache")
+    parser.add_argument("-fs", "--frame_stride", type=int, default=10,
+                        help="Process every n-th frame of the input (10 by default)")
+    parser.add_argument("-mf", "--max_faces", type=int, default=1,
+                        help="Maximum number of faces processed per frame (1 by default)")
+    parser.add_argument("-ti", "--track_interval", type=int, default=0,
+                        help="Run face detection only every n frames of each "
+                             "segment (0 runs it on every frame)")
+    parser.add_argument("-am", "--async_mode", action="store_true",
+                        help="Pipeline the models with asynchronous inference "
+                             "inside each worker")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (number of CPUs by default)")
+    parser.add_argument("-sg", "--segments", type=int, default=0,
+                        help="Number of segments, more than workers balances "
+                             "uneven segments (4 per worker by default)")
+    parser.add_argument("-be", "--backend", type=str, default="openvino", choices=BACKENDS,
+                        help="Inference backend. 'mock' returns synthetic outputs "
+                             "after sampled latencies, without OpenVINO or IR files "
+                             "(openvino by default)")
+    parser.add_argument("-ml", "--mock_latency", type=str, default=None,
+                        help="Latency distributions of the mock backend in ms, e.g. "
+                             "'FACE=normal:13,1.3;HEAD=const:1.6;GAZE=lognormal:1.7,0.2'")
+    parser.add_argument("-ms", "--mock_seed", type=int, default=0,
+                        help="Random seed of the mock backend (0 by default)")
+    parser.add_argument("-mt", "--mock_streams", type=int, default=1,
+                        help="Inferences the mock device runs at the same time, "
+                             "further requests queue behind them (1 by default)")
+    return parser
+
+
+def split_segments(frame_count, segment_count, stride):
+    '''
+    Return (start_frame, end_frame) of contiguous segments covering the video,
+    with boundaries on multiples of the stride
+    '''
+    strides = (frame_count + stride - 1) // stride
+    segment_count = max(1, min(segment_count, strides))
+
+    segments = []
+    for index in range(segment_count):
+        start_frame = strides * index // segment_count * stride
+        end_frame = strides * (index + 1) // segment_count * stride
+        if index == segment_count - 1:
+            end_frame = frame_count
+        if end_frame > start_frame:
+            segments.append((start_frame, end_frame))
+    return segments
+
+
+def create_models(args, config=None):
+    from face_detection import FaceDetectionModel
+    from head_pose import HeadPoseModel
+    from landmarks import LandmarksModel
+    from gaze_estimation import GazeEstimationModel
+
+    models = [FaceDetectionModel(args.facedetectionmodel, args.device),
+              HeadPoseModel(args.headposemodel, args.device),
+              LandmarksModel(args.facelandmarksnmodel, args.device),
+              GazeEstimationModel(args.gazeestimationmodel, args.device)]
+
+    # Faces of a frame are batched through the per face models
+    for model in models[1:]:
+        model.batch_size = args.max_faces
+    for model in models:
+        model.config = config
+
+    return models
+
+
+def worker_config(args):
+    '''
+    Plugin configuration giving each worker its share of the CPU threads
+    '''
+    if args.device != "CPU":
+        return None
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    return {"CPU_THREADS_NUM": str(threads), "CPU_THROUGHPUT_STREAMS": "1", "CPU_BIND_THREAD": "NO"}
+
+
+def open_model_cache(args):
+    from model_cache import ModelCache
+
+    # Mock networks are not compiled
+    if args.model_cache.upper() == 'NONE' or args.backend != 'openvino':
+        return None
+    return ModelCache(args.model_cache)
+
+
+def count_segment(path, start_frame, end_frame, frame_count):
+    '''
+    Worker: count the frames from where a seek to start_frame lands up to where
+    a seek to end_frame lands (the end of the video when it is frame_count)
+    '''
+    end_time = None
+    if end_frame < frame_count:
+        cap = cv2.VideoCapture(path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, end_frame)
+        if cap.grab():
+            end_time = cap.get(cv2.CAP_PROP_POS_MSEC)
+        cap.release()
+
+    cap = cv2.VideoCapture(path)
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    count = 0
+    while cap.grab():
+        if end_time is not None and cap.get(cv2.CAP_PROP_POS_MSEC) >= end_time:
+            break
+        count = count + 1
+    cap.release()
+
+    return count
+
+
+def locate_segments(segments, counts, stride):
+    '''
+    Place the segments on the frames a single pass reads, from the frame counts
+    of count_segment()
+
+    output: (seek point, start frame, end frame) of each segment, see InputFeeder
+    '''
+    landed_frames = [0]
+    for count in counts:
+        landed_frames.append(landed_frames[-1] + count)
+
+    # Each segment starts at the first multiple of the stride from its landing
+    # point and ends where the next one starts
+    start_frames = [(landed_frame + stride - 1) // stride * stride for landed_frame in landed_frames[:-1]]
+    end_frames = start_frames[1:] + [landed_frames[-1]]
+
+    return [((seek_frame, landed_frame), start_frame, end_frame) for (seek_frame, _), landed_frame, start_frame, end_frame
+            in zip(segments, landed_frames, start_frames, end_frames)]
+
+
+# Models of a worker process, loaded once by init_worker() for all its segments
+worker_models = None
+
+
+def init_worker(args):
+    '''
+    Worker initializer: load the models the segments of the worker run on
+    '''
+    global worker_models
+    from model import load_models
+    from pipeline import ASYNC_NUM_REQUESTS
+
+    if args.backend != 'openvino':
+        set_backend(create_backend(args.backend, latency=args.mock_latency, seed=args.mock_seed,
+                                   streams=args.mock_streams))
+
+    num_requests = ASYNC_NUM_REQUESTS if args.async_mode else 1
+    worker_models = create_models(args, worker_config(args))
+    load_models(worker_models, num_requests, open_model_cache(args))
+
+
+def process_segment(args, segment_index, seek_point, start_frame, end_frame, part_path):
+    '''
+    Worker: run the pipeline on one segment and write its results to part_path
+
+    output: number of frames processed
+    '''
+    from input_feeder import InputFeeder
+    from face_tracker import FaceTracker
+    from result_sink import open_result_sink
+    from pipeline import Pipeline, ASYNC_FRAMES_RETAINED
+
+    retain = ASYNC_FRAMES_RETAINED if args.async_mode else 1
+    feeder = InputFeeder(input_type='video', input_file=args.input, stride=args.frame_stride,
+                         retain=retain, start_frame=start_frame, end_frame=end_frame, seek_point=seek_point)
+
+    face_tracker = None
+    if args.track_interval > 0:
+        face_tracker = FaceTracker(detection_interval=args.track_interval)
+
+    pipeline = Pipeline(*worker_models, args.prob_threshold, async_mode=args.async_mode, tracker=face_tracker)
+
+    # Frame ids continue the timeline of the segments before this one
+    first_frame_id = start_frame // args.frame_stride
+
+    frame_count = 0
+    sink = open_result_sink(part_path)
+    feeder.load_data()
+    try:
+        for result in pipeline.run(feeder.next_batch()):
+            result.frame_id = first_frame_id + result.frame_id
+            sink.write(result, result.latency)
+            frame_count = frame_count + 1
+    finally:
+        sink.close()
+        feeder.close()
+
+    return frame_count
+
+
+def merge_parts(part_paths, output_path):
+    '''
+    Concatenate the part files in segment order and delete them, keeping only
+    the file header of the first binary part
+    '''
+    from result_sink import FILE_HEADER
+
+    with open(output_path, "wb") as output_file:
+        for index, part_path in enumerate(part_paths):
+            with open(part_path, "rb") as part_file:
+                if index > 0 and output_path.endswith(".bin"):
+                    part_file.seek(FILE_HEADER.size)
+                shutil.copyfileobj(part_file, output_file)
+            os.remove(part_path)
+
+
+def main():
+    args = build_argparser().parse_args()
+    log.basicConfig(level=log.INFO, format="%(message)s")
+
+    if not os.path.exists(args.input):
+        log.error("Video file {} not found! Exiting....".format(args.input))
+        exit(1)
+
+    cap = cv2.VideoCapture(args.input)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if frame_count <= 0:
+        log.error("Cannot determine the frame count of {}! Exiting....".format(args.input))
+        exit(1)
+
+    segment_count = args.segments if args.segments > 0 else args.workers * 4
+    segments = split_segments(frame_count, segment_count, max(1, args.frame_stride))
+    log.info("[Info]: {} frames in {} segments on {} workers".format(frame_count, len(segments), args.workers))
+
+    # Compile the networks once so that the workers import them from the cache
+    model_cache = open_model_cache(args)
+    if model_cache is not None:
+        from model import load_models
+        from pipeline import ASYNC_NUM_REQUESTS
+
+        start_time = time.perf_counter()
+        load_models(create_models(args, worker_config(args)), ASYNC_NUM_REQUESTS if args.async_mode else 1, model_cache)
+        log.info("[Info]: Model compile time: {:.3f} ms".format((time.perf_counter() - start_time) * 1000))
+
+    # The extension stays last so that the parts are written in the format of the output
+    output_root, output_extension = os.path.splitext(args.output_results)
+    part_paths = ["{}.part{}{}".format(output_root, index, output_extension) for index in range(len(segments))]
+
+    start_time = time.perf_counter()
+    processed_frames = 0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(args,)) as executor:
+        # The exact frame index of every seek landing point, from the frames between them
+        count_futures = [executor.submit(count_segment, args.input, start_frame, end_frame, frame_count)
+                         for start_frame, end_frame in segments]
+        counts = [future.result() for future in count_futures]
+        located = locate_segments(segments, counts, max(1, args.frame_stride))
+
+        futures = [executor.submit(process_segment, args, index, seek_point, start_frame, end_frame, part_paths[index])
+                   for index, (seek_point, start_frame, end_frame) in enumerate(located)]
+        for index, future in enumerate(futures):
+            frames = future.result()
+            processed_frames = processed_frames + frames
+            log.info("[Info]: Segment {} frames {}-{}: {} results".format(index, located[index][1],
+                     located[index][2], frames))
+    elapsed = time.perf_counter() - start_time
+
+    merge_parts(part_paths, args.output_results)
+
+    log.info("[Info]: {} frames processed in {:.1f} s ({:.1f} frames/s)".format(processed_frames, elapsed,
+             processed_frames / elapsed if elapsed > 0 else 0.0))
+    log.info("[Info]: Results written to " + args.output_results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''
+Drawing of the inference results on a frame.
+
+Visualize flags select what is drawn:
+    'F': bounding box from face detection
+    'H': head pose angles
+    'L': facial landmarks
+    'G': gaze estimate
+'''
+import cv2
+
+
+def draw_results(frame, result, visualize_flag):
+    '''
+    Draw the results of a FrameResult on the frame, in place
+    '''
+    if not visualize_flag:
+        return frame
+
+    for face in result.faces:
+        face_coords = face.face_coords
+
+        # Draw bounding box around detected face
+        if 'F' in visualize_flag:
+            cv2.rectangle(frame, (face_coords[0], face_coords[1]), (face_coords[2], face_coords[3]), (0,255,0), 2)
+
+        # Draw dots on detected facial landmarks
+        if 'L' in visualize_flag:
+            converted_landmarks = face.landmarks
+            for index in range(0, 10, 2):
+                cv2.circle(frame, (converted_landmarks[index] + face_coords[0], converted_landmarks[index + 1] + face_coords[1]), 10, (0,255,0), 5)
+
+    if not result.faces:
+        return frame
+
+    # Text is shown for the first face
+    face = result.faces[0]
+
+    # Show head pose parameters
+    if 'H' in visualize_flag:
+        head_pose_estimate = face.head_pose
+        cv2.putText(frame, "Head pose: yaw: {:.3f}, pitch: {:.3f}, roll: {:.3f}".format(head_pose_estimate[0], head_pose_estimate[1], head_pose_estimate[2]), (10, 20), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 255, 0), 5)
+
+    # Display gaze parameters
+    if 'G' in visualize_flag:
+        gaze_vector = face.gaze_vector
+        cv2.putText(frame, "Gaze estimate: x: {:.3f}, y: {:.3f}, z: {:.3f}".format(gaze_vector[0], gaze_vector[1], gaze_vector[2]), (10, 100), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 255, 0), 5)
+
+    return frame
@@ -0,0 +1,510 @@
+'''
+Inference pipeline chaining the four models used by the pointer controller:
+
+    face detection -> head pose + facial landmarks -> gaze estimation
+
+In synchronous mode every frame goes through all stages before the next frame
+is read. In asynchronous mode the stages are overlapped across consecutive
+frames: while frame k+1 is in face detection, frame k is in head pose/landmarks
+and frame k-1 is in gaze estimation. Results are always returned in frame order.
+
+Up to batch_size faces (of the head pose model) are processed per frame. All
+face crops go through one batched head pose and one batched landmarks inference,
+and all eye pairs through one batched gaze estimation.
+
+With a FaceTracker, face detection is skipped on most frames and the face box
+of the most confident face is propagated from the landmarks of the latest
+processed frame instead. In async mode that is the frame two steps before, as
+the previous one is still in flight.
+
+With a ChangeDetector, frames that barely differ from the last processed frame
+of their stream skip inference entirely: their result re-emits the faces of
+that frame (reused is set) once it is done. The input frame of the source is
+reused by the capture long before the last frame re-emitting it, so the face
+crops and eye regions of a processed frame are copied when it completes.
+
+Frames decoded at the face detector size may carry the full resolution frame
+as frame.full_frame (see ffmpeg_reader.py). Face detection then runs on the
+small frame and the faces are cropped from the full resolution one, which is
+the frame of the result.
+
+Every result has a status. Frames in which face detection finds no face
+(STATUS_NO_FACE), or only candidates below the threshold
+(STATUS_LOW_CONFIDENCE), finish right after face detection with no faces. Once
+nobody was present for absence_interval frames, face detection only runs on
+every absence_interval-th frame of the stream until a face is found again; the
+frames in between finish immediately as STATUS_NO_FACE. run() can end with a
+result of STATUS_END_OF_STREAM, which has no frame.
+
+Frames from several input streams can be interleaved with run_streams(); each
+result carries the stream_id of its frame.
+
+In async mode a frame source may yield None when no new frame is ready (see
+InputFeeder.next_batch(poll_interval)). The frames in flight then move on by
+one stage each, so they complete within their own inference time instead of
+waiting for the next input frames to push them through the stages.
+
+Sample usage:
+    pipeline = Pipeline(face_detection_obj, head_pose_obj, landmarks_obj,
+                        gaze_estimation_obj, prob_threshold, async_mode=True)
+    for result in pipeline.run(input_channel.next_batch()):
+        do_something(result)
+'''
+import time
+from collections import deque
+
+from metrics import REGISTRY, FRAME_LATENCY, FRAME_AGE
+
+# Number of infer requests each model needs in async mode. A frame that skips
+# face detection starts head pose/landmarks while the frame submitted two
+# frames earlier may still hold a request there, so three are needed.
+ASYNC_NUM_REQUESTS = 3
+
+# Stages a frame goes through
+STAGE_FACE = 0
+STAGE_POSE = 1
+STAGE_GAZE = 2
+STAGE_DONE = 3
+
+# Result status of a frame
+STATUS_FACE = "face"
+STATUS_NO_FACE = "no_face"
+STATUS_LOW_CONFIDENCE = "low_confidence"
+STATUS_END_OF_STREAM = "end_of_stream"
+
+# Face candidates above this fraction of the threshold make a frame low confidence
+LOW_CONFIDENCE_RATIO = 0.5
+
+# Number of input frames still referenced when the consumer requests a new
+# frame in async mode: the frames in flight plus the one just returned
+ASYNC_FRAMES_RETAINED = STAGE_DONE + 1
+
+# Seconds a frame source waits for input in async mode before yielding None
+# to let the frames in flight advance
+POLL_INTERVAL = 0.005
+
+
+class FaceResult:
+    '''
+    Inference results for a single face
+    '''
+
+    def __init__(self, face_coords, cropped_face):
+        self.face_coords = face_coords
+        self.cropped_face = cropped_face
+
+        self.head_pose = None
+        self.landmarks = None
+        self.eyes_coords = None
+        # Eye regions (EyeRoi), sampled into the gaze input without cropping
+        self.cropped_left_eye = None
+        self.cropped_right_eye = None
+        self.gaze_vector = None
+
+
+class FrameResult:
+    '''
+    Inference results for a single frame
+    '''
+
+    def __init__(self, frame_id, frame, stream_id=0, detection_frame=None):
+        self.frame_id = frame_id
+        self.frame = frame
+        self.stream_id = stream_id
+
+        # Frame given to face detection, smaller than frame when decoded scaled
+        self.detection_frame = frame if detection_frame is None else detection_frame
+        self.request_id = 0
+        self.stage = STAGE_FACE
+        self.status = STATUS_FACE
+        self.start_time = time.perf_counter()
+
+        # Time the frame was captured, the submission time when the input has none
+        self.capture_time = self.start_time
+
+        # Time from submission to the result being handed out, in ms
+        self.latency = 0.0
+
+        # Time from capture to the result being handed out, in ms, which
+        # includes the time the frame waited for the pipeline
+        self.age = 0.0
+
+        # Whether face detection ran on this frame or the box was tracked
+        self.face_detected = True
+
+        # Whether the results were re-emitted from an earlier frame because
+        # the frame did not change, and that frame until the results are copied
+        self.reused = False
+        self.source = None
+
+        # All face coordinates found by face detection
+        self.face_coords = []
+        self.faces = []
+
+        # Faces going through head pose and landmarks inference, the others
+        # are served by the ROI cache, with their cache signatures
+        self.pose_faces = []
+        self.pose_signatures = []
+
+        # Inference time per model type in ms
+        self.inference_times = {}
+
+
+class Pipeline:
+    '''
+    Runs the face detection, head pose, landmarks and gaze estimation models
+    over a sequence of frames
+    '''
+
+    def __init__(self, face_detection, head_pose, landmarks, gaze_estimation, threshold, async_mode=False, tracker=None,
+                 change_detector=None, roi_cache=None, absence_interval=5):
+        '''
+        face_detection, head_pose, landmarks, gaze_estimation: loaded model objects.
+                    In async mode they must be loaded with ASYNC_NUM_REQUESTS requests.
+        threshold: face detection probability threshold
+        async_mode: bool, overlap the stages of consecutive frames
+        tracker: optional FaceTracker to skip face detection on most frames
+        change_detector: optional ChangeDetector to skip inference on static frames
+        roi_cache: optional RoiCache to reuse head pose and landmarks of unchanged faces
+        absence_interval: int, run face detection only every n frames after n
+                    frames without a face (1 runs it on every frame)
+        '''
+        self.face_detection = face_detection
+        self.head_pose = head_pose
+        self.landmarks = landmarks
+        self.gaze_estimation = gaze_estimation
+        self.threshold = threshold
+        self.async_mode = async_mode
+
+        # Face trackers, change detectors, ROI caches and frame counters are kept per input stream
+        self.trackers = {}
+        if tracker is not None:
+            self.trackers[0] = tracker
+        self.change_detectors = {}
+        if change_detector is not None:
+            self.change_detectors[0] = change_detector
+        self.roi_caches = {}
+        if roi_cache is not None:
+            self.roi_caches[0] = roi_cache
+        self.stream_frame_counters = {}
+
+        # Last frame of each stream that went through inference
+        self.last_results = {}
+
+        # Consecutive frames without a face per stream, and frames since the
+        # face detection back off started
+        self.absence_interval = absence_interval
+        self.absent_frames = {}
+        self.backoff_counters = {}
+        self.backoff_skipped_frames = 0
+
+        self.frame_counter = 0
+
+    def set_tracker(self, stream_id, tracker):
+        '''
+        Use a FaceTracker for the frames of an input stream
+        '''
+        self.trackers[stream_id] = tracker
+
+    def set_change_detector(self, stream_id, change_detector):
+        '''
+        Use a ChangeDetector for the frames of an input stream
+        '''
+        self.change_detectors[stream_id] = change_detector
+
+    def set_roi_cache(self, stream_id, roi_cache):
+        '''
+        Use a RoiCache for the faces of an input stream
+        '''
+        self.roi_caches[stream_id] = roi_cache
+
+    def run(self, frames, end_of_stream=False):
+        '''
+        Process the frames and yield a FrameResult for each of them, in order.
+        With end_of_stream, a last result of STATUS_END_OF_STREAM follows.
+        '''
+        for result in self.run_streams((0, frame) for frame in frames):
+            yield result
+
+        if end_of_stream:
+            result = FrameResult(self.stream_frame_counters.get(0, 0), None)
+            result.status = STATUS_END_OF_STREAM
+            result.face_detected = False
+            result.stage = STAGE_DONE
+            yield result
+
+    def run_streams(self, stream_frames):
+        '''
+        Process (stream_id, frame) pairs, possibly interleaving several input
+        streams, and yield a FrameResult for each of them in input order.
+        A None frame means that no input is ready yet.
+        '''
+        if not self.async_mode:
+            for stream_id, frame in stream_frames:
+                if frame is not None:
+                    yield self.complete(self.process(frame, stream_id))
+            return
+
+        in_flight = deque()
+        for stream_id, frame in stream_frames:
+            if frame is None:
+                # No new frame yet, move the frames in flight on meanwhile
+                for pending in in_flight:
+                    self.advance(pending)
+            else:
+                # Start the new frame first so that face detection runs while
+                # the older frames are being waited on
+                result = self.submit(frame, stream_id)
+
+                for pending in list(in_flight):
+                    self.advance(pending)
+                in_flight.append(result)
+
+            while in_flight and in_flight[0].stage == STAGE_DONE:
+                yield self.complete(in_flight.popleft())
+
+        # Input finished, drain the frames still in flight
+        while in_flight:
+            for pending in in_flight:
+                self.advance(pending)
+            while in_flight and in_flight[0].stage == STAGE_DONE:
+                yield self.complete(in_flight.popleft())
+
+    def complete(self, result):
+        '''
+        Fill in the results of a reused frame and record the end to end
+        latency and age of a finished frame
+        '''
+        if result.source is not None:
+            # Frames complete in order, so the source frame is done by now
+            result.face_coords = result.source.face_coords
+            result.faces = result.source.faces
+            result.status = result.source.status
+            result.source = None
+        elif result.stream_id in self.change_detectors:
+            # Later frames may re-emit these faces after the frame buffer went
+            # back to the capture, keep the pixels they reference
+            for face in result.faces:
+                self.detach_face(face)
+
+        now = time.perf_counter()
+        result.latency = (now - result.start_time) * 1000
+        result.age = (now - result.capture_time) * 1000
+        REGISTRY.observe(FRAME_LATENCY, result.latency)
+        REGISTRY.observe(FRAME_AGE, result.age)
+
+        return result
+
+    def detach_face(self, face):
+        '''
+        Point the face crop and eye regions of a face at a copy of the crop
+        '''
+        cropped_face = face.cropped_face.copy()
+        for eye in (face.cropped_left_eye, face.cropped_right_eye):
+            if eye is not None:
+                eye.image = cropped_face
+        face.cropped_face = cropped_face
+
+    def process(self, frame, stream_id=0):
+        '''
+        Run all stages on a single frame and return its FrameResult
+        '''
+        result = self.submit(frame, stream_id)
+        while result.stage != STAGE_DONE:
+            self.advance(result)
+
+        return result
+
+    def submit(self, frame, stream_id=0):
+        '''
+        Create the FrameResult for a new frame and start face detection on it,
+        or head pose/landmarks directly on the tracked face box
+        '''
+        frame_id = self.stream_frame_counters.get(stream_id, 0)
+        self.stream_frame_counters[stream_id] = frame_id + 1
+
+        capture_time = getattr(frame, "capture_time", None)
+
+        # Faces are cropped from the full resolution frame when there is one
+        full_frame = getattr(frame, "full_frame", None)
+        if full_frame is not None:
+            result = FrameResult(frame_id, full_frame, stream_id, detection_frame=frame)
+            frame = full_frame
+        else:
+            result = FrameResult(frame_id, frame, stream_id)
+        if capture_time is not None:
+            result.capture_time = capture_time
+        if self.async_mode:
+            result.request_id = self.frame_counter % ASYNC_NUM_REQUESTS
+        self.frame_counter = self.frame_counter + 1
+
+        # Re-emit the results of the last processed frame if nothing changed
+        change_detector = self.change_detectors.get(stream_id)
+        source = self.last_results.get(stream_id)
+        if change_detector is not None:
+            roi = None
+            if source is not None and source.stage == STAGE_DONE and source.faces:
+                roi = source.faces[0].face_coords
+            if not change_detector.changed(frame, roi) and source is not None:
+                result.reused = True
+                result.face_detected = False
+                result.source = source
+                result.stage = STAGE_DONE
+                return result
+        self.last_results[stream_id] = result
+
+        # Nobody present for a while: only look for a face every absence_interval frames
+        if self.absent_frames.get(stream_id, 0) >= self.absence_interval > 1:
+            backoff_counter = self.backoff_counters.get(stream_id, 0) + 1
+            self.backoff_counters[stream_id] = backoff_counter
+            if backoff_counter % self.absence_interval != 0:
+                self.backoff_skipped_frames = self.backoff_skipped_frames + 1
+                result.status = STATUS_NO_FACE
+                result.face_detected = False
+                result.stage = STAGE_DONE
+                return result
+
+        tracker = self.trackers.get(stream_id)
+        tracked_coords = None
+        if tracker is not None and not tracker.needs_detection(frame):
+            tracked_coords = tracker.clip(frame)
+
+        if tracked_coords is None:
+            if tracker is not None:
+                tracker.detected()
+            self.face_detection.predict_async(result.detection_frame, result.request_id)
+            return result
+
+        result.face_detected = False
+        result.inference_times[self.face_detection.model_type] = 0
+        result.face_coords = [tracked_coords]
+        cropped_face = frame[tracked_coords[1]:tracked_coords[3], tracked_coords[0]:tracked_coords[2]]
+        result.faces = [FaceResult(tracked_coords, cropped_face)]
+        self.start_pose(result)
+
+        return result
+
+    def full_resolution_faces(self, result, face_coords):
+        '''
+        Scale face boxes found on the detection frame to the full resolution
+        frame and crop the faces from it
+        '''
+        scale_x = result.frame.shape[1] / result.detection_frame.shape[1]
+        scale_y = result.frame.shape[0] / result.detection_frame.shape[0]
+
+        face_coords = [[int(xmin * scale_x), int(ymin * scale_y), int(xmax * scale_x), int(ymax * scale_y)]
+                       for xmin, ymin, xmax, ymax in face_coords]
+        cropped_faces = [result.frame[ymin:ymax, xmin:xmax] for xmin, ymin, xmax, ymax in face_coords]
+
+        return cropped_faces, face_coords
+
+    def start_pose(self, result):
+        '''
+        Start one batched head pose and one batched landmarks inference on all
+        faces of the frame that the ROI cache cannot serve
+        '''
+        roi_cache = self.roi_caches.get(result.stream_id)
+        result.pose_faces = result.faces
+        if roi_cache is not None:
+            result.pose_faces = []
+            for face in result.faces:
+                entry = roi_cache.lookup(face.face_coords, face.cropped_face)
+                if entry is None:
+                    result.pose_faces.append(face)
+                    result.pose_signatures.append(roi_cache.last_signature)
+                    continue
+                face.head_pose, face.landmarks = roi_cache.results(entry, face.cropped_face)
+                face.cropped_left_eye, face.cropped_right_eye, face.eyes_coords = self.landmarks.crop_eyes(face.cropped_face,
+                                                                                                         face.landmarks)
+
+        if result.pose_faces:
+            cropped_faces = [face.cropped_face for face in result.pose_faces]
+            self.head_pose.predict_batch_async(cropped_faces, result.request_id)
+            self.landmarks.predict_batch_async(cropped_faces, result.request_id)
+        result.stage = STAGE_POSE
+
+    def collect_pose(self, result):
+        '''
+        Wait for head pose and landmarks of the faces that went through inference
+        '''
+        head_poses, inference_time = self.head_pose.get_batch_output(self.threshold, result.request_id)
+        result.inference_times[self.head_pose.model_type] = inference_time
+
+        landmarks, inference_time = self.landmarks.get_batch_output(self.threshold, result.request_id)
+        result.inference_times[self.landmarks.model_type] = inference_time
+
+        for face, (head_pose, _), (left_eye, right_eye, eyes_coords, converted_landmarks, _) in zip(result.pose_faces, head_poses, landmarks):
+            face.head_pose = head_pose
+            face.cropped_left_eye = left_eye
+            face.cropped_right_eye = right_eye
+            face.eyes_coords = eyes_coords
+            face.landmarks = converted_landmarks
+
+        roi_cache = self.roi_caches.get(result.stream_id)
+        if roi_cache is not None:
+            for face, signature in zip(result.pose_faces, result.pose_signatures):
+                roi_cache.store(face.face_coords, face.cropped_face, face.head_pose, face.landmarks, signature)
+
+    def no_face(self, result):
+        '''
+        Finish a frame in which face detection found no face
+        '''
+        if self.face_detection.best_confidence >= self.threshold * LOW_CONFIDENCE_RATIO:
+            result.status = STATUS_LOW_CONFIDENCE
+        else:
+            result.status = STATUS_NO_FACE
+        result.stage = STAGE_DONE
+
+        self.absent_frames[result.stream_id] = self.absent_frames.get(result.stream_id, 0) + 1
+
+        # The tracked box is gone, the next frame needs face detection
+        tracker = self.trackers.get(result.stream_id)
+        if tracker is not None:
+            tracker.lost()
+
+    def advance(self, result):
+        '''
+        Wait for the current stage of a frame and start its next stage
+        '''
+        request_id = result.request_id
+
+        if result.stage == STAGE_FACE:
+            cropped_faces, face_coords, inference_time = self.face_detection.get_async_output(self.threshold, request_id)
+            result.inference_times[self.face_detection.model_type] = inference_time
+            if result.detection_frame is not result.frame:
+                cropped_faces, face_coords = self.full_resolution_faces(result, face_coords)
+            result.face_coords = face_coords
+
+            if not face_coords:
+                self.no_face(result)
+                return
+            self.absent_frames[result.stream_id] = 0
+            self.backoff_counters[result.stream_id] = 0
+
+            # As many faces as fit in the head pose/landmarks batch, highest confidence first
+            max_faces = self.head_pose.batch_size
+            result.faces = [FaceResult(coords, cropped_face) for coords, cropped_face in zip(face_coords[:max_faces], cropped_faces)]
+            self.start_pose(result)
+
+        elif result.stage == STAGE_POSE:
+            result.inference_times[self.head_pose.model_type] = 0
+            result.inference_times[self.landmarks.model_type] = 0
+            if result.pose_faces:
+                self.collect_pose(result)
+
+            # The tracker follows the most confident face
+            tracker = self.trackers.get(result.stream_id)
+            if tracker is not None:
+                tracker.update(result.faces[0].face_coords, result.faces[0].landmarks, result.face_detected)
+
+            self.gaze_estimation.predict_batch_async([face.cropped_left_eye for face in result.faces],
+                                                     [face.cropped_right_eye for face in result.faces],
+                                                     [face.head_pose for face in result.faces], request_id)
+            result.stage = STAGE_GAZE
+
+        elif result.stage == STAGE_GAZE:
+            gaze_vectors, inference_time = self.gaze_estimation.get_batch_output(request_id)
+            result.inference_times[self.gaze_estimation.model_type] = inference_time
+            for face, gaze_vector in zip(result.faces, gaze_vectors):
+                face.gaze_vector = gaze_vector
+            result.stage = STAGE_DONE
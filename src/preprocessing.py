@@ -0,0 +1,65 @@
+'''
+Allocation free preprocessing of images into network input blobs.
+
+An ImageInput wraps the NCHW input buffer of one infer request. Frames are
+resized into a preallocated HWC staging buffer with cv2.resize(dst=...) and
+then written into the blob memory in place, converting HWC to CHW on the way.
+Nothing is allocated per frame. fill_affine() samples a region, such as an
+eye, with one affine warp instead of a crop and a resize.
+
+Sample usage:
+    image_input = ImageInput(request.inputs['data'])
+    image_input.fill(frame)
+    request.infer()
+'''
+import cv2
+import numpy as np
+
+
+def get_input_buffers(request):
+    '''
+    Return the input blob memory of an infer request as a dict of numpy arrays.
+    Newer releases expose it through input_blobs, older ones through inputs.
+    '''
+    input_blobs = getattr(request, "input_blobs", None)
+    if input_blobs is not None:
+        return {name: input_blobs[name].buffer for name in input_blobs}
+
+    return dict(request.inputs)
+
+
+class ImageInput:
+    '''
+    Preallocated resize and layout conversion for one image input buffer
+    '''
+
+    def __init__(self, buffer):
+        '''
+        buffer: NCHW numpy array the frames are written to, usually the
+                memory of an infer request input blob
+        '''
+        self.buffer = buffer
+        self.batch_size, self.channels, self.height, self.width = buffer.shape
+        self.staging = np.empty((self.height, self.width, self.channels), dtype=np.uint8)
+
+    def fill(self, frame, index=0):
+        '''
+        Resize the frame and write it into slot index of the batch
+        '''
+        if frame.shape[0] == self.height and frame.shape[1] == self.width:
+            resized = frame
+        else:
+            resized = cv2.resize(frame, (self.width, self.height), dst=self.staging)
+
+        np.copyto(self.buffer[index], resized.transpose((2, 0, 1)))
+
+    def fill_affine(self, image, matrix, index=0):
+        '''
+        Sample the image with an affine transform to the input size and write
+        it into slot index of the batch. Pixels mapped from outside the image
+        replicate its border.
+        '''
+        cv2.warpAffine(image, matrix, (self.width, self.height), dst=self.staging,
+                       flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+        np.copyto(self.buffer[index], self.staging.transpose((2, 0, 1)))
@@ -0,0 +1,156 @@
+"""Replay of recorded stage outputs
+
+Feeds a recording made with main.py -rc into the downstream stages without
+decoding the video or running the upstream models:
+
+    - with -gem, gaze estimation runs again on the recorded eye crops and head
+      pose angles, e.g. to compare gaze model variants or eye crop changes,
+    - the gaze vectors are mapped to pointer movements with the MouseController
+      precision, every n-th frame like main.py does.
+
+The pointer is moved by a MouseActuator with the -ms speed, as in main.py, and
+the gaze targets are handed to it at the pace the results arrived while
+recording, so the replayed motion matches the live one. Recordings without
+frame times are paced at -fi ms per frame.
+
+With -dr (dry run) the pointer is not moved and the resulting movement is
+only summarized, which makes a tuning iteration take milliseconds. -o saves the
+cumulative pointer trajectory as an .npy file.
+
+> python3 replay.py -r session -mp medium -dr
+"""
+
+import time
+import logging as log
+from argparse import ArgumentParser
+
+import numpy as np
+
+from stage_recorder import StageReplay
+from mouse_controller import PRECISIONS, SPEEDS, MouseController, MouseActuator
+
+
+def build_argparser():
+    parser = ArgumentParser()
+    parser.add_argument("-r", "--recording", required=True, type=str,
+                        help="Directory written by main.py -rc")
+    parser.add_argument("-gem", "--gazeestimationmodel", type=str, default=None,
+                        help="Re-run this gaze estimation model on the recorded "
+                             "eye crops instead of using the recorded gaze")
+    parser.add_argument("-d", "--device", type=str, default="CPU",
+                        help="Device of the gaze estimation model (CPU by default)")
+    parser.add_argument("-mp", "--mouse_precision", type=str, default="medium", choices=sorted(PRECISIONS),
+                        help="MouseController precision (medium by default)")
+    parser.add_argument("-ms", "--mouse_speed", type=str, default="fast", choices=sorted(SPEEDS),
+                        help="MouseController speed (fast by default)")
+    parser.add_argument("-mu", "--mouse_update", type=int, default=4,
+                        help="Move the pointer every n-th frame (4 by default, as main.py)")
+    parser.add_argument("-fi", "--frame_interval", type=float, default=100,
+                        help="Time between frames in ms for recordings without "
+                             "frame times (100 by default)")
+    parser.add_argument("-dr", "--dry_run", action="store_true",
+                        help="Do not move the pointer, only compute the movement")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Save the cumulative pointer trajectory (frames x 2) as .npy")
+    return parser
+
+
+def replay_gaze(replay, model_xml, device):
+    '''
+    Run gaze estimation on every recorded face and return the gaze vectors
+    '''
+    from gaze_estimation import GazeEstimationModel
+
+    gaze_estimation_obj = GazeEstimationModel(model_xml, device)
+    gaze_estimation_obj.load_model()
+
+    gaze_vectors = np.empty_like(np.asarray(replay.gaze_vector))
+    for row in range(len(gaze_vectors)):
+        gaze_vector, _ = gaze_estimation_obj.predict(replay.left_eye[row], replay.right_eye[row], replay.head_pose[row])
+        gaze_vectors[row] = gaze_vector
+
+    difference = np.abs(gaze_vectors - replay.gaze_vector)
+    if len(difference):
+        log.info("[Info]: Gaze difference to the recording: mean {:.4f} max {:.4f}".format(difference.mean(), difference.max()))
+    return gaze_vectors
+
+
+def pointer_moves(replay, gaze_vectors, precision, update_interval):
+    '''
+    Return the relative pointer movement of every frame (frames x 2), using the
+    most confident face of a frame and moving every update_interval-th frame
+    '''
+    moves = np.zeros((len(replay), 2), dtype=np.float32)
+    for index, (frame_id, rows) in enumerate(replay.frames()):
+        if rows.stop == rows.start or (index + 1) % update_interval != 0:
+            continue
+        gaze_vector = gaze_vectors[rows.start]
+        moves[index] = (gaze_vector[0] * precision, -1 * gaze_vector[1] * precision)
+    return moves
+
+
+def actuate(replay, gaze_vectors, mouse_actuator, update_interval, frame_interval):
+    '''
+    Hand the gaze target of every update_interval-th frame to the actuator at
+    the time its result arrived while recording
+    '''
+    frame_times = replay.frame_times
+    if frame_times is None:
+        frame_times = np.arange(len(replay)) * frame_interval
+
+    start_time = time.perf_counter()
+    for index, (frame_id, rows) in enumerate(replay.frames()):
+        delay = start_time + frame_times[index] - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if rows.stop == rows.start or (index + 1) % update_interval != 0:
+            continue
+        gaze_vector = gaze_vectors[rows.start]
+        mouse_actuator.update(gaze_vector[0], gaze_vector[1])
+
+
+def main():
+    args = build_argparser().parse_args()
+    log.basicConfig(level=log.INFO, format="%(message)s")
+
+    replay = StageReplay(args.recording)
+    log.info("[Info]: {} frames, {} faces recorded".format(len(replay), replay.index["rows"]))
+
+    start_time = time.perf_counter()
+
+    gaze_vectors = replay.gaze_vector
+    if args.gazeestimationmodel is not None:
+        gaze_vectors = replay_gaze(replay, args.gazeestimationmodel, args.device)
+
+    # pyautogui is only imported when the pointer really moves
+    if args.dry_run:
+        moves = pointer_moves(replay, gaze_vectors, PRECISIONS[args.mouse_precision], args.mouse_update)
+    else:
+        mouse_controller = MouseController(args.mouse_precision, args.mouse_speed)
+        mouse_controller.init_position()
+        moves = pointer_moves(replay, gaze_vectors, mouse_controller.precision, args.mouse_update)
+
+        mouse_actuator = MouseActuator(mouse_controller)
+        mouse_actuator.start()
+        actuate(replay, gaze_vectors, mouse_actuator, args.mouse_update, args.frame_interval / 1000)
+        # Let the last movement finish
+        time.sleep(mouse_controller.speed)
+        mouse_actuator.stop()
+        mouse_stats = mouse_actuator.stats()
+        log.info("[Info]: Mouse updates applied: {} dropped: {}".format(mouse_stats["applied_updates"],
+                                                                       mouse_stats["dropped_updates"]))
+
+    trajectory = np.cumsum(moves, axis=0)
+    elapsed = (time.perf_counter() - start_time) * 1000
+
+    if len(trajectory):
+        log.info("[Info]: Pointer path length {:.0f} px, final offset ({:.0f}, {:.0f}) px".format(
+                 np.sum(np.linalg.norm(moves, axis=1)), trajectory[-1][0], trajectory[-1][1]))
+    log.info("[Info]: Replay time: {:.3f} ms".format(elapsed))
+
+    if args.output is not None:
+        np.save(args.output, trajectory)
+
+
+if __name__ == '__main__':
+    main()
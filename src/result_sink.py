@@ -0,0 +1,106 @@
+'''
+Sinks streaming the per-frame inference results to a file.
+
+JsonlResultSink writes one JSON object per frame:
+    {"frame_id": 0, "latency_ms": {"FACE": 12.1, ...},
+     "faces": [{"face_coords": [xmin, ymin, xmax, ymax], "head_pose": [yaw, pitch, roll],
+                "landmarks": [x0, y0, ... x4, y4], "gaze_vector": [x, y, z]}]}
+
+BinaryResultSink writes fixed size little endian records after a file header:
+    file header:  magic b"PCRB", format version uint16 (2)
+    frame header: frame_id uint32, face count uint16, status uint8 (index in
+                  STATUSES), latency of FACE, HEAD, LANDMARKS, GAZE and total
+                  in ms as 5 float32
+    per face:     face_coords 4 int32, head_pose 3 float32, landmarks 10 int32,
+                  gaze_vector 3 float32
+
+Sample usage:
+    sink = open_result_sink('results.jsonl')
+    sink.write(result, total_time)
+    sink.close()
+'''
+import json
+import struct
+
+from pipeline import STATUS_FACE, STATUS_NO_FACE, STATUS_LOW_CONFIDENCE, STATUS_END_OF_STREAM
+
+STAGES = ["FACE", "HEAD", "LANDMARKS", "GAZE"]
+
+# Binary status codes are the indexes in this list
+STATUSES = [STATUS_FACE, STATUS_NO_FACE, STATUS_LOW_CONFIDENCE, STATUS_END_OF_STREAM]
+
+# Version 1 had no file header and no status in the frame header
+BINARY_MAGIC = b"PCRB"
+BINARY_VERSION = 2
+
+FILE_HEADER = struct.Struct("<4sH")
+FRAME_HEADER = struct.Struct("<IHB5f")
+FACE_RECORD = struct.Struct("<4i3f10i3f")
+
+
+def result_to_dict(result, total_time=None):
+    '''
+    Convert a FrameResult to plain python types
+    '''
+    latency = {stage: float(time) for stage, time in result.inference_times.items()}
+    if total_time is not None:
+        latency["TOTAL"] = float(total_time)
+
+    faces = []
+    for face in result.faces:
+        faces.append({"face_coords": [int(value) for value in face.face_coords],
+                      "head_pose": [float(value) for value in face.head_pose],
+                      "landmarks": [int(value) for value in face.landmarks],
+                      "gaze_vector": [float(value) for value in face.gaze_vector]
+                     })
+
+    return {"frame_id": result.frame_id, "status": result.status, "latency_ms": latency, "faces": faces}
+
+
+class JsonlResultSink:
+    '''
+    Writes one JSON line per frame
+    '''
+
+    def __init__(self, path):
+        self.output_file = open(path, "w")
+
+    def write(self, result, total_time=None):
+        self.output_file.write(json.dumps(result_to_dict(result, total_time)))
+        self.output_file.write("\n")
+
+    def close(self):
+        self.output_file.close()
+
+
+class BinaryResultSink:
+    '''
+    Writes one packed binary record per frame
+    '''
+
+    def __init__(self, path):
+        self.output_file = open(path, "wb")
+        self.output_file.write(FILE_HEADER.pack(BINARY_MAGIC, BINARY_VERSION))
+
+    def write(self, result, total_time=None):
+        latency = [result.inference_times.get(stage, 0.0) for stage in STAGES]
+        latency.append(total_time if total_time is not None else 0.0)
+        self.output_file.write(FRAME_HEADER.pack(result.frame_id, len(result.faces),
+                                                 STATUSES.index(result.status), *latency))
+
+        for face in result.faces:
+            self.output_file.write(FACE_RECORD.pack(*(list(face.face_coords) + list(face.head_pose) +
+                                                      list(face.landmarks) + list(face.gaze_vector))))
+
+    def close(self):
+        self.output_file.close()
+
+
+def open_result_sink(path):
+    '''
+    Open a result sink, binary for .bin files and JSON lines otherwise
+    '''
+    if path.endswith(".bin"):
+        return BinaryResultSink(path)
+
+    return JsonlResultSink(path)
@@ -0,0 +1,167 @@
+'''
+Result cache for the head pose and landmarks stages.
+
+When the face barely moves, consecutive face crops are almost identical and
+head pose and landmarks inference return the same results. Every face crop gets
+a cheap signature, a small grayscale thumbnail, and is compared with the cached
+faces of the stream: a cached face matches when its box has about the same
+position and size and the mean absolute thumbnail difference is within the
+tolerance. The cached head pose and landmarks are then reused and the face
+skips both networks.
+
+The landmarks are stored relative to the crop size, so they are placed on the
+new crop even if it is a few pixels larger or smaller. Entries expire after ttl
+seconds, the least recently used entry is evicted when the cache is full, and an
+entry is refreshed by inference after serving refresh_interval hits so errors
+never persist for long.
+
+Sample usage:
+    cache = RoiCache(tolerance=4.0)
+    entry = cache.lookup(face_coords, cropped_face)
+    if entry is None:
+        ... run head pose and landmarks ...
+        cache.store(face_coords, cropped_face, head_pose, landmarks)
+    else:
+        head_pose, landmarks = cache.results(entry, cropped_face)
+'''
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Size of the grayscale signature of a face crop
+SIGNATURE_SIZE = (16, 16)
+
+
+class RoiCacheEntry:
+    def __init__(self, face_coords, signature, head_pose, landmarks):
+        self.face_coords = face_coords
+        self.signature = signature
+        self.head_pose = head_pose
+        # Landmarks as fractions of the crop width and height
+        self.landmarks = landmarks
+        self.created = time.perf_counter()
+        self.hits = 0
+
+
+class RoiCache:
+    '''
+    Bounded LRU/TTL cache of head pose and landmarks results per face crop
+    '''
+
+    def __init__(self, tolerance=4.0, capacity=8, ttl=1.0, refresh_interval=10, max_shift=0.05,
+                 size=SIGNATURE_SIZE):
+        '''
+        tolerance: float, mean absolute signature difference (0-255) of a match
+        capacity: int, maximum number of cached faces
+        ttl: float, seconds an entry stays valid
+        refresh_interval: int, hits after which an entry is refreshed by inference
+        max_shift: float, largest change of box position and size, relative to the box size
+        size: (width, height) of the signature
+        '''
+        self.tolerance = tolerance
+        self.capacity = capacity
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_shift = max_shift
+        self.size = size
+
+        self.entries = OrderedDict()
+        self.next_key = 0
+        self.last_signature = None
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def signature(self, cropped_face):
+        small = cv2.resize(cropped_face, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+    def same_box(self, box, other):
+        width = max(1, box[2] - box[0])
+        height = max(1, box[3] - box[1])
+        return (abs(box[0] - other[0]) <= self.max_shift * width and abs(box[2] - other[2]) <= self.max_shift * width
+                and abs(box[1] - other[1]) <= self.max_shift * height and abs(box[3] - other[3]) <= self.max_shift * height)
+
+    def expire(self):
+        now = time.perf_counter()
+        for key in [key for key, entry in self.entries.items() if now - entry.created > self.ttl]:
+            del self.entries[key]
+            self.evictions = self.evictions + 1
+
+    def lookup(self, face_coords, cropped_face):
+        '''
+        Return the cached entry matching the face, or None when it needs inference.
+        The signature of a miss is kept for store().
+        '''
+        self.expire()
+        self.last_signature = self.signature(cropped_face)
+
+        best_key = None
+        best_difference = self.tolerance
+        for key, entry in self.entries.items():
+            if not self.same_box(face_coords, entry.face_coords):
+                continue
+            difference = np.abs(self.last_signature - entry.signature).mean()
+            if difference <= best_difference:
+                best_key = key
+                best_difference = difference
+
+        if best_key is None:
+            self.misses = self.misses + 1
+            return None
+
+        entry = self.entries[best_key]
+        if entry.hits >= self.refresh_interval:
+            # Served long enough, run inference and replace it
+            del self.entries[best_key]
+            self.refreshes = self.refreshes + 1
+            self.misses = self.misses + 1
+            return None
+
+        entry.hits = entry.hits + 1
+        self.entries.move_to_end(best_key)
+        self.hits = self.hits + 1
+        return entry
+
+    def store(self, face_coords, cropped_face, head_pose, landmarks, signature=None):
+        '''
+        Cache the inference results of a face crop
+
+        landmarks: landmarks in pixels of the crop, as from LandmarksModel
+        signature: signature returned by lookup() for this crop, computed when None
+        '''
+        if signature is None:
+            signature = self.signature(cropped_face)
+
+        height, width = cropped_face.shape[:2]
+        relative_landmarks = [value / (width if index % 2 == 0 else height) for index, value in enumerate(landmarks)]
+
+        self.entries[self.next_key] = RoiCacheEntry(list(face_coords), signature, head_pose, relative_landmarks)
+        self.next_key = self.next_key + 1
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    def results(self, entry, cropped_face):
+        '''
+        Return the head pose and the landmarks in pixels of cropped_face
+        '''
+        height, width = cropped_face.shape[:2]
+        landmarks = [int(value * (width if index % 2 == 0 else height)) for index, value in enumerate(entry.landmarks)]
+        return entry.head_pose, landmarks
+
+    def stats(self):
+        '''
+        Return the cache statistics
+        '''
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0}
@@ -0,0 +1,166 @@
+'''
+Record and replay of the intermediate stage outputs in a columnar format.
+
+StageRecorder stores one row per processed face in a directory of .npy files,
+one file per column:
+
+    frame_id     int32   (rows,)           frame the face belongs to
+    face_coords  int32   (rows, 4)         xmin, ymin, xmax, ymax
+    head_pose    float32 (rows, 3)         yaw, pitch, roll
+    landmarks    int32   (rows, 10)        x0, y0, ... x4, y4
+    gaze_vector  float32 (rows, 3)         x, y, z
+    left_eye     uint8   (rows, 60, 60, 3) eye regions sampled at the gaze input size
+    right_eye    uint8   (rows, 60, 60, 3)
+
+and frame_offsets int64 (frames + 1,): the rows of frame i are
+frame_offsets[i]:frame_offsets[i + 1]. frame_times float64 (frames,) holds the
+time each frame's result arrived, in seconds from the first one, so that a
+replay can reproduce the pace of the session. index.json lists the columns,
+their dtype and shape and the number of frames.
+
+Rows are streamed to raw files while recording and converted to .npy files on
+close, so StageReplay can memory map them without reading the whole file.
+
+Sample usage:
+    recorder = StageRecorder('session')
+    for result in pipeline.run(frames):
+        recorder.write(result)
+    recorder.close()
+
+    replay = StageReplay('session')
+    for frame_id, rows in replay.frames():
+        gaze_vector = replay.gaze_vector[rows.start]
+'''
+import os
+import json
+import time
+
+import cv2
+import numpy as np
+
+from eye_roi import EyeRoi
+
+INDEX_FILE = "index.json"
+
+# Size of the stored eye crops, the input size of the gaze estimation model
+EYE_SIZE = (60, 60)
+
+# Column name -> (dtype, shape of one row)
+COLUMNS = {"frame_id": (np.int32, ()),
+           "face_coords": (np.int32, (4,)),
+           "head_pose": (np.float32, (3,)),
+           "landmarks": (np.int32, (10,)),
+           "gaze_vector": (np.float32, (3,)),
+           "left_eye": (np.uint8, (EYE_SIZE[1], EYE_SIZE[0], 3)),
+           "right_eye": (np.uint8, (EYE_SIZE[1], EYE_SIZE[0], 3))}
+
+
+class StageRecorder:
+    '''
+    Streams the face results of every frame to columnar files
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.raw_files = {name: open(self.raw_path(name), "wb") for name in COLUMNS}
+        self.frame_offsets = [0]
+        self.frame_times = []
+        self.start_time = None
+        self.rows = 0
+
+        # Preallocated row buffers, written out with tofile()
+        self.row_buffers = {name: np.zeros(shape, dtype=dtype) for name, (dtype, shape) in COLUMNS.items()}
+
+    def raw_path(self, name):
+        return os.path.join(self.directory, name + ".raw")
+
+    def write(self, result):
+        '''
+        Append the faces of a FrameResult
+        '''
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now
+        self.frame_times.append(now - self.start_time)
+
+        for face in result.faces:
+            row = self.row_buffers
+            row["frame_id"][...] = result.frame_id
+            row["face_coords"][:] = face.face_coords
+            row["head_pose"][:] = face.head_pose
+            row["landmarks"][:] = face.landmarks
+            row["gaze_vector"][:] = face.gaze_vector
+            self.store_eye(face.cropped_left_eye, row["left_eye"])
+            self.store_eye(face.cropped_right_eye, row["right_eye"])
+
+            for name, buffer in row.items():
+                buffer.tofile(self.raw_files[name])
+            self.rows = self.rows + 1
+
+        self.frame_offsets.append(self.rows)
+
+    def store_eye(self, eye, buffer):
+        if eye is None:
+            buffer[...] = 0
+        elif isinstance(eye, EyeRoi):
+            eye.warp(buffer)
+        else:
+            cv2.resize(eye, EYE_SIZE, dst=buffer)
+
+    def close(self):
+        '''
+        Convert the raw columns to .npy files and write the index
+        '''
+        columns = {}
+        for name, (dtype, shape) in COLUMNS.items():
+            self.raw_files[name].close()
+            raw = np.memmap(self.raw_path(name), dtype=dtype, mode="r", shape=(self.rows,) + shape) if self.rows else \
+                np.zeros((0,) + shape, dtype=dtype)
+            array = np.lib.format.open_memmap(os.path.join(self.directory, name + ".npy"), mode="w+",
+                                              dtype=dtype, shape=(self.rows,) + shape)
+            array[...] = raw
+            array.flush()
+            del array, raw
+            os.remove(self.raw_path(name))
+            columns[name] = {"dtype": np.dtype(dtype).name, "shape": list(shape)}
+
+        np.save(os.path.join(self.directory, "frame_offsets.npy"), np.array(self.frame_offsets, dtype=np.int64))
+        np.save(os.path.join(self.directory, "frame_times.npy"), np.array(self.frame_times, dtype=np.float64))
+
+        with open(os.path.join(self.directory, INDEX_FILE), "w") as index_file:
+            json.dump({"frames": len(self.frame_offsets) - 1, "rows": self.rows, "columns": columns},
+                      index_file, indent=2)
+
+
+class StageReplay:
+    '''
+    Memory maps a recording made by StageRecorder
+    '''
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, INDEX_FILE)) as index_file:
+            self.index = json.load(index_file)
+
+        self.frame_offsets = np.load(os.path.join(directory, "frame_offsets.npy"))
+
+        # Recordings made before the frame times were stored have none
+        self.frame_times = None
+        if os.path.exists(os.path.join(directory, "frame_times.npy")):
+            self.frame_times = np.load(os.path.join(directory, "frame_times.npy"))
+        for name in self.index["columns"]:
+            setattr(self, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return self.index["frames"]
+
+    def frames(self):
+        '''
+        Yield (frame_id, slice of the frame's rows) for every recorded frame,
+        frames without faces have an empty slice and frame_id None
+        '''
+        for index in range(len(self)):
+            rows = slice(int(self.frame_offsets[index]), int(self.frame_offsets[index + 1]))
+            frame_id = int(self.frame_id[rows.start]) if rows.stop > rows.start else None
+            yield frame_id, rows
@@ -0,0 +1,239 @@
+"""Multi-stream server
+
+Serves several camera and video streams from one process with a single set of
+loaded models. Frames from the streams are multiplexed round robin onto one
+asynchronous pipeline, which keeps the infer requests of every model busy, and
+each result is routed back to the consumer of its stream.
+
+Every stream captures into its own bounded frame ring (see InputFeeder), so a
+stream that is not served in time drops (camera) or blocks (video file) on its
+own without affecting the others. Memory and startup cost depend on the number
+of models and infer requests only, not on the number of streams.
+
+> python3 stream_server.py -i ../bin/demo.mp4,CAM -od results -fdm ... -hpm ... -flm ... -gem ...
+"""
+
+import os
+import time
+import threading
+import logging as log
+from argparse import ArgumentParser
+
+from input_feeder import InputFeeder, POLICY_BLOCK, POLICY_DROP_OLDEST
+from face_detection import FaceDetectionModel
+from head_pose import HeadPoseModel
+from landmarks import LandmarksModel
+from gaze_estimation import GazeEstimationModel
+from model import load_models
+from model_cache import ModelCache
+from backend import BACKENDS, create_backend, set_backend
+from face_tracker import FaceTracker
+from roi_cache import RoiCache
+from result_sink import open_result_sink
+from pipeline import Pipeline, ASYNC_NUM_REQUESTS, ASYNC_FRAMES_RETAINED, POLL_INTERVAL
+
+
+class StreamServer:
+    '''
+    Multiplexes frames of several input streams onto one pipeline
+    '''
+
+    def __init__(self, pipeline):
+        '''
+        pipeline: Pipeline shared by all streams, normally in async mode
+        '''
+        self.pipeline = pipeline
+        self.streams = {}
+        self.frame_ready = threading.Event()
+
+    def add_stream(self, stream_id, input_feeder, consumer):
+        '''
+        input_feeder: InputFeeder of the stream, not loaded yet
+        consumer: callable receiving the FrameResult of every frame of the stream
+        '''
+        input_feeder.ready_event = self.frame_ready
+        self.streams[stream_id] = {"feeder": input_feeder, "consumer": consumer, "frames": 0}
+
+    def schedule(self):
+        '''
+        Yield (stream_id, frame) pairs round robin over the streams that have a
+        frame ready, one frame per stream per turn, until all streams ended.
+        (None, None) is yielded when no stream had a frame within POLL_INTERVAL,
+        so that the pipeline finishes the frames in flight meanwhile. A stream
+        whose capture failed is logged and ends.
+        '''
+        active = list(self.streams.keys())
+        while active:
+            self.frame_ready.clear()
+            scheduled = False
+
+            for stream_id in list(active):
+                feeder = self.streams[stream_id]["feeder"]
+                try:
+                    frame = feeder.read(block=False)
+                except Exception as e:
+                    # A failed capture ends its stream only
+                    log.error("[ERROR]: Stream {} capture failed: {}".format(stream_id, e))
+                    active.remove(stream_id)
+                    continue
+                if frame is not None:
+                    scheduled = True
+                    yield stream_id, frame
+                elif feeder.finished():
+                    active.remove(stream_id)
+
+            # Nothing ready on any stream, wait briefly for the next captured frame
+            if not scheduled and active:
+                if not self.frame_ready.wait(POLL_INTERVAL):
+                    yield None, None
+
+    def run(self):
+        '''
+        Serve all streams until they end
+        '''
+        for stream in self.streams.values():
+            stream["feeder"].load_data()
+
+        try:
+            for result in self.pipeline.run_streams(self.schedule()):
+                stream = self.streams[result.stream_id]
+                stream["frames"] = stream["frames"] + 1
+                stream["consumer"](result)
+        finally:
+            for stream in self.streams.values():
+                stream["feeder"].close()
+
+    def stats(self):
+        '''
+        Return the per stream frame counts
+        '''
+        return {stream_id: {"frames": stream["frames"],
+                            "dropped_frames": stream["feeder"].dropped_frames}
+                for stream_id, stream in self.streams.items()}
+
+
+def build_argparser():
+    """
+    Parse command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser()
+
+    parser.add_argument("-fdm", "--facedetectionmodel", required=True, type=str,
+                        help="Face detection model.")
+    parser.add_argument("-hpm", "--headposemodel", required=True, type=str,
+                        help="Head pose model.")
+    parser.add_argument("-flm", "--facelandmarksnmodel", required=True, type=str,
+                        help="Face landmarks model.")
+    parser.add_argument("-gem", "--gazeestimationmodel", required=True, type=str,
+                        help="Gaze estimation model.")
+    parser.add_argument("-i", "--input", required=True, type=str,
+                        help="Comma separated list of video files. Use CAM for camera input")
+    parser.add_argument("-od", "--output_dir", required=True, type=str,
+                        help="Directory receiving one result file per stream")
+    parser.add_argument("-d", "--device", type=str, default="CPU",
+                        help="Specify the target device to infer on (CPU by default)")
+    parser.add_argument("-pt", "--prob_threshold", type=float, default=0.5,
+                        help="Probability threshold for detections filtering"
+                        "(0.5 by default)")
+    parser.add_argument("-mc", "--model_cache", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".cache", "pointer_controller"),
+                        help="Directory caching compiled networks between runs. "
+                             "Use NONE to disable the cache")
+    parser.add_argument("-be", "--backend", type=str, default="openvino", choices=BACKENDS,
+                        help="Inference backend. 'mock' returns synthetic outputs "
+                             "after sampled latencies, without OpenVINO or IR files "
+                             "(openvino by default)")
+    parser.add_argument("-ml", "--mock_latency", type=str, default=None,
+                        help="Latency distributions of the mock backend in ms, e.g. "
+                             "'FACE=normal:13,1.3;HEAD=const:1.6;GAZE=lognormal:1.7,0.2'")
+    parser.add_argument("-ms", "--mock_seed", type=int, default=0,
+                        help="Random seed of the mock backend (0 by default)")
+    parser.add_argument("-mt", "--mock_streams", type=int, default=1,
+                        help="Inferences the mock device runs at the same time, "
+                             "further requests queue behind them (1 by default)")
+    parser.add_argument("-fs", "--frame_stride", type=int, default=10,
+                        help="Process every n-th frame of each input (10 by default)")
+    parser.add_argument("-mf", "--max_faces", type=int, default=1,
+                        help="Maximum number of faces processed per frame (1 by default)")
+    parser.add_argument("-ti", "--track_interval", type=int, default=0,
+                        help="Run face detection only every n frames of each "
+                             "stream (0 runs it on every frame)")
+    parser.add_argument("-rt", "--roi_tolerance", type=float, default=0,
+                        help="Reuse head pose and landmarks of faces within this crop "
+                             "signature tolerance (0-255) of a cached face of the "
+                             "stream (0 disables the cache)")
+    return parser
+
+
+def main():
+    args = build_argparser().parse_args()
+    log.basicConfig(level=log.INFO, format="%(message)s")
+
+    face_detection_obj  = FaceDetectionModel(args.facedetectionmodel, args.device)
+    head_pose_obj       = HeadPoseModel(args.headposemodel, args.device)
+    landmarks_obj       = LandmarksModel(args.facelandmarksnmodel, args.device)
+    gaze_estimation_obj = GazeEstimationModel(args.gazeestimationmodel, args.device)
+    models = [face_detection_obj, head_pose_obj, landmarks_obj, gaze_estimation_obj]
+
+    head_pose_obj.batch_size       = args.max_faces
+    landmarks_obj.batch_size       = args.max_faces
+    gaze_estimation_obj.batch_size = args.max_faces
+
+    if args.backend != 'openvino':
+        set_backend(create_backend(args.backend, latency=args.mock_latency, seed=args.mock_seed,
+                                   streams=args.mock_streams))
+
+    model_cache = None
+    if args.model_cache.upper() != 'NONE' and args.backend == 'openvino':
+        model_cache = ModelCache(args.model_cache)
+
+    # The models are loaded once, whatever the number of streams
+    start_time = time.time()
+    load_models(models, ASYNC_NUM_REQUESTS, model_cache, warm_up=True)
+    log.info("[Info]: Model loading time: {:.3f} ms".format((time.time() - start_time) * 1000))
+
+    pipeline = Pipeline(face_detection_obj, head_pose_obj, landmarks_obj, gaze_estimation_obj,
+                        args.prob_threshold, async_mode=True)
+    server = StreamServer(pipeline)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    sinks = []
+    for stream_id, input_src in enumerate(args.input.split(",")):
+        if input_src.lower() == 'cam':
+            feeder = InputFeeder(input_type='cam', stride=args.frame_stride, policy=POLICY_DROP_OLDEST,
+                                 retain=ASYNC_FRAMES_RETAINED)
+        elif not os.path.exists(input_src):
+            log.error("Video file {} not found! Exiting....".format(input_src))
+            exit(1)
+        else:
+            feeder = InputFeeder(input_type='video', input_file=input_src, stride=args.frame_stride,
+                                 policy=POLICY_BLOCK, retain=ASYNC_FRAMES_RETAINED)
+
+        if args.track_interval > 0:
+            pipeline.set_tracker(stream_id, FaceTracker(detection_interval=args.track_interval))
+        if args.roi_tolerance > 0:
+            pipeline.set_roi_cache(stream_id, RoiCache(tolerance=args.roi_tolerance))
+
+        sink = open_result_sink(os.path.join(args.output_dir, "stream_{}.jsonl".format(stream_id)))
+        sinks.append(sink)
+        server.add_stream(stream_id, feeder, sink.write)
+
+    start_time = time.time()
+    server.run()
+    elapsed = time.time() - start_time
+
+    for sink in sinks:
+        sink.close()
+
+    total_frames = 0
+    for stream_id, stats in server.stats().items():
+        total_frames = total_frames + stats["frames"]
+        log.info("[Info]: Stream {}: {} frames, {} dropped".format(stream_id, stats["frames"], stats["dropped_frames"]))
+    if elapsed > 0:
+        log.info("[Info]: Total throughput: {:.1f} frames/s".format(total_frames / elapsed))
+
+
+if __name__ == '__main__':
+    main()
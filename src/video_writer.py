@@ -0,0 +1,220 @@
+'''
+Annotated output video written by a separate encoder process.
+
+Encoding a video in the inference loop would stall it, so VideoWriterSink only
+copies the frame into a free slot of a shared memory frame ring and sends the
+slot number with the face results (as plain python types) through a queue. The
+encoder process draws the overlays on the slot, scales it to the output size,
+encodes it with cv2.VideoWriter and hands the slot back. The writer keeps
+the slots it knows to be free itself, so that a slot is never missed because
+the queue has not delivered it yet.
+
+Frames are written at most at the output frame rate; frames arriving faster
+are skipped. When all slots are still being encoded, the 'drop' policy drops
+the frame and the 'block' policy waits for a free slot. If the encoder process
+cannot open the output or dies, write() raises a RuntimeError instead of
+waiting for slots that never come back.
+
+Sample usage:
+    writer = VideoWriterSink('session.mp4', 'FHLG', size=(1280, 720), fps=10)
+    writer.write(result)
+    writer.close()
+'''
+import time
+import queue
+import types
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from overlay import draw_results
+from result_sink import result_to_dict
+
+POLICY_DROP = "drop"
+POLICY_BLOCK = "block"
+
+# Seconds between checks that the encoder is still running while waiting for a slot
+ENCODER_CHECK_INTERVAL = 0.5
+
+
+def overlay_result(faces):
+    '''
+    Rebuild the attributes draw_results() uses from result_to_dict() faces
+    '''
+    return types.SimpleNamespace(faces=[types.SimpleNamespace(**face) for face in faces])
+
+
+def encode(shm_name, shape, slots, path, fourcc, fps, size, visualize_flag, frame_queue, free_queue, error_queue):
+    '''
+    Encoder process: draw, scale and encode the frames of the slots sent on frame_queue,
+    put the error on error_queue and exit when the output cannot be opened
+    '''
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if not writer.isOpened():
+        error_queue.put("Cannot open {} for writing".format(path))
+        return
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=shm.buf)
+
+    resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+
+        slot, faces = item
+        frame = frames[slot]
+        draw_results(frame, overlay_result(faces), visualize_flag)
+        if (frame.shape[1], frame.shape[0]) != size:
+            frame = cv2.resize(frame, size, dst=resized)
+        writer.write(frame)
+        free_queue.put(slot)
+
+    writer.release()
+    del frames
+    shm.close()
+
+
+class VideoWriterSink:
+    '''
+    Sends frames and their results to an encoder process
+    '''
+
+    def __init__(self, path, visualize_flag="FHLG", size=None, fps=10, policy=POLICY_DROP, slots=4, fourcc="mp4v"):
+        '''
+        path: str, output video file
+        visualize_flag: str, any of 'F', 'H', 'L', 'G' selecting the overlays to draw
+        size: (width, height) of the output video, None keeps the frame size
+        fps: float, frame rate of the output video, faster results are skipped
+        policy: str, 'drop' or 'block' when the encoder falls behind
+        slots: int, number of frames in the shared memory ring
+        fourcc: str, codec of cv2.VideoWriter
+        '''
+        self.path = path
+        self.visualize_flag = visualize_flag
+        self.size = size
+        self.fps = fps
+        self.policy = policy
+        self.slots = slots
+        self.fourcc = fourcc
+
+        # Created with the first frame, whose shape sizes the ring
+        self.process = None
+        self.shm = None
+        self.frames = None
+        self.frame_queue = None
+        self.free_queue = None
+        self.error_queue = None
+        # Slots free for the next frames, all of them at the start
+        self.free_slots = deque()
+
+        self.next_frame_time = 0.0
+
+        # Statistics
+        self.written_frames = 0
+        self.skipped_frames = 0
+        self.dropped_frames = 0
+
+    def start(self, shape):
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * int(np.prod(shape)))
+        self.frames = np.ndarray((self.slots,) + shape, dtype=np.uint8, buffer=self.shm.buf)
+
+        if self.size is None:
+            self.size = (shape[1], shape[0])
+
+        context = multiprocessing.get_context("spawn")
+        self.frame_queue = context.Queue()
+        self.free_queue = context.Queue()
+        self.error_queue = context.Queue()
+        self.free_slots.extend(range(self.slots))
+
+        self.process = context.Process(target=encode, name="encoder", daemon=True,
+                                       args=(self.shm.name, shape, self.slots, self.path, self.fourcc, self.fps,
+                                             self.size, self.visualize_flag, self.frame_queue, self.free_queue,
+                                             self.error_queue))
+        self.process.start()
+
+    def write(self, result):
+        '''
+        Queue the frame of a FrameResult for encoding
+        '''
+        now = time.perf_counter()
+        if now < self.next_frame_time:
+            self.skipped_frames = self.skipped_frames + 1
+            return
+        # Keep the cadence of the output rate, start over after a pause
+        period = 1.0 / self.fps
+        if self.next_frame_time + period > now:
+            self.next_frame_time = self.next_frame_time + period
+        else:
+            self.next_frame_time = now + period
+
+        if self.process is None:
+            self.start(result.frame.shape)
+
+        slot = self.free_slot()
+        if slot is None:
+            self.dropped_frames = self.dropped_frames + 1
+            return
+
+        frame = self.frames[slot]
+        if result.frame.shape == frame.shape:
+            np.copyto(frame, result.frame)
+        else:
+            cv2.resize(result.frame, (frame.shape[1], frame.shape[0]), dst=frame)
+
+        self.frame_queue.put((slot, result_to_dict(result)["faces"]))
+        self.written_frames = self.written_frames + 1
+
+    def check_encoder(self):
+        '''
+        Raise a RuntimeError when the encoder process is no longer running
+        '''
+        if self.process.is_alive():
+            return
+        try:
+            error = self.error_queue.get(timeout=ENCODER_CHECK_INTERVAL)
+        except queue.Empty:
+            error = "Video encoder exited with code {}".format(self.process.exitcode)
+        raise RuntimeError(error)
+
+    def free_slot(self):
+        '''
+        Return a slot free for the next frame, None when the 'drop' policy drops it
+        '''
+        self.check_encoder()
+        # Take back the slots the encoder is done with
+        try:
+            while True:
+                self.free_slots.append(self.free_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if self.free_slots:
+            return self.free_slots.popleft()
+        if self.policy != POLICY_BLOCK:
+            return None
+
+        while True:
+            try:
+                return self.free_queue.get(timeout=ENCODER_CHECK_INTERVAL)
+            except queue.Empty:
+                self.check_encoder()
+
+    def close(self):
+        '''
+        Encode the queued frames and finish the video
+        '''
+        if self.process is None:
+            return
+
+        self.frame_queue.put(None)
+        self.process.join()
+        self.process = None
+
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in src/ and import each other by name, as when main.py runs
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+# The mock backend only looks at the IR file names
+MODEL_DIR = os.path.join(ROOT, "models", "intel")
+MODEL_FILES = ["face-detection-adas-binary-0001.xml", "head-pose-estimation-adas-0001.xml",
+               "landmarks-regression-retail-0009.xml", "gaze-estimation-adas-0002.xml"]
+
+FAST_LATENCY = "FACE=const:2;HEAD=const:0.5;LANDMARKS=const:0.5;GAZE=const:0.5"
+
+
+@pytest.fixture
+def mock_models():
+    '''
+    Return a function loading the four models on the mock backend
+    '''
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    from backend import set_backend
+    from mock_backend import MockBackend
+    from model import load_models
+    from face_detection import FaceDetectionModel
+    from head_pose import HeadPoseModel
+    from landmarks import LandmarksModel
+    from gaze_estimation import GazeEstimationModel
+
+    set_backend(MockBackend(latency=FAST_LATENCY, seed=1))
+
+    def load(num_requests=1):
+        classes = [FaceDetectionModel, HeadPoseModel, LandmarksModel, GazeEstimationModel]
+        models = [model_class(os.path.join(MODEL_DIR, model_file))
+                  for model_class, model_file in zip(classes, MODEL_FILES)]
+        load_models(models, num_requests)
+        return models
+
+    yield load
+    set_backend(None)
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from governor import LatencyGovernor, MAX_DISPLAY_INTERVAL
+
+
+def simulate(governor, feeder, processing_ms, frame_interval_ms, frames=3000):
+    '''
+    Feed the governor the ages of a pipeline taking processing_ms per frame on
+    an input delivering a frame every frame_interval_ms before the stride
+    '''
+    for _ in range(frames):
+        # Frames pile up in the capture ring while the input is faster than the pipeline
+        input_interval_ms = feeder.stride * frame_interval_ms
+        wait_ms = 2 * processing_ms if input_interval_ms < processing_ms else 0.0
+        governor.update(wait_ms + processing_ms, processing_ms)
+
+
+def test_stride_settles_where_frames_stop_waiting():
+    feeder = SimpleNamespace(stride=1)
+    governor = LatencyGovernor(60, feeder=feeder)
+
+    # 50 ms per frame on a 100 fps input: from stride 5 on the pipeline keeps up,
+    # the moving average may still overshoot by a step
+    simulate(governor, feeder, processing_ms=50, frame_interval_ms=10)
+    settled_stride = feeder.stride
+    degrade_steps = governor.degrade_steps
+    simulate(governor, feeder, processing_ms=50, frame_interval_ms=10)
+
+    assert 5 <= settled_stride <= 6
+    assert feeder.stride == settled_stride
+    assert governor.degrade_steps == degrade_steps
+    assert governor.display_interval == MAX_DISPLAY_INTERVAL
+
+
+def test_stride_does_not_grow_when_processing_exceeds_the_budget():
+    feeder = SimpleNamespace(stride=2)
+    tracker = SimpleNamespace(detection_interval=1)
+    governor = LatencyGovernor(60, feeder=feeder, tracker=tracker)
+
+    # Frames never wait, a bigger stride cannot bring 100 ms below 60 ms
+    simulate(governor, feeder, processing_ms=100, frame_interval_ms=100)
+
+    assert feeder.stride == 2
+    assert governor.display_interval == MAX_DISPLAY_INTERVAL
+    assert tracker.detection_interval > 1
+
+
+def test_recovers_when_the_load_goes_away():
+    feeder = SimpleNamespace(stride=1)
+    governor = LatencyGovernor(60, feeder=feeder)
+
+    simulate(governor, feeder, processing_ms=50, frame_interval_ms=10)
+    simulate(governor, feeder, processing_ms=10, frame_interval_ms=10)
+
+    assert feeder.stride == 1
+    assert governor.display_interval == 1
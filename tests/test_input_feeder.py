@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import input_feeder
+from input_feeder import InputFeeder
+
+
+class FailingCapture:
+    '''
+    Video capture whose reads fail after a few frames
+    '''
+
+    def __init__(self, path):
+        self.frames = 0
+
+    def get(self, prop):
+        return {input_feeder.cv2.CAP_PROP_FRAME_WIDTH: 64, input_feeder.cv2.CAP_PROP_FRAME_HEIGHT: 48}.get(prop, 0)
+
+    def grab(self):
+        return True
+
+    def read(self, image=None):
+        self.frames = self.frames + 1
+        if self.frames > 3:
+            raise IOError("decoder failed")
+        return True, np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+def test_capture_error_ends_the_input_and_is_raised(monkeypatch):
+    monkeypatch.setattr(input_feeder.cv2, "VideoCapture", FailingCapture)
+    feeder = InputFeeder(input_type='video', input_file='video.mp4', stride=1)
+    feeder.load_data()
+
+    # The frames captured before the error are still delivered
+    frames = []
+    with pytest.raises(IOError, match="decoder failed"):
+        for frame in feeder.next_batch():
+            frames.append(frame)
+    assert len(frames) == 3
+    feeder.close()
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from mock_backend import MockBackend, MockNetwork
+from pipeline import Pipeline, ASYNC_NUM_REQUESTS, STATUS_FACE, STATUS_END_OF_STREAM
+
+
+def test_requests_queue_on_the_device():
+    backend = MockBackend(latency="HEAD=const:20")
+    network = backend.load_network(MockNetwork("head-pose-estimation-adas-0001.xml"), "CPU", num_requests=3)
+
+    start_time = time.perf_counter()
+    for request in network.requests:
+        request.async_infer()
+    network.requests[0].wait()
+    first_done = time.perf_counter() - start_time
+    for request in network.requests[1:]:
+        request.wait()
+    all_done = time.perf_counter() - start_time
+
+    assert first_done < 0.035
+    # Three 20 ms inferences one after the other on a single stream device
+    assert all_done >= 0.058
+
+
+def test_device_streams_run_in_parallel():
+    backend = MockBackend(latency="HEAD=const:20", streams=3)
+    network = backend.load_network(MockNetwork("head-pose-estimation-adas-0001.xml"), "CPU", num_requests=3)
+
+    start_time = time.perf_counter()
+    for request in network.requests:
+        request.async_infer()
+    for request in network.requests:
+        request.wait()
+
+    assert time.perf_counter() - start_time < 0.035
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_pipeline_on_mock_backend(mock_models, async_mode):
+    models = mock_models(ASYNC_NUM_REQUESTS if async_mode else 1)
+    pipeline = Pipeline(*models, threshold=0.5, async_mode=async_mode)
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (360, 640, 3), dtype=np.uint8) for _ in range(12)]
+    results = list(pipeline.run(frames, end_of_stream=True))
+
+    assert [result.frame_id for result in results[:-1]] == list(range(len(frames)))
+    assert results[-1].status == STATUS_END_OF_STREAM
+    for frame, result in zip(frames, results):
+        assert result.frame is frame
+        assert result.status == STATUS_FACE
+        assert len(result.faces) == 1
+        face = result.faces[0]
+        assert len(face.head_pose) == 3
+        assert len(face.landmarks) == 10
+        assert np.asarray(face.gaze_vector).reshape(-1).shape == (3,)
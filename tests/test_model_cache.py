@@ -0,0 +1,55 @@
+import os
+import json
+import threading
+
+from model_cache import ModelCache, INDEX_FILE
+
+
+def test_concurrent_index_writers(tmp_path):
+    # Two caches on one directory stand for two processes sharing it
+    caches = [ModelCache(str(tmp_path)) for _ in range(2)]
+    errors = []
+
+    def write(cache, writer):
+        try:
+            for count in range(50):
+                cache.index["blobs"]["model|CPU"] = {"key": "{}-{}".format(writer, count), "blob": "x.blob"}
+                cache.save_index()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(cache, writer)) for writer, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(os.path.join(str(tmp_path), INDEX_FILE)) as index_file:
+        assert json.load(index_file)["blobs"]["model|CPU"]["key"].endswith("-49")
+    assert [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")] == []
+
+
+class FakeExecutableNetwork:
+    def export(self, path):
+        with open(path, "wb") as blob_file:
+            blob_file.write(b"blob")
+
+
+def test_caches_sharing_a_directory_keep_each_others_entries(tmp_path):
+    # Both caches read the index before either stored, like two worker processes
+    caches = [ModelCache(str(tmp_path / "cache")) for _ in range(2)]
+    models = []
+    for name in ["face", "gaze"]:
+        model_xml = tmp_path / "FP16" / (name + ".xml")
+        model_xml.parent.mkdir(exist_ok=True)
+        model_xml.write_text(name)
+        model_xml.with_suffix(".bin").write_bytes(name.encode())
+        models.append(str(model_xml))
+
+    for cache, model_xml in zip(caches, models):
+        cache.store(model_xml, "CPU", 1, FakeExecutableNetwork())
+
+    reader = ModelCache(str(tmp_path / "cache"))
+    for model_xml in models:
+        assert reader.lookup(model_xml, "CPU", 1) is not None
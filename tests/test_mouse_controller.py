@@ -0,0 +1,37 @@
+import time
+
+from mouse_controller import MouseActuator
+
+
+class RecordingController:
+    '''
+    Mouse controller adding up the steps instead of moving the pointer
+    '''
+
+    def __init__(self, precision=100, speed=0.2):
+        self.precision = precision
+        self.speed = speed
+        self.moved_x = 0
+        self.moved_y = 0
+
+    def step(self, dx, dy):
+        self.moved_x = self.moved_x + dx
+        self.moved_y = self.moved_y + dy
+
+
+def test_new_target_keeps_the_movement_left_over():
+    controller = RecordingController()
+    actuator = MouseActuator(controller, rate=100)
+    actuator.start()
+    try:
+        # The second target arrives halfway through the movement to the first
+        actuator.update(1.0, 0.5)
+        time.sleep(controller.speed / 2)
+        actuator.update(1.0, 0.5)
+        time.sleep(controller.speed * 2)
+    finally:
+        actuator.stop()
+
+    assert actuator.stats()["applied_updates"] == 2
+    assert abs(controller.moved_x - 200) <= 1
+    assert abs(controller.moved_y + 100) <= 1
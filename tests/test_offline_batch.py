@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from conftest import ROOT
+from input_feeder import InputFeeder
+from offline_batch import count_segment, locate_segments
+
+VIDEO = os.path.join(ROOT, "bin", "demo.mp4")
+
+
+def read_frames(feeder, first_frame_id=0):
+    feeder.load_data()
+    try:
+        return [(first_frame_id + frame_id, np.array(frame)) for frame_id, frame in enumerate(feeder.next_batch())]
+    finally:
+        feeder.close()
+
+
+def test_segments_process_the_frames_of_a_single_pass():
+    stride = 10
+    frame_count = int(cv2.VideoCapture(VIDEO).get(cv2.CAP_PROP_FRAME_COUNT))
+    single_pass = read_frames(InputFeeder(input_type='video', input_file=VIDEO, stride=stride))
+
+    # Seeks to frames 500 and 550 land a frame early in this video
+    segments = [(0, 500), (500, 550), (550, frame_count)]
+    counts = [count_segment(VIDEO, start_frame, end_frame, frame_count) for start_frame, end_frame in segments]
+    assert sum(counts) == frame_count
+
+    segmented = []
+    for seek_point, start_frame, end_frame in locate_segments(segments, counts, stride):
+        feeder = InputFeeder(input_type='video', input_file=VIDEO, stride=stride,
+                             start_frame=start_frame, end_frame=end_frame, seek_point=seek_point)
+        segmented.extend(read_frames(feeder, start_frame // stride))
+
+    assert [frame_id for frame_id, _ in segmented] == [frame_id for frame_id, _ in single_pass]
+    for (frame_id, frame), (_, expected) in zip(segmented, single_pass):
+        assert np.array_equal(frame, expected), "frame id {}".format(frame_id)
@@ -0,0 +1,51 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from pipeline import Pipeline, ASYNC_NUM_REQUESTS, ASYNC_FRAMES_RETAINED
+from change_detector import ChangeDetector
+
+
+def test_async_frames_complete_without_new_input(mock_models):
+    pipeline = Pipeline(*mock_models(ASYNC_NUM_REQUESTS), threshold=0.5, async_mode=True)
+    frames = [np.full((360, 640, 3), value, dtype=np.uint8) for value in (60, 120)]
+    events = []
+
+    def source():
+        yield 0, frames[0]
+        # No new input for a while, the first frame must still complete
+        for _ in range(ASYNC_NUM_REQUESTS):
+            yield None, None
+        events.append("second frame")
+        yield 0, frames[1]
+
+    for result in pipeline.run_streams(source()):
+        events.append(result.frame_id)
+
+    assert events == [0, "second frame", 1]
+
+
+@pytest.mark.parametrize("async_mode, retain", [(False, 1), (True, ASYNC_FRAMES_RETAINED)])
+def test_reused_faces_survive_frame_buffer_reuse(mock_models, async_mode, retain):
+    pipeline = Pipeline(*mock_models(ASYNC_NUM_REQUESTS if async_mode else 1), threshold=0.5,
+                        async_mode=async_mode, change_detector=ChangeDetector(threshold=255, max_stale=100))
+
+    # Ring of frame buffers like InputFeeder's: a buffer is overwritten retain + 1 frames later
+    ring = [np.empty((360, 640, 3), dtype=np.uint8) for _ in range(retain + 1)]
+    reuse_distance = 3 * len(ring)
+
+    def capture():
+        for index in range(reuse_distance + 1):
+            frame = ring[index % len(ring)]
+            frame[...] = 50 if index == 0 else 200
+            yield frame
+
+    results = list(pipeline.run(capture()))
+
+    assert [result.reused for result in results] == [False] + [True] * reuse_distance
+    for result in results:
+        face = result.faces[0]
+        assert (face.cropped_face == 50).all()
+        assert (face.cropped_left_eye.warp() == 50).all()
+        assert (face.cropped_right_eye.warp() == 50).all()
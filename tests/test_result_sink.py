@@ -0,0 +1,40 @@
+import types
+
+import pytest
+
+pytest.importorskip("cv2")
+
+from pipeline import STATUS_FACE, STATUS_NO_FACE
+from result_sink import (open_result_sink, STATUSES, BINARY_MAGIC, BINARY_VERSION,
+                         FILE_HEADER, FRAME_HEADER, FACE_RECORD)
+from offline_batch import merge_parts
+
+
+def frame_result(frame_id, status, faces):
+    return types.SimpleNamespace(frame_id=frame_id, status=status, faces=faces,
+                                 inference_times={"FACE": 12.0, "HEAD": 1.5})
+
+
+def test_binary_records_carry_the_status(tmp_path):
+    face = types.SimpleNamespace(face_coords=[1, 2, 3, 4], head_pose=[0.1, 0.2, 0.3],
+                                 landmarks=list(range(10)), gaze_vector=[0.0, 0.1, -0.9])
+    parts = [str(tmp_path / "results.part{}.bin".format(index)) for index in range(2)]
+    for frame_id, (part_path, status) in enumerate(zip(parts, [STATUS_FACE, STATUS_NO_FACE])):
+        sink = open_result_sink(part_path)
+        sink.write(frame_result(frame_id, status, [face] if status == STATUS_FACE else []), 20.0)
+        sink.close()
+
+    # Merged parts keep one file header
+    output_path = str(tmp_path / "results.bin")
+    merge_parts(parts, output_path)
+    with open(output_path, "rb") as output_file:
+        data = output_file.read()
+
+    assert FILE_HEADER.unpack_from(data, 0) == (BINARY_MAGIC, BINARY_VERSION)
+    offset = FILE_HEADER.size
+    frame_id, face_count, status = FRAME_HEADER.unpack_from(data, offset)[:3]
+    assert (frame_id, face_count, STATUSES[status]) == (0, 1, STATUS_FACE)
+    offset = offset + FRAME_HEADER.size + FACE_RECORD.size
+    frame_id, face_count, status = FRAME_HEADER.unpack_from(data, offset)[:3]
+    assert (frame_id, face_count, STATUSES[status]) == (1, 0, STATUS_NO_FACE)
+    assert offset + FRAME_HEADER.size == len(data)
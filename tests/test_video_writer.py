@@ -0,0 +1,22 @@
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from video_writer import VideoWriterSink, POLICY_BLOCK
+
+
+def test_block_policy_raises_when_encoder_cannot_open(tmp_path):
+    # The encoder exits at once, so the block policy must not wait for slots forever
+    writer = VideoWriterSink(str(tmp_path / "missing" / "out.mp4"), fps=1000, policy=POLICY_BLOCK, slots=2)
+    result = types.SimpleNamespace(frame_id=0, status=0, inference_times={}, faces=[],
+                                   frame=np.zeros((48, 64, 3), dtype=np.uint8))
+    try:
+        with pytest.raises(RuntimeError, match="Cannot open"):
+            for _ in range(writer.slots + 1):
+                writer.next_frame_time = 0.0
+                writer.write(result)
+    finally:
+        writer.close()